@@ -0,0 +1,173 @@
+import logging
+import threading
+from collections import deque
+
+from caching import LRUCache
+from metrics import OUTBOX_EVENTS, COALESCED_CALLS
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Flow control for Socket.IO broadcasts. RoomOutbox paces what is emitted to
+# each room; Coalescer folds bursts of the same request (mark_read) into one
+# piece of work. Both take `spawn(fn, *args)` and `sleep(seconds)` from the
+# SocketIO server, so they run as greenlets under eventlet and threads
+# otherwise.
+
+
+class RoomOutbox:
+    # Broadcasts to rooms, each paced by a token bucket of `rate` emits per
+    # second up to `burst`. Within the limit an event goes out at once; over
+    # it, events wait in a queue of at most `maxlen` per room that one
+    # background task drains as tokens come back. While a room has a queue
+    # everything for it is queued, so order is kept. An event listed in
+    # `merge` ({event: fn(queued, new) -> payload, or None to keep both})
+    # is folded into the newest copy already waiting. Once an event finds
+    # the queue full, it and every later event for the room are dropped
+    # until what was queued before has gone out; then the room gets
+    # `overflow_event`, so the gap is always at the end of what clients
+    # received and they can refetch from the last message they have.
+    # rate=0 emits everything at once.
+
+    def __init__(self, emit, spawn, sleep, rate=50, burst=100, maxlen=200,
+                 merge=None, overflow_event='resync', maxrooms=10000):
+        self.emit = emit  # emit(event, payload, room)
+        self.spawn = spawn
+        self.sleep = sleep
+        self.rate = rate
+        self.burst = burst
+        self.maxlen = maxlen
+        self.merge = merge or {}
+        self.overflow_event = overflow_event
+        self.buckets = LRUCache(maxsize=maxrooms)
+        self.queues = {}   # room -> deque of [event, payload]
+        self.dropped = {}  # room -> events dropped since the queue overflowed
+        self.lock = threading.Lock()
+
+    def send(self, event, payload, room):
+        if self.rate > 0:
+            with self.lock:
+                queue = self.queues.get(room)
+                if queue is None:
+                    wait = self._bucket(room).take()
+                    if wait:
+                        queue = self.queues[room] = deque()
+                        self.spawn(self._drain, room, wait)
+                if queue is not None:
+                    OUTBOX_EVENTS.inc(event, self._enqueue(queue, room, event, payload))
+                    return
+        OUTBOX_EVENTS.inc(event, 'sent')
+        self.emit(event, payload, room)
+
+    def queued(self):
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def _bucket(self, room):
+        bucket = self.buckets.get(room)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self.buckets.set(room, bucket)
+        return bucket
+
+    def _enqueue(self, queue, room, event, payload):
+        merge = self.merge.get(event)
+        if merge is not None:
+            for entry in reversed(queue):
+                if entry[0] == event:
+                    merged = merge(entry[1], payload)
+                    if merged is not None:
+                        entry[1] = merged
+                        return 'merged'
+                    break
+        if room in self.dropped or len(queue) >= self.maxlen:
+            self.dropped[room] = self.dropped.get(room, 0) + 1
+            return 'dropped'
+        queue.append([event, payload])
+        return 'queued'
+
+    def _drain(self, room, wait):
+        while True:
+            self.sleep(wait)
+            batch = []
+            with self.lock:
+                queue = self.queues[room]
+                bucket = self._bucket(room)
+                while queue:
+                    wait = bucket.take()
+                    if wait:
+                        break
+                    batch.append(queue.popleft())
+            for event, payload in batch:
+                self._emit(event, payload, room)
+            with self.lock:
+                # Removed only once emitted, so a new send cannot overtake the
+                # batch; after an overflow the notice goes out through the
+                # queue too, and later events queue behind it again
+                queue = self.queues[room]
+                if not queue:
+                    dropped = self.dropped.pop(room, 0)
+                    if not dropped:
+                        del self.queues[room]
+                        return
+                    queue.append([self.overflow_event, {'room': room, 'dropped': dropped}])
+
+    def _emit(self, event, payload, room):
+        try:
+            self.emit(event, payload, room)
+            OUTBOX_EVENTS.inc(event, 'sent')
+        except Exception:
+            logger.exception("Broadcast of %s to %s failed", event, room)
+
+
+class Coalescer:
+    # Runs the first call for a key at once and opens a `window` (seconds)
+    # in which further calls for that key are only noted; if any came in,
+    # the latest runs once when the window closes. A burst of any size
+    # costs at most two runs per window. window=0 runs every call. The
+    # deferred run happens inside `context()` when given (an app context).
+
+    def __init__(self, spawn, sleep, window, name, context=None):
+        self.spawn = spawn
+        self.sleep = sleep
+        self.window = window
+        self.name = name
+        self.context = context
+        self.pending = {}  # key -> None, or (fn, args) of the call to run at the end
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        # True if `fn` ran now, False if it was folded into the pending run
+        if self.window > 0:
+            with self.lock:
+                if key in self.pending:
+                    self.pending[key] = (fn, args)
+                    COALESCED_CALLS.inc(self.name)
+                    return False
+                self.pending[key] = None
+            self.spawn(self._close, key)
+        fn(*args)
+        return True
+
+    def _close(self, key):
+        self.sleep(self.window)
+        with self.lock:
+            trailing = self.pending.pop(key, None)
+        if trailing is None:
+            return
+        fn, args = trailing
+        try:
+            if self.context is None:
+                fn(*args)
+            else:
+                with self.context():
+                    fn(*args)
+        except Exception:
+            logger.exception("Coalesced %s failed", self.name)
+
+
+def merge_read_receipts(queued, new):
+    # Two messages_read payloads for one room as one, if from the same reader
+    if queued['user_id'] != new['user_id']:
+        return None
+    return dict(new, read_up_to=max(queued['read_up_to'], new['read_up_to']))
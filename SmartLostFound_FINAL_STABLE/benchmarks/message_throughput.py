@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Chat messages per second through the real 'message' socket handler, with
+# one commit per message (the default) and with MESSAGE_WRITE_BEHIND group
+# commits. Each mode creates its own app against a scratch database; the
+# write-behind figure includes the final flush, so both count messages that
+# are on disk.
+#
+#   python benchmarks/message_throughput.py --messages 2000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app  # noqa: E402
+from chat import flush_messages  # noqa: E402
+from models import Message  # noqa: E402
+
+
+def load_app(write_behind):
+    workdir = tempfile.mkdtemp(prefix='message-throughput-')
+    os.chdir(workdir)
+    return create_app({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'MESSAGE_WRITE_BEHIND': write_behind,
+        'AUTO_MIGRATE': True,
+        # One client sends everything; measure the server, not the limits
+        'SOCKET_MESSAGE_RATE': 0,
+        'ROOM_EMIT_RATE': 0,
+    })
+
+
+def connect(app):
+    http = app.test_client()
+    for email, name in (('seller@example.com', 'Seller'), ('buyer@example.com', 'Buyer')):
+        http.post('/api/register', json={"email": email, "password": "password123", "username": name})
+    http.post('/api/login', json={"email": 'seller@example.com', "password": "password123"})
+    item_id = http.post('/api/items', data={
+        "title": "Umbrella", "description": "Black", "location": "Gym", "contact": "1"
+    }).get_json()["item"]["id"]
+
+    http.post('/api/login', json={"email": 'buyer@example.com', "password": "password123"})
+    client = app.extensions['socketio'].test_client(app, flask_test_client=http)
+    buyer_id = http.get('/api/user/me').get_json()["user"]["id"]
+    room = f"item-{item_id}-{buyer_id}"
+    client.emit('join', {"room": room, "username": "Buyer"})
+    client.get_received()
+    return client, room, buyer_id
+
+
+def run(write_behind, messages):
+    name = 'bench_write_behind' if write_behind else 'bench_direct'
+    app = load_app(write_behind)
+    client, room, buyer_id = connect(app)
+
+    start = time.perf_counter()
+    for n in range(messages):
+        client.emit('message', {"room": room, "user": "Buyer", "sender_id": buyer_id,
+                                "text": f"message {n}", "timestamp": "10:00"})
+        client.get_received()
+    with app.app_context():
+        flush_messages()
+        elapsed = time.perf_counter() - start
+        stored = Message.query.filter_by(room=room).count()
+    if stored != messages:
+        raise AssertionError(f"{name}: expected {messages} stored messages, found {stored}")
+    client.disconnect()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    direct = run(False, args.messages)
+    buffered = run(True, args.messages)
+    print(f"      direct: {direct:>9.1f} messages/s")
+    print(f"write-behind: {buffered:>9.1f} messages/s ({buffered / direct:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
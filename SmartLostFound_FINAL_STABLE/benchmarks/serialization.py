@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression import available_encodings, compress  # noqa: E402
+from serialization import FastJSONProvider, SocketJSON, orjson  # noqa: E402
+
+# Encode time and bytes on the wire for the two big payloads: an item
+# listing page (/api/items) and a chat history page (socket 'history').
+# Compares Flask's standard encoder with serialization.py's, then the size
+# of the encoded body under each Content-Encoding compression.py offers.
+#
+#   python benchmarks/serialization.py --items 50 --repeat 2000
+
+WORDS = ('black leather wallet with two cards and a bus pass, lost near the north entrance '
+         'of the library on the second floor').split()
+
+
+def item_page(count):
+    start = datetime(2026, 1, 1)
+    return {
+        'items': [{
+            'id': n,
+            'title': ' '.join(WORDS[n % 7:n % 7 + 3]),
+            'description': ' '.join(WORDS[n % 5:]),
+            'location': 'Library, 2nd floor',
+            'contact': '555-0100',
+            'type': 'lost' if n % 2 else 'found',
+            'image': f'static/uploads/ab/cd/{n:064x}.jpg',
+            'image_width': 1280,
+            'image_height': 960,
+            'image_hash': f'{n * 2654435761 % 2 ** 64:016x}',
+            'thumbnails': {size: f'static/uploads/ab/cd/{n:064x}_{size}.webp' for size in ('sm', 'md')},
+            'user_id': n % 97,
+            'user_name': f'user{n % 97}',
+            'user_joined': '2025',
+            'date': (start + timedelta(hours=n)).isoformat(),
+        } for n in range(count)],
+        'next_cursor': 'eyJpZCI6IDEyMzR9',
+    }
+
+
+def history_page(count):
+    return {
+        'room': 'item-42-7',
+        'messages': [{'id': n, 'sender_id': 7 if n % 2 else 3, 'user': 'user7' if n % 2 else 'user3',
+                      'text': ' '.join(WORDS[n % 9:n % 9 + 8]), 'timestamp': '10:%02d' % (n % 60),
+                      'status': 'read'} for n in range(count)],
+        'has_more': True,
+        'reset': True,
+    }
+
+
+def per_call_us(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def report(name, payload, encoders, repeat):
+    print(f"{name}")
+    body = None
+    for label, encode in encoders:
+        print(f"  {label:>18}: {per_call_us(lambda: encode(payload), repeat):>9.1f} us")
+        body = body or encode(payload)
+    body = body if isinstance(body, bytes) else body.encode()
+    print(f"  {'identity':>18}: {len(body):>9} bytes")
+    for encoding in available_encodings():
+        size = len(compress(body, encoding))
+        elapsed = per_call_us(lambda: compress(body, encoding), max(repeat // 10, 1))
+        print(f"  {encoding:>18}: {size:>9} bytes ({len(body) / size:.1f}x, {elapsed:.1f} us)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed: the fast encoders fall back to the standard library\n")
+    app = Flask(__name__)
+    standard = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    with app.app_context():
+        report(f"/api/items page ({args.items} items)", item_page(args.items), [
+            ('flask json', standard.dumps),
+            ('fast json', fast.dumps_bytes if orjson is not None else fast.dumps),
+        ], args.repeat)
+        report(f"socket history ({args.messages} messages)", history_page(args.messages), [
+            ('stdlib json', lambda obj: json.dumps(obj, separators=(',', ':'))),
+            ('socket json', SocketJSON.dumps),
+        ], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
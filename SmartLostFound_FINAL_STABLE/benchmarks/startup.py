@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold start of a worker: a fresh interpreter importing app.py and calling
+# create_app(), as a newly spawned or recycled worker does. Each run is a
+# separate process so nothing is warm but the OS file cache. Fails (exit 1)
+# when the median total exceeds --budget, so it can gate changes that add
+# import-time work.
+#
+#   python benchmarks/startup.py --runs 10 --budget 1.5
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({'DATABASE_URL': sys.argv[1]})
+created = time.perf_counter()
+with app.test_client() as client:
+    client.get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'modules': len(sys.modules),
+    'numpy_loaded': 'numpy' in sys.modules,
+}))
+'''
+
+
+def run_once(database_url):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, database_url],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=1.5, help='seconds, median process time')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup-')
+    database_url = 'sqlite:///' + os.path.join(workdir, 'startup.db')
+    runs = [run_once(database_url) for _ in range(args.runs)]
+
+    for phase in ('import', 'create_app', 'first_request', 'process'):
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{phase:>14}: median {statistics.median(values):>8.1f}ms  max {max(values):>8.1f}ms")
+    print(f"{'modules':>14}: {runs[-1]['modules']} (numpy loaded: {runs[-1]['numpy_loaded']})")
+
+    median = statistics.median(run['process'] for run in runs)
+    if median > args.budget:
+        print(f"\nOver budget: median start {median:.3f}s > {args.budget:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
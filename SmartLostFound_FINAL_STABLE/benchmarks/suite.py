@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+# End-to-end latency of the main read and chat paths, offline: creates the
+# app against a scratch database, seeds synthetic users, items and conversations,
+# then drives the Flask and Socket.IO test clients in process. Reports
+# throughput and p50/p99 per scenario and can write them as JSON for
+# comparing runs.
+#
+#   python benchmarks/suite.py --users 500 --items 20000 --output results.json
+#
+# Rendered item responses are cached by the app; they are dropped before each
+# timed request so the numbers reflect the database path (--warm-cache keeps them).
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app  # noqa: E402
+from chat import flush_messages  # noqa: E402
+from extensions import db  # noqa: E402
+from models import User, Item, Message, Conversation  # noqa: E402
+
+PASSWORD = 'password123'
+WORDS = ('black', 'blue', 'red', 'leather', 'wallet', 'phone', 'keys', 'umbrella', 'laptop',
+         'charger', 'bottle', 'jacket', 'backpack', 'card', 'glasses', 'watch', 'earbuds',
+         'notebook', 'calculator', 'scarf', 'silver', 'small', 'large', 'cracked', 'new')
+LOCATIONS = ('Library', 'Gym', 'Cafeteria', 'Main Hall', 'Parking Lot B', 'Lab 3',
+             'Bus Stop', 'Auditorium', 'Dorm A', 'Sports Field')
+SCENARIOS = ('items_list', 'items_search', 'item_detail', 'chats',
+             'socket_join', 'socket_message', 'socket_mark_read')
+
+
+# One client plays many here, so per-connection limits, room pacing and
+# mark_read coalescing are off: every event is measured doing its full work
+UNTHROTTLED = {'SOCKET_MESSAGE_RATE': 0, 'SOCKET_EVENT_RATE': 0, 'ROOM_EMIT_RATE': 0, 'MARK_READ_WINDOW': 0}
+
+
+def load_app(workdir):
+    # Indexes are not warmed: seed() fills the tables afterwards, behind
+    # their back. Nor are the GC and retention loops started.
+    os.chdir(workdir)
+    return create_app(dict(UNTHROTTLED, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'),
+                           AUTO_MIGRATE=True, WARM_INDEXES=False, BACKGROUND_TASKS=False))
+
+
+def seed(app, rng, users, items, conversations, messages):
+    # Bulk inserts straight into the tables. Every index is still unbuilt
+    # (see load_app), so each one is built from these rows when first used,
+    # as after a restart
+    from werkzeug.security import generate_password_hash
+    start = datetime.utcnow() - timedelta(days=90)
+    password = generate_password_hash(PASSWORD)
+
+    with app.app_context():
+        db.session.execute(insert(User), [
+            {'id': n, 'username': f'user{n}', 'email': f'user{n}@example.com', 'password': password,
+             'created_at': start}
+            for n in range(1, users + 1)
+        ])
+        db.session.execute(insert(Item), [
+            {'id': n, 'title': ' '.join(rng.sample(WORDS, 2)), 'description': ' '.join(rng.sample(WORDS, 8)),
+             'location': rng.choice(LOCATIONS), 'contact': '555-0100', 'type': rng.choice(('lost', 'found')),
+             'image': '', 'user_id': rng.randint(1, users),
+             'created_at': start + timedelta(minutes=n * 90 * 24 * 60 // max(items, 1))}
+            for n in range(1, items + 1)
+        ])
+
+        # user1 takes part in every conversation, as buyer or seller, so the
+        # chat list scenario has something to list
+        item_owners = dict(db.session.execute(select(Item.id, Item.user_id)).all())
+        rooms = {}
+        while len(rooms) < conversations:
+            item_id = rng.randint(1, items)
+            seller_id = item_owners[item_id]
+            buyer_id = 1 if seller_id != 1 else rng.randint(2, users)
+            rooms[f'item-{item_id}-{buyer_id}'] = (item_id, buyer_id, seller_id)
+
+        rows = []
+        last = {}
+        room_names = list(rooms)
+        for n in range(1, messages + 1):
+            room = room_names[n % len(room_names)]
+            _, buyer_id, seller_id = rooms[room]
+            rows.append({'id': n, 'room': room, 'sender_id': rng.choice((buyer_id, seller_id)), 'user': 'x',
+                         'text': ' '.join(rng.sample(WORDS, 6)), 'timestamp': '10:00', 'status': 'read'})
+            last[room] = n
+        if rows:
+            db.session.execute(insert(Message), rows)
+        db.session.execute(insert(Conversation), [
+            {'room': room, 'item_id': item_id, 'buyer_id': buyer_id, 'seller_id': seller_id,
+             'last_message_id': last.get(room), 'last_activity': start + timedelta(seconds=n)}
+            for n, (room, (item_id, buyer_id, seller_id)) in enumerate(rooms.items())
+        ])
+        db.session.commit()
+    return room_names, rooms
+
+
+def login(app, user_id):
+    http = app.test_client()
+    response = http.post('/api/login', json={'email': f'user{user_id}@example.com', 'password': PASSWORD})
+    if response.status_code != 200:
+        raise AssertionError(f'login failed for user{user_id}: {response.status_code}')
+    return http
+
+
+def timed(requests, warmup, call, before=None):
+    # Per-request latencies (seconds) for `requests` calls after `warmup` untimed ones
+    latencies = []
+    for n in range(warmup + requests):
+        if before:
+            before(n)
+        start = time.perf_counter()
+        call(n)
+        elapsed = time.perf_counter() - start
+        if n >= warmup:
+            latencies.append(elapsed)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000
+
+    total = sum(ordered)
+    return {
+        'requests': len(ordered),
+        'throughput_per_s': round(len(ordered) / total, 1) if total else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(50), 3),
+        'p99_ms': round(percentile(99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def check(response, status=200):
+    if response.status_code != status:
+        raise AssertionError(f'{response.request.path}: expected {status}, got {response.status_code}')
+
+
+def run_scenarios(app, rng, args, room_names, rooms):
+    http = login(app, 1)
+    item_response_cache = app.extensions['lostfound'].item_response_cache
+    before = None if args.warm_cache else (lambda n: item_response_cache.clear())
+    item_ids = [rng.randint(1, args.items) for _ in range(args.requests + args.warmup)]
+    queries = [rng.choice(WORDS) for _ in range(args.requests + args.warmup)]
+    results = {}
+    # A search over an index that missed the seeded rows would time empty matches
+    if not any(http.get(f'/api/items?q={word}&limit=1').get_json()['items'] for word in WORDS):
+        raise AssertionError('search finds none of the seeded items')
+
+    def item_list(n):
+        check(http.get(f'/api/items?limit=20&type={("lost", "found", "all")[n % 3]}'))
+
+    results['items_list'] = timed(args.requests, args.warmup, item_list, before)
+    results['items_search'] = timed(args.requests, args.warmup,
+                                    lambda n: check(http.get(f'/api/items?q={queries[n]}&limit=20')), before)
+    results['item_detail'] = timed(args.requests, args.warmup,
+                                   lambda n: check(http.get(f'/api/items/{item_ids[n]}')), before)
+    results['chats'] = timed(args.requests, args.warmup, lambda n: check(http.get('/api/chats')))
+
+    # Chat: user1 and the other participant of one conversation, each with a socket
+    room = room_names[0]
+    _, buyer_id, seller_id = rooms[room]
+    other_id = seller_id if buyer_id == 1 else buyer_id
+    socketio = app.extensions['socketio']
+    mine = socketio.test_client(app, flask_test_client=http)
+    other = socketio.test_client(app, flask_test_client=login(app, other_id))
+
+    def join(n):
+        mine.emit('join', {'room': room_names[n % len(room_names)], 'username': 'user1'})
+        mine.get_received()
+
+    results['socket_join'] = timed(args.requests, args.warmup, join)
+
+    mine.emit('join', {'room': room, 'username': 'user1'})
+    other.emit('join', {'room': room, 'username': f'user{other_id}'})
+    mine.get_received()
+    other.get_received()
+
+    def send(n):
+        mine.emit('message', {'room': room, 'user': 'user1', 'sender_id': 1,
+                              'text': f'message {n}', 'timestamp': '10:00'})
+        mine.get_received()
+
+    results['socket_message'] = timed(args.requests, args.warmup, send)
+    other.get_received()
+
+    def receive(n):
+        # One new message from user1 for the other side to read (untimed)
+        send(n)
+        other.get_received()
+
+    def mark_read(n):
+        other.emit('mark_read', {'room': room})
+        other.get_received()
+
+    results['socket_mark_read'] = timed(args.requests, args.warmup, mark_read, receive)
+    mine.disconnect()
+    other.disconnect()
+    with app.app_context():
+        flush_messages()
+    return {name: summarize(results[name]) for name in SCENARIOS}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=500, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--warm-cache', action='store_true', help='keep cached item responses between requests')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    if args.users < 2 or args.items < 1 or args.conversations < 1:
+        parser.error('need at least 2 users, 1 item and 1 conversation')
+
+    output = os.path.abspath(args.output) if args.output else None
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    app = load_app(workdir)
+    started = time.perf_counter()
+    room_names, rooms = seed(app, rng, args.users, args.items, args.conversations, args.messages)
+    seeded = time.perf_counter() - started
+    scenarios = run_scenarios(app, rng, args, room_names, rooms)
+
+    for name, result in scenarios.items():
+        print(f"{name:>18}: {result['throughput_per_s']:>9.1f}/s  p50 {result['p50_ms']:>8.3f}ms"
+              f"  p99 {result['p99_ms']:>8.3f}ms")
+
+    if output:
+        report = {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sqlite': sqlite3.sqlite_version,
+            },
+            'seed_seconds': round(seeded, 3),
+            'scenarios': scenarios,
+        }
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
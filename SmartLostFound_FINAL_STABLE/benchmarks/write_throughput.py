@@ -0,0 +1,125 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import (Column, Integer, MetaData, String, Table, Text, create_engine,
+                        insert, select, update)
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import apply_sqlite_pragmas, engine_options  # noqa: E402
+
+# Concurrent chat-shaped writes against a scratch SQLite file, once with
+# SQLite's defaults (rollback journal) and once with storage.py's settings.
+# Writers do what handle_message does per message (insert the message, bump
+# the conversation row, commit); readers page history like join does.
+#
+#   python benchmarks/write_throughput.py --writers 8 --readers 4 --seconds 5
+
+metadata = MetaData()
+message = Table(
+    'message', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('room', String(100), nullable=False, index=True),
+    Column('sender_id', Integer, nullable=False),
+    Column('text', Text, nullable=False),
+    Column('status', String(20), nullable=False),
+)
+conversation = Table(
+    'conversation', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('room', String(100), unique=True, nullable=False),
+    Column('last_message_id', Integer),
+    Column('unread', Integer, nullable=False, default=0),
+)
+
+ROOMS = 50
+
+
+def make_engine(path, tuned):
+    uri = 'sqlite:///' + path
+    if not tuned:
+        return create_engine(uri, connect_args={'check_same_thread': False})
+    engine = create_engine(uri, **engine_options(uri))
+    apply_sqlite_pragmas(engine)
+    return engine
+
+
+def writer(engine, worker_id, stop, stats):
+    n = 0
+    while not stop.is_set():
+        room = f"item-{n % ROOMS}-{worker_id}"
+        try:
+            with engine.begin() as conn:
+                message_id = conn.execute(insert(message).values(
+                    room=room, sender_id=worker_id, text='x' * 80, status='sent'
+                )).inserted_primary_key[0]
+                conn.execute(update(conversation).where(conversation.c.room == room).values(
+                    last_message_id=message_id, unread=conversation.c.unread + 1
+                ))
+            stats['writes'] += 1
+        except OperationalError:
+            stats['errors'] += 1
+        n += 1
+
+
+def reader(engine, stop, stats):
+    n = 0
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(select(message).where(message.c.room == f"item-{n % ROOMS}-0")
+                             .order_by(message.c.id.desc()).limit(50)).all()
+            stats['reads'] += 1
+        except OperationalError:
+            stats['errors'] += 1
+        n += 1
+
+
+def run(tuned, writers, readers, seconds):
+    workdir = tempfile.mkdtemp(prefix='write-throughput-')
+    engine = make_engine(os.path.join(workdir, 'bench.db'), tuned)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(conversation), [
+            {'room': f"item-{r}-{w}", 'unread': 0} for r in range(ROOMS) for w in range(writers)
+        ])
+
+    stop = threading.Event()
+    stats = {'writes': 0, 'reads': 0, 'errors': 0}
+    threads = [threading.Thread(target=writer, args=(engine, w, stop, stats)) for w in range(writers)]
+    threads += [threading.Thread(target=reader, args=(engine, stop, stats)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {
+        'config': 'tuned' if tuned else 'default',
+        'writes_per_sec': round(stats['writes'] / seconds, 1),
+        'reads_per_sec': round(stats['reads'] / seconds, 1),
+        'locked_errors': stats['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    for tuned in (False, True):
+        result = run(tuned, args.writers, args.readers, args.seconds)
+        print(f"{result['config']:>8}: {result['writes_per_sec']:>9} writes/s  "
+              f"{result['reads_per_sec']:>9} reads/s  {result['locked_errors']} 'database is locked' errors")
+
+
+if __name__ == '__main__':
+    main()
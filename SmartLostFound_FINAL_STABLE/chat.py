@@ -0,0 +1,242 @@
+from datetime import datetime
+
+from sqlalchemy import update, insert, select, case, and_, or_
+from sqlalchemy.exc import IntegrityError, DataError, DBAPIError, StatementError
+
+from extensions import db, service
+from models import Message, Conversation, IdSequence, Item
+
+# Chat storage shared by the socket handlers and the chat list: room
+# participants, conversation rows, read receipts, history pages and the
+# write-behind message path.
+
+def parse_room(room):
+    # Expected format: item-{item_id}-{buyer_id}
+    parts = (room or '').split('-')
+    if len(parts) != 3 or parts[0] != 'item':
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+# room -> (buyer_id, seller_id), an LRUCache (see services.py). Participants
+# never change for a room, so entries only need dropping when item ids can
+# be reused (on item delete).
+room_participants_cache = service('room_participants_cache')
+
+def room_participants(room):
+    participants = room_participants_cache.get(room)
+    if participants:
+        return participants
+
+    row = db.session.query(Conversation.buyer_id, Conversation.seller_id).filter_by(room=room).first()
+    if row:
+        participants = (row.buyer_id, row.seller_id)
+    else:
+        # First message of a new room: the seller is the item owner
+        parsed = parse_room(room)
+        if not parsed:
+            return None
+        item_id, buyer_id = parsed
+        seller_id = db.session.query(Item.user_id).filter_by(id=item_id).scalar()
+        if seller_id is None:
+            return None
+        participants = (buyer_id, seller_id)
+
+    room_participants_cache.set(room, participants)
+    return participants
+
+def record_conversation_message(room, participants, last_message_id, buyer_unread=0, seller_unread=0):
+    # Bump the conversation in place; only the first message inserts the row.
+    # The unread counts are how many new messages each side has to read.
+    buyer_id, seller_id = participants
+    values = {
+        'last_message_id': last_message_id,
+        'last_activity': datetime.utcnow(),
+    }
+    if buyer_unread:
+        values['buyer_unread'] = Conversation.buyer_unread + buyer_unread
+    if seller_unread:
+        values['seller_unread'] = Conversation.seller_unread + seller_unread
+    updated = db.session.execute(
+        update(Conversation).where(Conversation.room == room).values(**values),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if updated:
+        return
+    item_id, _ = parse_room(room)
+    try:
+        with db.session.begin_nested():
+            db.session.add(Conversation(
+                room=room,
+                item_id=item_id,
+                buyer_id=buyer_id,
+                seller_id=seller_id,
+                last_message_id=last_message_id,
+                last_activity=values['last_activity'],
+                buyer_unread=buyer_unread,
+                seller_unread=seller_unread
+            ))
+    except IntegrityError:
+        # Another worker created the row first; apply our update to it
+        db.session.execute(
+            update(Conversation).where(Conversation.room == room).values(**values),
+            execution_options={"synchronize_session": False}
+        )
+
+def mark_room_read(room, user_id):
+    # Moves user_id's read watermark in `room` up to the newest message and
+    # returns it, or None if there was nothing unread. Messages are never
+    # updated: one at or below its recipient's watermark is read (see
+    # message_status), so this is one conversation UPDATE however many were
+    # unread, and it cannot lose a message counted in concurrently.
+    newest = db.func.coalesce(Conversation.last_message_id, 0)
+    is_buyer = Conversation.buyer_id == user_id
+    is_seller = Conversation.seller_id == user_id
+    where = (
+        Conversation.room == room,
+        or_(and_(is_buyer, Conversation.buyer_unread > 0), and_(is_seller, Conversation.seller_unread > 0))
+    )
+    stmt = update(Conversation).where(*where).values(
+        buyer_unread=case((is_buyer, 0), else_=Conversation.buyer_unread),
+        buyer_read_id=case((is_buyer, newest), else_=Conversation.buyer_read_id),
+        seller_unread=case((is_seller, 0), else_=Conversation.seller_unread),
+        seller_read_id=case((is_seller, newest), else_=Conversation.seller_read_id),
+    )
+    if db.engine.dialect.update_returning:
+        read_up_to = db.session.execute(
+            stmt.returning(newest), execution_options={"synchronize_session": False}
+        ).scalar()
+    else:
+        read_up_to = None
+        if db.session.execute(stmt, execution_options={"synchronize_session": False}).rowcount:
+            read_up_to = db.session.execute(select(newest).where(Conversation.room == room)).scalar()
+    db.session.commit()
+    return read_up_to
+
+def message_status(message, conversation):
+    # 'read' once the recipient's watermark has reached the message, else
+    # the status it was stored with ('sent' or 'delivered'; 'read' for rows
+    # marked one by one before watermarks)
+    if conversation is not None:
+        read_id = (conversation.buyer_read_id if message.sender_id == conversation.seller_id
+                   else conversation.seller_read_id)
+        if message.id <= read_id:
+            return 'read'
+    return message.status
+
+def unread_counts(participants, recipient_id, count=1):
+    # (buyer_unread, seller_unread) increments for messages sent to recipient_id
+    buyer_id, _ = participants
+    return (count, 0) if recipient_id == buyer_id else (0, count)
+
+def read_receipt(room, user_id, read_up_to):
+    # Everything up to `read_up_to` that user_id did not send is now read
+    return {'room': room, 'user_id': user_id, 'read_up_to': read_up_to}
+
+
+# Messages sent per history page (on join and on scroll-back)
+HISTORY_PAGE_SIZE = 50
+
+def history_page(room, before_id=None, after_id=None, limit=None):
+    # Newest `limit` messages in the window, returned oldest first, plus
+    # whether older messages remain beyond it. Walks ix_message_room_id backwards.
+    limit = limit or HISTORY_PAGE_SIZE
+    query = Message.query.filter(Message.room == room)
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    if after_id is not None:
+        query = query.filter(Message.id > after_id)
+    messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    conversation = db.session.query(
+        Conversation.seller_id, Conversation.buyer_read_id, Conversation.seller_read_id
+    ).filter_by(room=room).first() if messages else None
+    page = []
+    for message in reversed(messages[:limit]):
+        data = message.to_dict()
+        data['status'] = message_status(message, conversation)
+        page.append(data)
+    return page, has_more
+
+MAX_MESSAGE_LENGTH = 5000
+
+def message_error(data):
+    # Why a client's `message` payload cannot be stored, or None if it can
+    if not isinstance(data, dict):
+        return "Invalid message"
+    if not parse_room(data.get('room')):
+        return "Invalid room"
+    sender_id = data.get('sender_id')
+    if not isinstance(sender_id, int) or isinstance(sender_id, bool):
+        return "Invalid sender"
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return "Message text is required"
+    if len(text) > MAX_MESSAGE_LENGTH:
+        return f"Messages are limited to {MAX_MESSAGE_LENGTH} characters"
+    if not isinstance(data.get('user'), str) or not isinstance(data.get('timestamp'), str):
+        return "Invalid user or timestamp"
+    return None
+
+def parse_message_id(value):
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+# ---------------- WRITE-BEHIND MESSAGES ----------------
+
+def reserve_message_ids(app, count):
+    # Claims `count` message ids for this process and returns the first. Also
+    # skips past ids used by rows inserted without the allocator.
+    with app.app_context():
+        after_max = select(db.func.coalesce(db.func.max(Message.id), 0) + 1).scalar_subquery()
+        claim = update(IdSequence).where(IdSequence.name == 'message').values(
+            next_value=case((IdSequence.next_value > after_max, IdSequence.next_value), else_=after_max) + count
+        )
+        if not db.session.execute(claim).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(IdSequence).values(name='message', next_value=after_max + count))
+            except IntegrityError:
+                # Another process created the row first
+                db.session.execute(claim)
+        next_value = db.session.execute(
+            select(IdSequence.next_value).where(IdSequence.name == 'message')
+        ).scalar()
+        db.session.commit()
+        return next_value - count
+
+def permanent_write_error(exc):
+    # Errors a retry cannot fix: constraint violations, and values the
+    # driver rejects before sending (a StatementError not from the database)
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    return isinstance(exc, (StatementError, TypeError, ValueError)) and not isinstance(exc, DBAPIError)
+
+def write_message_batch(app, entries):
+    # One transaction per batch: every message plus one conversation update per room
+    with app.app_context():
+        db.session.execute(insert(Message), [row for row, _, _ in entries])
+        rooms_seen = {}
+        for row, participants, recipient_id in entries:
+            if not participants:
+                continue
+            buyer_unread, seller_unread = unread_counts(participants, recipient_id)
+            room = rooms_seen.setdefault(row['room'], [participants, 0, 0, 0])
+            room[1] = max(room[1], row['id'])
+            room[2] += buyer_unread
+            room[3] += seller_unread
+        for room, (participants, last_id, buyer_unread, seller_unread) in rooms_seen.items():
+            record_conversation_message(room, participants, last_id, buyer_unread, seller_unread)
+        db.session.commit()
+
+
+# WriteBehindBuffer, or None when messages are committed one by one
+message_writer = service('message_writer')
+
+def flush_messages():
+    # Reads that must see every message sent so far (history, receipts, chat list)
+    if message_writer:
+        message_writer.flush()
@@ -0,0 +1,66 @@
+import gzip
+
+from caching import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Content-Encoding negotiation for large JSON responses. Item lists and
+# search pages compress 5-10x; small bodies are left alone since the
+# headers would cost more than they save.
+
+COMPRESSIBLE_TYPES = ('application/json',)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# (etag, encoding) -> compressed body, so cached responses compress once
+compressed_bodies = LRUCache(maxsize=256)
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding):
+    # Best supported encoding the client accepts (werkzeug MIMEAccept-like
+    # `request.accept_encodings`), or None
+    for encoding in available_encodings():
+        if accept_encoding[encoding]:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encoding, min_size=1024):
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encoding)
+    body = response.get_data()
+    if encoding is None or len(body) < min_size:
+        return response
+
+    etag, weak = response.get_etag()
+    key = (etag, encoding) if etag else None
+    compressed = compressed_bodies.get(key) if key else None
+    if compressed is None:
+        compressed = compress(body, encoding)
+        if key:
+            compressed_bodies.set(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag and not weak:
+        # Still the same resource for If-None-Match (weak comparison), but
+        # no longer byte-identical to the uncompressed representation
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,104 @@
+import os
+
+from storage import POOL_SIZE, MAX_OVERFLOW
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+
+def env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def load_config(overrides=None):
+    # App settings from the environment; create_app(config) applies
+    # `overrides` on top, so tests and tools need not touch os.environ.
+    config = {
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'finalsecretkey'),
+        # Root logger level
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        # SQLite or Postgres, else database.db; WAL and pool settings in storage.py
+        'DATABASE_URL': os.environ.get('DATABASE_URL'),
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', POOL_SIZE)),
+        'DB_MAX_OVERFLOW': int(os.environ.get('DB_MAX_OVERFLOW', MAX_OVERFLOW)),
+        'UPLOAD_FOLDER': os.environ.get('UPLOAD_FOLDER', 'static/uploads'),
+        # Unreferenced uploads are deleted by the garbage collector once they have
+        # been unreferenced for UPLOAD_GC_GRACE seconds; it runs every UPLOAD_GC_INTERVAL.
+        'UPLOAD_GC_INTERVAL': int(os.environ.get('UPLOAD_GC_INTERVAL', 600)),
+        'UPLOAD_GC_GRACE': int(os.environ.get('UPLOAD_GC_GRACE', 3600)),
+        # Run the upload GC and retention loops in every app create_app builds.
+        # With several workers set BACKGROUND_TASKS=0 on all but one, or on all
+        # of them and run `flask gc-uploads` and `flask retention` from cron.
+        'BACKGROUND_TASKS': os.environ.get('BACKGROUND_TASKS', '1').lower() in ('1', 'true', 'yes'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SESSION_COOKIE_SAMESITE': 'Lax',
+        'SESSION_COOKIE_SECURE': False,  # Set to True if using HTTPS
+        # Lifetime in seconds of cached item API responses. Writes in this process
+        # clear the cache; the TTL bounds staleness from writes on other workers.
+        'ITEM_CACHE_TTL': int(os.environ.get('ITEM_CACHE_TTL', 30)),
+        # Chat messages are committed one by one unless MESSAGE_WRITE_BEHIND is set:
+        # then they are numbered from reserved id blocks, broadcast at once and
+        # written in group commits every MESSAGE_FLUSH_INTERVAL seconds (or as soon
+        # as MESSAGE_FLUSH_BATCH are waiting). Ids come from per-process blocks and
+        # are only in send order within one process, which history resume relies
+        # on, so this is for single-worker deployments.
+        'MESSAGE_WRITE_BEHIND': env_flag('MESSAGE_WRITE_BEHIND'),
+        'MESSAGE_FLUSH_INTERVAL': float(os.environ.get('MESSAGE_FLUSH_INTERVAL', 0.01)),
+        'MESSAGE_FLUSH_BATCH': int(os.environ.get('MESSAGE_FLUSH_BATCH', 500)),
+        # Fraction of requests written to the request log; slower ones are always logged
+        'LOG_SAMPLE_RATE': float(os.environ.get('LOG_SAMPLE_RATE', 0.01)),
+        'SLOW_REQUEST_SECONDS': float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0)),
+        # Smallest JSON response worth compressing
+        'COMPRESS_MIN_SIZE': int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+        # Password hashing: any werkzeug method string, e.g. "scrypt:65536:8:1" or
+        # "pbkdf2:sha256:600000". Existing hashes are upgraded on the next login.
+        'PASSWORD_HASH_METHOD': os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        'PASSWORD_HASH_WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+        # Authentication attempts per minute (and burst) per client address and per account
+        'AUTH_RATE_PER_MINUTE': float(os.environ.get('AUTH_RATE_PER_MINUTE', 10)),
+        'AUTH_RATE_BURST': int(os.environ.get('AUTH_RATE_BURST', 5)),
+        # Reverse proxies in front of the app whose X-Forwarded-For entries are
+        # trusted for the client address (werkzeug ProxyFix); 0 uses the peer
+        # address. Set it to the real count: a higher one lets clients spoof it.
+        'PROXY_FIX_X_FOR': int(os.environ.get('PROXY_FIX_X_FOR', 0)),
+        # Where presence refcounts live: unset/"memory" (this process), "local" or a redis:// URL
+        'PRESENCE_URL': os.environ.get('PRESENCE_URL'),
+        # Multi-worker mode: a broker URL (redis://..., or local:// for several
+        # servers in one process) so room emits reach clients on any worker
+        'SOCKETIO_MESSAGE_QUEUE': os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+        # Socket.IO flow control (see backpressure.py). Per connection, chat
+        # messages and other events per second (and burst); 0 turns a limit off.
+        'SOCKET_MESSAGE_RATE': float(os.environ.get('SOCKET_MESSAGE_RATE', 5)),
+        'SOCKET_MESSAGE_BURST': int(os.environ.get('SOCKET_MESSAGE_BURST', 20)),
+        'SOCKET_EVENT_RATE': float(os.environ.get('SOCKET_EVENT_RATE', 20)),
+        'SOCKET_EVENT_BURST': int(os.environ.get('SOCKET_EVENT_BURST', 50)),
+        # Per room, broadcasts per second (and burst) before further ones queue,
+        # and how many may wait; 0 emits everything at once
+        'ROOM_EMIT_RATE': float(os.environ.get('ROOM_EMIT_RATE', 50)),
+        'ROOM_EMIT_BURST': int(os.environ.get('ROOM_EMIT_BURST', 100)),
+        'ROOM_QUEUE_SIZE': int(os.environ.get('ROOM_QUEUE_SIZE', 200)),
+        # Seconds in which repeated mark_read events for one room and user
+        # share a single update and receipt; 0 handles each one
+        'MARK_READ_WINDOW': float(os.environ.get('MARK_READ_WINDOW', 0.5)),
+        # Retention (see retention.py): resolved/claimed items are archived
+        # CLOSED_ITEM_RETENTION_DAYS after closing, conversations idle for
+        # CONVERSATION_RETENTION_DAYS with all their messages; 0 keeps them.
+        # A pass runs every RETENTION_INTERVAL seconds, RETENTION_BATCH rows per
+        # transaction, then returns up to VACUUM_PAGES free pages to the OS (SQLite).
+        'CLOSED_ITEM_RETENTION_DAYS': int(os.environ.get('CLOSED_ITEM_RETENTION_DAYS', 30)),
+        'CONVERSATION_RETENTION_DAYS': int(os.environ.get('CONVERSATION_RETENTION_DAYS', 365)),
+        'RETENTION_INTERVAL': int(os.environ.get('RETENTION_INTERVAL', 3600)),
+        'RETENTION_BATCH': int(os.environ.get('RETENTION_BATCH', 500)),
+        'VACUUM_PAGES': int(os.environ.get('VACUUM_PAGES', 2000)),
+        # Place names -> coordinates for items posted without them (see geo.Gazetteer)
+        'GAZETTEER_PATH': os.environ.get('GAZETTEER_PATH', os.path.join(BASEDIR, 'gazetteer.csv')),
+        # Largest radius accepted by /api/items?near=...&radius=<km>
+        'NEAR_MAX_RADIUS_KM': float(os.environ.get('NEAR_MAX_RADIUS_KM', 50)),
+        # Set up the search and geo indexes in create_app rather than in the
+        # first request that uses them (skipped while migrations are pending)
+        'WARM_INDEXES': os.environ.get('WARM_INDEXES', '1').lower() in ('1', 'true', 'yes'),
+        # Run pending schema migrations in create_app (single-process setups
+        # and tools; deployments run `flask migrate` once instead)
+        'AUTO_MIGRATE': env_flag('AUTO_MIGRATE'),
+    }
+    config.update(overrides or {})
+    return config
@@ -0,0 +1,244 @@
+from functools import wraps
+
+from flask import request, session
+from flask_socketio import emit, join_room, leave_room, rooms
+
+from chat import (room_participants, record_conversation_message, mark_room_read, unread_counts,
+                  read_receipt, history_page, parse_message_id, message_error, flush_messages,
+                  message_writer, HISTORY_PAGE_SIZE)
+from extensions import db, service, socketio
+from metrics import registry, Gauge, SOCKET_RATE_LIMITED, timed_event
+from models import Message
+
+# Socket.IO event handlers. They are collected here and attached to each
+# app's SocketIO server by register_events, so this module does not need
+# a server to exist at import time.
+
+EVENTS = []
+
+def on(event):
+    def decorator(handler):
+        EVENTS.append((event, handler))
+        return handler
+    return decorator
+
+def register_events(server):
+    for event, handler in EVENTS:
+        server.on_event(event, handler)
+
+presence = service('presence')
+message_ids = service('message_ids')
+message_order_lock = service('message_order_lock')
+message_limiter = service('message_limiter')
+event_limiter = service('event_limiter')
+room_outbox = service('room_outbox')
+read_coalescer = service('read_coalescer')
+
+def throttled(event, limiter):
+    # Drops the event when this connection is over `limiter` (a RateLimiter,
+    # or None for no limit) and tells the client when to try again
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            if limiter:
+                wait = limiter.hit(request.sid)
+                if wait:
+                    SOCKET_RATE_LIMITED.inc(event)
+                    emit('rate_limited', {"event": event, "retry_after": wait})
+                    return None
+            return handler(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@on('connect')
+@timed_event('connect')
+def on_connect():
+    if "user_id" in session:
+        presence.connect(session["user_id"])
+
+@on('disconnect')
+@timed_event('disconnect')
+def on_disconnect():
+    if "user_id" in session:
+        presence.disconnect(session["user_id"])
+    for limiter in (message_limiter, event_limiter):
+        if limiter:
+            limiter.forget(request.sid)
+
+# ---------------- LIVE ITEM FEED ----------------
+# Clients subscribe to feed rooms named feed:<type>:<location>, with '*' for
+# "any", and get item_created / item_deleted deltas instead of refetching
+# the list. Location filters match the whole (normalized) location; the
+# REST listing's substring filter is still there for anything looser.
+# feed:user:<id> carries one user's own items, for the dashboard.
+
+def feed_key(value):
+    return ' '.join((value or '').lower().split()) or '*'
+
+def feed_room(item_type=None, location=None):
+    item_type = item_type if item_type in ('lost', 'found') else '*'
+    return f"feed:{item_type}:{feed_key(location)}"
+
+def feed_rooms(item_type, location, user_id):
+    # Every room an item belongs to; emitting to the list reaches each
+    # subscriber once even if it is in several of them
+    rooms_for_item = {f"feed:{t}:{l}" for t in ('*', item_type) for l in ('*', feed_key(location))}
+    return sorted(rooms_for_item) + [f"feed:user:{user_id}"]
+
+def publish_item_event(event, payload, item_type, location, user_id):
+    socketio.emit(event, payload, to=feed_rooms(item_type, location, user_id))
+
+@on('subscribe_items')
+@timed_event('subscribe_items')
+@throttled('subscribe_items', event_limiter)
+def on_subscribe_items(data):
+    # {type, location} filters, or {mine: true} for the caller's own items
+    data = data or {}
+    if data.get('mine'):
+        if "user_id" not in session:
+            return
+        room = f"feed:user:{session['user_id']}"
+    else:
+        room = feed_room(data.get('type'), data.get('location'))
+    join_room(room)
+    # Acknowledged with the channel name, which unsubscribe_items takes
+    return {"channel": room}
+
+@on('unsubscribe_items')
+@timed_event('unsubscribe_items')
+def on_unsubscribe_items(data):
+    channel = (data or {}).get('channel')
+    if channel and channel.startswith('feed:') and channel in rooms():
+        leave_room(channel)
+
+@on('join')
+@timed_event('join')
+@throttled('join', event_limiter)
+def on_join(data):
+    username = data.get('username')
+    room = data.get('room')
+    user_id = session.get("user_id") # Get current user ID from session
+    
+    join_room(room)
+    flush_messages()
+    
+    # Mark unread messages in this room as read (if they were sent by the OTHER user)
+    if user_id:
+        read_up_to = mark_room_read(room, user_id)
+        if read_up_to is not None:
+            # Notify the sender that messages were read
+            room_outbox.send('messages_read', read_receipt(room, user_id, read_up_to), room)
+
+    # Send the latest page of history. A reconnecting client passes the last
+    # id it has seen and only receives what it missed; if it missed more than
+    # a page, it gets the latest page and resets its list.
+    since_id = parse_message_id(data.get('since_id'))
+    messages, has_more = history_page(room, after_id=since_id)
+    emit('history', {
+        "room": room,
+        "messages": messages,
+        "has_more": has_more,
+        "reset": since_id is None or has_more
+    })
+
+@on('history_before')
+@timed_event('history_before')
+@throttled('history_before', event_limiter)
+def on_history_before(data):
+    # Scroll-back: the page of messages just before the oldest one the client has
+    room = data.get('room')
+    if room not in rooms():
+        return
+    flush_messages()
+    before_id = parse_message_id(data.get('before_id'))
+    limit = min(parse_message_id(data.get('limit')) or HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+    messages, has_more = history_page(room, before_id=before_id, limit=max(limit, 1))
+    emit('history_page', {"room": room, "messages": messages, "has_more": has_more})
+
+@on('message')
+@timed_event('message')
+@throttled('message', message_limiter)
+def handle_message(data):
+    # Rejected before it is numbered or broadcast: a row the database would
+    # refuse must never reach the write-behind buffer
+    error = message_error(data)
+    if error:
+        emit('message_error', {"error": error, "room": data.get('room') if isinstance(data, dict) else None})
+        return
+    room = data.get('room')
+    user = data.get('user')
+    sender_id = data.get('sender_id')
+    text = data.get('text')
+    timestamp = data.get('timestamp')
+    
+    # Determine initial status: 'delivered' if the recipient has any open
+    # connection, otherwise 'sent'. Clients acknowledge 'read' via mark_read.
+    # Participants come from the room cache, so steady-state sends need no
+    # item or conversation lookup.
+    initial_status = 'sent'
+    
+    participants = room_participants(room)
+    recipient_id = None
+    if participants:
+        buyer_id, seller_id = participants
+        recipient_id = seller_id if sender_id == buyer_id else buyer_id
+        if presence.is_online(recipient_id):
+            initial_status = 'delivered'
+
+    row = dict(room=room, sender_id=sender_id, user=user, text=text, timestamp=timestamp, status=initial_status)
+    if message_writer:
+        # Numbered now, written with the next group commit
+        with message_order_lock:
+            row['id'] = message_ids.next()
+            message_writer.add((row, participants, recipient_id))
+    else:
+        msg = Message(**row)
+        db.session.add(msg)
+        db.session.flush()
+        row['id'] = msg.id
+
+        if participants:
+            record_conversation_message(room, participants, msg.id, *unread_counts(participants, recipient_id))
+
+        db.session.commit()
+    
+    # Broadcast message with ID and status
+    data['id'] = row['id']
+    data['status'] = row['status']
+    room_outbox.send('message', data, room)
+
+@on('mark_read')
+@timed_event('mark_read')
+@throttled('mark_read', event_limiter)
+def handle_mark_read(data):
+    # Client sends this when they see messages. Repeats for the same room
+    # within MARK_READ_WINDOW are answered by one update and one receipt.
+    room = data.get('room')
+    user_id = session.get('user_id')
+    
+    if user_id:
+        read_coalescer.submit((room, user_id), send_read_receipts, room, user_id)
+
+def send_read_receipts(room, user_id):
+    flush_messages()
+    # Mark all messages in room sent by OTHERS as read
+    read_up_to = mark_room_read(room, user_id)
+    if read_up_to is not None:
+        room_outbox.send('messages_read', read_receipt(room, user_id, read_up_to), room)
+
+# ---------------- METRICS ----------------
+
+def socket_gauges():
+    # This worker's connected clients and named rooms (sid rooms excluded)
+    namespace_rooms = socketio.server.manager.rooms.get('/', {})
+    sids = namespace_rooms.get(None, {})
+    named = [room for room in namespace_rooms if room is not None and room not in sids]
+    feeds = sum(1 for room in named if room.startswith('feed:'))
+    return {(): len(sids)}, {('chat',): len(named) - feeds, ('feed',): feeds}
+
+registry.register(Gauge('socketio_connections', 'Connected Socket.IO clients',
+                        callback=lambda: socket_gauges()[0]))
+registry.register(Gauge('socketio_rooms', 'Socket.IO rooms with members', ('kind',),
+                        callback=lambda: socket_gauges()[1]))
+registry.register(Gauge('socketio_outbox_queued', 'Room broadcasts waiting to be sent',
+                        callback=lambda: {(): room_outbox.queued()}))
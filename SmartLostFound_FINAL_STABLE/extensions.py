@@ -0,0 +1,18 @@
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
+
+# Objects shared by every module. Nothing here is tied to an app: `db` is
+# bound by create_app, and the proxies resolve to the state of whichever
+# app is handling the current request, socket event or background task
+# (see services.Services), so several apps can live in one process.
+
+db = SQLAlchemy()
+
+# The app's SocketIO server, for emitting outside a socket handler
+socketio = LocalProxy(lambda: current_app.extensions['socketio'])
+
+
+def service(name):
+    # Proxy to one attribute of the current app's Services
+    return LocalProxy(lambda: getattr(current_app.extensions['lostfound'], name))
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import StoredFile
+from uploads import trash_files, restore_files, purge_files, remove_stale_temp_files
+
+# Upload bookkeeping in the database (the files themselves: uploads.py).
+# An upload is staged (hashed into a temp file), its reference is committed
+# together with the row that uses it, and only then is the file placed. The
+# garbage collector trashes a file before deleting its row and restores it if
+# a new reference arrived, so a file is never removed while referenced.
+
+# Dialects with INSERT ... ON CONFLICT, which takes a reference in one statement
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def add_upload_reference(staged):
+    _, path, digest, size = staged
+    values = {'refcount': StoredFile.refcount + 1, 'updated_at': datetime.utcnow()}
+    upsert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if upsert is not None:
+        db.session.execute(upsert(StoredFile).values(
+            path=path, hash=digest, size=size, refcount=1, updated_at=values['updated_at']
+        ).on_conflict_do_update(index_elements=[StoredFile.path], set_=values))
+        return path
+    # Elsewhere: bump an existing row, else insert one, and bump after all
+    # if a concurrent upload inserted it first
+    updated = db.session.execute(
+        update(StoredFile).where(StoredFile.path == path).values(**values),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if updated:
+        return path
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(path=path, hash=digest, size=size, refcount=1,
+                                      updated_at=values['updated_at']))
+    except IntegrityError:
+        db.session.execute(
+            update(StoredFile).where(StoredFile.path == path).values(**values),
+            execution_options={"synchronize_session": False}
+        )
+    return path
+
+def release_upload(path):
+    # Drop one reference; the file itself is left to the garbage collector
+    if path:
+        db.session.execute(
+            update(StoredFile).where(StoredFile.path == path).values(
+                refcount=StoredFile.refcount - 1, updated_at=datetime.utcnow()
+            ),
+            execution_options={"synchronize_session": False}
+        )
+
+def collect_upload_garbage(grace_seconds=None, batch_size=500):
+    grace = current_app.config['UPLOAD_GC_GRACE'] if grace_seconds is None else grace_seconds
+    folder = current_app.config['UPLOAD_FOLDER']
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    candidates = db.session.query(StoredFile.path).filter(
+        StoredFile.refcount <= 0,
+        StoredFile.updated_at < cutoff
+    ).limit(batch_size).all()
+
+    removed = 0
+    for (path,) in candidates:
+        moved = trash_files(folder, path)
+        deleted = db.session.execute(
+            delete(StoredFile).where(StoredFile.path == path, StoredFile.refcount <= 0)
+        ).rowcount
+        db.session.commit()
+        if deleted:
+            purge_files(moved)
+            removed += 1
+        else:
+            restore_files(moved)
+
+    remove_stale_temp_files(folder, grace)
+    return removed
+
+def upload_gc_loop(app, socketio):
+    # Background task: socketio.start_background_task(upload_gc_loop, app, socketio)
+    while True:
+        socketio.sleep(app.config['UPLOAD_GC_INTERVAL'])
+        with app.app_context():
+            try:
+                removed = collect_upload_garbage()
+                if removed:
+                    app.logger.info(f"Upload GC removed {removed} files")
+            except Exception:
+                app.logger.exception("Upload garbage collection failed")
@@ -0,0 +1,288 @@
+import csv
+import math
+import os
+import re
+import threading
+
+from sqlalchemy import text
+
+from querycount import uncounted
+from search import tokenize
+
+# Proximity search over item coordinates. On SQLite an R*Tree virtual table
+# answers the bounding-box part of a radius query; elsewhere the item's
+# geohash column is range-scanned for the cells around the point. Either way
+# the candidates are then filtered and sorted by great-circle distance.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9   # ~5m cells, stored on every located item
+_DECODE = {c: i for i, c in enumerate(GEOHASH_ALPHABET)}
+
+
+def valid_coordinates(lat, lon):
+    return lat is not None and lon is not None and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    # (min_lat, max_lat, min_lon, max_lon) enclosing the circle. Clamped at
+    # the poles and the antimeridian rather than wrapped: items are on campus.
+    dlat = radius_km / KM_PER_DEGREE
+    coslat = max(math.cos(math.radians(min(abs(lat) + dlat, 90.0))), 1e-9)
+    dlon = min(radius_km / (KM_PER_DEGREE * coslat), 180.0)
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate longitude, latitude, starting with longitude
+        span, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (span[0] + span[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            span[0] = middle
+        else:
+            value *= 2
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_degrees(precision):
+    # (height, width) of one cell in degrees
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cover(lat, lon, radius_km):
+    # Geohash prefixes whose cells together contain the circle: the cell
+    # holding the point and its eight neighbours, at the finest precision
+    # whose cells are still at least `radius_km` across
+    min_lat, max_lat, _, _ = bounding_box(lat, lon, radius_km)
+    coslat = max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 1e-9)
+    precision = 1
+    while precision < GEOHASH_PRECISION:
+        height, width = geohash_cell_degrees(precision + 1)
+        if height * KM_PER_DEGREE < radius_km or width * KM_PER_DEGREE * coslat < radius_km:
+            break
+        precision += 1
+    height, width = geohash_cell_degrees(precision)
+    cells = set()
+    for dlat in (-height, 0.0, height):
+        for dlon in (-width, 0.0, width):
+            cell_lat = min(max(lat + dlat, -90.0), 90.0)
+            cell_lon = (lon + dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+class RtreeBackend:
+    # SQLite R*Tree keyed by item id. Coordinates are stored as 32-bit
+    # floats rounded outward, so the box lookup never misses an item.
+
+    def __init__(self, db):
+        self.db = db
+
+    def setup(self):
+        self.db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS item_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+        ))
+        indexed = self.db.session.execute(text("SELECT count(*) FROM item_geo")).scalar()
+        located = self.db.session.execute(text("SELECT count(*) FROM item WHERE latitude IS NOT NULL")).scalar()
+        if indexed != located:
+            self.db.session.execute(text("DELETE FROM item_geo"))
+            self.db.session.execute(text(
+                "INSERT INTO item_geo SELECT id, latitude, latitude, longitude, longitude "
+                "FROM item WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            ))
+        self.db.session.commit()
+
+    def add(self, item):
+        if item.latitude is None or item.longitude is None:
+            return
+        self.db.session.execute(text(
+            "INSERT OR REPLACE INTO item_geo VALUES (:id, :lat, :lat, :lon, :lon)"
+        ), {'id': item.id, 'lat': item.latitude, 'lon': item.longitude})
+
+    def remove(self, item):
+        self.db.session.execute(text("DELETE FROM item_geo WHERE id = :id"), {'id': item.id})
+
+    def candidates(self, lat, lon, radius_km, type=None):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        params = {'min_lat': min_lat, 'max_lat': max_lat, 'min_lon': min_lon, 'max_lon': max_lon}
+        filters = ''
+        if type:
+            filters = " AND item.type = :type"
+            params['type'] = type
+        return self.db.session.execute(text(
+            "SELECT item.id, item.latitude, item.longitude FROM item_geo JOIN item ON item.id = item_geo.id "
+            "WHERE item_geo.min_lat <= :max_lat AND item_geo.max_lat >= :min_lat "
+            f"AND item_geo.min_lon <= :max_lon AND item_geo.max_lon >= :min_lon{filters}"
+        ), params).all()
+
+
+class GeohashBackend:
+    # Range scans of the indexed item.geohash column, one per covering cell.
+    # The column is written with the row, so add/remove have nothing to do.
+
+    def __init__(self, db):
+        self.db = db
+
+    def setup(self):
+        pass
+
+    def add(self, item):
+        pass
+
+    def remove(self, item):
+        pass
+
+    def candidates(self, lat, lon, radius_km, type=None):
+        params = {}
+        ranges = []
+        for n, prefix in enumerate(geohash_cover(lat, lon, radius_km)):
+            # Every hash starting with `prefix` sorts in [prefix, prefix + '{')
+            ranges.append(f"(geohash >= :low{n} AND geohash < :high{n})")
+            params[f'low{n}'] = prefix
+            params[f'high{n}'] = prefix + '{'
+        filters = ''
+        if type:
+            filters = " AND type = :type"
+            params['type'] = type
+        return self.db.session.execute(text(
+            f"SELECT id, latitude, longitude FROM item WHERE ({' OR '.join(ranges)}){filters}"
+        ), params).all()
+
+
+class GeoIndex:
+    # Picks the R*Tree on SQLite builds that have it, geohash ranges
+    # elsewhere. Chosen on first use because the engine needs an app context.
+
+    def __init__(self, db):
+        self.db = db
+        self.backend = None
+        self.lock = threading.Lock()
+
+    def _get_backend(self):
+        if self.backend is None:
+            with self.lock:
+                if self.backend is None:
+                    with uncounted():
+                        backend = self._create_backend()
+                        backend.setup()
+                    self.backend = backend
+        return self.backend
+
+    def warm(self):
+        # Choose and set up the backend now instead of in the first request
+        self._get_backend()
+
+    def _create_backend(self):
+        if self.db.engine.dialect.name == 'sqlite' and rtree_available(self.db):
+            return RtreeBackend(self.db)
+        return GeohashBackend(self.db)
+
+    def add(self, item):
+        self._get_backend().add(item)
+
+    def remove(self, item):
+        self._get_backend().remove(item)
+
+    def near(self, lat, lon, radius_km, type=None):
+        # [(distance_km, item_id)] within radius_km, nearest first
+        found = []
+        for item_id, item_lat, item_lon in self._get_backend().candidates(lat, lon, radius_km, type=type):
+            distance = haversine_km(lat, lon, item_lat, item_lon)
+            if distance <= radius_km:
+                found.append((distance, item_id))
+        found.sort()
+        return found
+
+
+def rtree_available(db):
+    try:
+        options = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+    except Exception:
+        return False
+    return 'ENABLE_RTREE' in options
+
+
+class Gazetteer:
+    # Known place names -> coordinates, from a local CSV with columns
+    # name, latitude, longitude[, aliases separated by "|"]. Lets items
+    # without coordinates be placed from their free-form location.
+
+    def __init__(self, path):
+        self.path = path
+        self.places = None
+        self.contained = None
+        self.lock = threading.Lock()
+
+    def lookup(self, location):
+        # (lat, lon) for the location: an exact name or alias, else the
+        # longest name or multi-word alias appearing in it as whole words
+        # ("near the Library entrance" -> Library). One-word aliases only
+        # match on their own: "Ground floor of Lab 3" is not the Sports
+        # Field. None when nothing matches.
+        places, contained = self._load()
+        key = normalize_place(location)
+        if not key:
+            return None
+        if key in places:
+            return places[key]
+        padded = f' {key} '
+        best = None
+        for name, coordinates in contained.items():
+            if f' {name} ' in padded and (best is None or len(name) > len(best[0])):
+                best = (name, coordinates)
+        return best[1] if best else None
+
+    def _load(self):
+        if self.places is None:
+            with self.lock:
+                if self.places is None:
+                    self.places, self.contained = read_gazetteer(self.path)
+        return self.places, self.contained
+
+
+def normalize_place(value):
+    return ' '.join(tokenize(value))
+
+
+def read_gazetteer(path):
+    # ({name or alias: (lat, lon)}, the same for the names and aliases that
+    # may match inside a longer location), all normalized
+    places, contained = {}, {}
+    if not path or not os.path.exists(path):
+        return places, contained
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                coordinates = (float(row['latitude']), float(row['longitude']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not valid_coordinates(*coordinates):
+                continue
+            name = normalize_place(row.get('name'))
+            aliases = [normalize_place(alias) for alias in re.split(r'\s*\|\s*', row.get('aliases') or '')]
+            for key in filter(None, [name] + aliases):
+                places.setdefault(key, coordinates)
+                if key == name or ' ' in key:
+                    contained.setdefault(key, coordinates)
+    return places, contained
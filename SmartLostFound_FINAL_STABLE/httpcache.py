@@ -0,0 +1,55 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, request
+
+# Content-addressed uploads never change, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Legacy uploads are named by the client and could in principle be replaced
+LEGACY_UPLOAD_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def add_etag(response):
+    # Strong ETag over the exact body bytes
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    return response
+
+
+def cached_view(cache):
+    # Caches successful GET responses in `cache` (an LRUCache) keyed by path
+    # and query string, tags them with an ETag and answers If-None-Match with
+    # 304. Writers must clear the cache when the underlying data changes.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            cached = cache.get(key)
+            if cached is not None:
+                body, etag = cached
+                response = current_app.response_class(body, mimetype='application/json')
+                response.set_etag(etag)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                add_etag(response)
+                cache.set(key, (response.get_data(), response.get_etag()[0]))
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def upload_cache_headers(response, path):
+    # after_request helper for files served from static/uploads
+    if response.status_code not in (200, 304):
+        return response
+    name = path.split('/static/uploads/', 1)[-1]
+    if '/' in name:
+        # Sharded paths are content hashes (see uploads.content_path)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = LEGACY_UPLOAD_CACHE_CONTROL
+    return response
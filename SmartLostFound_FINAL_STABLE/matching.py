@@ -0,0 +1,194 @@
+import math
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from search import tokenize
+
+# Lost/found matching. Every item is a row in the matrix of its type: hashed
+# term counts over title + description (TF-IDF is applied at query time from
+# running document frequencies), hashed location tokens and a timestamp.
+# A query scores the whole opposite-type matrix in a few vector operations,
+# and items are added or removed one row at a time.
+
+TEXT_DIM = 1024
+LOCATION_DIM = 256
+# Relative weight of each signal in the final score
+WEIGHTS = {'text': 0.6, 'location': 0.25, 'time': 0.15}
+# Time proximity halves every TIME_HALF_LIFE_DAYS between the two reports
+TIME_HALF_LIFE_DAYS = 7.0
+# Above the largest time-only score, so a match needs some text or location overlap
+MIN_SCORE = 0.2
+
+OPPOSITE = {'lost': 'found', 'found': 'lost'}
+
+
+@lru_cache(maxsize=65536)
+def _bucket(token, dim):
+    # Stable across processes, unlike hash()
+    value = zlib.crc32(token.encode())
+    return value % dim, 1.0 if value & 0x80000000 else -1.0
+
+
+def text_vector(title, description):
+    vector = np.zeros(TEXT_DIM, dtype=np.float32)
+    # Title words count double, as they do for search ranking
+    for token in tokenize(title) * 2 + tokenize(description):
+        index, sign = _bucket(token, TEXT_DIM)
+        vector[index] += sign
+    # Sublinear term frequency, keeping the sign of the hashed feature
+    return np.sign(vector) * np.log1p(np.abs(vector))
+
+
+def location_vector(location):
+    vector = np.zeros(LOCATION_DIM, dtype=np.float32)
+    for token in set(tokenize(location)):
+        vector[_bucket(token, LOCATION_DIM)[0]] = 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def timestamp(value):
+    return value.timestamp() if value is not None else 0.0
+
+
+class TypeMatrix:
+    # Rows for the items of one type, in growable arrays. Removal moves the
+    # last row into the hole, so rows stay dense.
+
+    def __init__(self, capacity=256):
+        self.ids = []
+        self.rows = {}  # item_id -> row
+        self.text = np.zeros((capacity, TEXT_DIM), dtype=np.float32)
+        self.text_sq = np.zeros((capacity, TEXT_DIM), dtype=np.float32)
+        self.location = np.zeros((capacity, LOCATION_DIM), dtype=np.float32)
+        self.times = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, item_id, text, location, time):
+        row = len(self.ids)
+        if row == len(self.times):
+            self._grow()
+        self.ids.append(item_id)
+        self.rows[item_id] = row
+        self.text[row] = text
+        self.text_sq[row] = text * text
+        self.location[row] = location
+        self.times[row] = time
+
+    def remove(self, item_id):
+        row = self.rows.pop(item_id)
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+            for array in (self.text, self.text_sq, self.location, self.times):
+                array[row] = array[last]
+        self.ids.pop()
+
+    def _grow(self):
+        capacity = len(self.times) * 2
+        for name in ('text', 'text_sq', 'location', 'times'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+
+class MatchIndex:
+    # `loader(after_id)` returns items with a larger id, in id order. It is
+    # used to build the index lazily and to pick up items created by other
+    # workers before each query.
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.matrices = {kind: TypeMatrix() for kind in OPPOSITE}
+        self.types = {}  # item_id -> type
+        self.doc_freq = np.zeros(TEXT_DIM, dtype=np.float64)
+        self.last_id = 0
+        self.loaded = False
+
+    def sync(self):
+        with self.lock:
+            for item in self.loader(self.last_id):
+                self._add(item)
+            self.loaded = True
+
+    def add(self, item):
+        if not self.loaded:
+            self.sync()
+        with self.lock:
+            self._add(item)
+
+    def remove(self, item_id):
+        with self.lock:
+            kind = self.types.pop(item_id, None)
+            if kind is None:
+                return
+            matrix = self.matrices[kind]
+            self.doc_freq -= matrix.text[matrix.rows[item_id]] != 0
+            matrix.remove(item_id)
+
+    def matches(self, item, limit=10):
+        # [(item_id, score, {signal: score})] for the best opposite-type items
+        self.sync()
+        opposite = OPPOSITE.get(item.type)
+        if opposite is None:
+            return []
+        query_text = text_vector(item.title, item.description)
+        query_location = location_vector(item.location)
+        query_time = timestamp(item.created_at)
+
+        with self.lock:
+            matrix = self.matrices[opposite]
+            count = len(matrix)
+            if not count:
+                return []
+            # Squared IDF weights from the running document frequencies
+            total = len(self.types)
+            weights = np.log((1 + total) / (1 + self.doc_freq)) + 1.0
+            weights = (weights * weights).astype(np.float32)
+
+            query_weighted = query_text * weights
+            query_norm = math.sqrt(float(query_text * query_text @ weights))
+            norms = np.sqrt(matrix.text_sq[:count] @ weights)
+            text_scores = matrix.text[:count] @ query_weighted
+            text_scores /= np.maximum(norms * query_norm, 1e-9)
+            np.clip(text_scores, 0.0, 1.0, out=text_scores)
+
+            location_scores = matrix.location[:count] @ query_location
+            days = np.abs(matrix.times[:count] - query_time) / 86400.0
+            time_scores = np.exp2(-days / TIME_HALF_LIFE_DAYS)
+
+            scores = (WEIGHTS['text'] * text_scores + WEIGHTS['location'] * location_scores
+                      + WEIGHTS['time'] * time_scores)
+            if limit < count:
+                top = np.argpartition(-scores, limit)[:limit]
+            else:
+                top = np.arange(count)
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [
+                (matrix.ids[i], round(float(scores[i]), 4), {
+                    'text': round(float(text_scores[i]), 4),
+                    'location': round(float(location_scores[i]), 4),
+                    'time': round(float(time_scores[i]), 4),
+                })
+                for i in top if scores[i] >= MIN_SCORE
+            ]
+
+    def _add(self, item):
+        if item.type not in self.matrices:
+            return
+        if item.id in self.types:
+            return
+        text = text_vector(item.title, item.description)
+        self.matrices[item.type].add(item.id, text, location_vector(item.location), timestamp(item.created_at))
+        self.types[item.id] = item.type
+        self.doc_freq += text != 0
+        self.last_id = max(self.last_id, item.id)
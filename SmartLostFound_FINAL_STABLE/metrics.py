@@ -0,0 +1,174 @@
+import bisect
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context
+
+# Minimal Prometheus-style metrics kept in process memory and rendered in
+# the text exposition format by /metrics. Each worker reports its own
+# numbers; scrape every worker (or sum them) when running several.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name + _format_labels(self.labelnames, labels), value)
+                    for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    # Set directly, or computed at scrape time by `callback()` -> {labels: value}
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, *labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        if self.callback is not None:
+            values = self.callback()
+            with self.lock:
+                self.values = dict(values)
+        return super().samples()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = {labels: list(entry) for labels, entry in self.values.items()}
+        lines = []
+        for labels, entry in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append((self.name + '_bucket' + _format_labels(self.labelnames, labels, {'le': bound}), cumulative))
+            lines.append((self.name + '_bucket' + _format_labels(self.labelnames, labels, {'le': '+Inf'}), entry[-1]))
+            lines.append((self.name + '_sum' + _format_labels(self.labelnames, labels), entry[-2]))
+            lines.append((self.name + '_count' + _format_labels(self.labelnames, labels), entry[-1]))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {_format_value(value)}" for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('method', 'endpoint', 'status')))
+HTTP_REQUEST_QUERIES = registry.register(Histogram(
+    'http_request_db_queries', 'SQL statements per HTTP request', ('endpoint',), QUERY_COUNT_BUCKETS))
+SOCKET_EVENT_SECONDS = registry.register(Histogram(
+    'socketio_event_duration_seconds', 'Socket.IO event handler latency', ('event',)))
+SOCKET_EVENT_QUERIES = registry.register(Histogram(
+    'socketio_event_db_queries', 'SQL statements per Socket.IO event', ('event',), QUERY_COUNT_BUCKETS))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    'db_query_duration_seconds', 'SQL statement latency', ('statement',)))
+SOCKET_RATE_LIMITED = registry.register(Counter(
+    'socketio_rate_limited_total', 'Socket.IO events dropped by per-connection limits', ('event',)))
+OUTBOX_EVENTS = registry.register(Counter(
+    'socketio_outbox_events_total', 'Room broadcasts by outcome (sent, queued, merged, dropped)',
+    ('event', 'outcome')))
+COALESCED_CALLS = registry.register(Counter(
+    'socketio_coalesced_total', 'Socket.IO requests folded into pending work', ('event',)))
+
+
+def statement_kind(statement):
+    # First keyword, so the label set stays small
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA') else 'OTHER'
+
+
+def timed_event(name):
+    # Records latency and query count for a Socket.IO event handler
+    from querycount import query_count  # querycount imports this module
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            queries = query_count()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                SOCKET_EVENT_SECONDS.observe(time.perf_counter() - start, name)
+                SOCKET_EVENT_QUERIES.observe(query_count() - queries, name)
+        return wrapper
+    return decorator
+
+
+def request_started():
+    if has_app_context():
+        g.request_started = time.perf_counter()
+
+
+def request_elapsed():
+    started = g.get('request_started') if has_app_context() else None
+    return time.perf_counter() - started if started is not None else None
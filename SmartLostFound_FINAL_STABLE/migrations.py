@@ -0,0 +1,382 @@
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import inspect, text, update
+
+# Versioned schema migrations. Each migration runs once per database and is
+# recorded in the schema_version table; `python migrations.py` (or
+# `flask --app app migrate`) applies whatever is pending, in order.
+# Steps are written to be safe on databases that were patched by hand
+# before versioning existed, so an existing production file can be brought
+# up to date in place while the app keeps serving. Data steps select and
+# update explicit columns, never whole models: the models describe the
+# latest schema, which later migrations may not have created yet.
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def ensure_version_table(db):
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    db.session.commit()
+
+
+def applied_versions(db):
+    ensure_version_table(db)
+    return set(db.session.execute(text("SELECT version FROM schema_version")).scalars())
+
+
+def current_version(db):
+    return max(applied_versions(db), default=0)
+
+
+def pending(db):
+    done = applied_versions(db)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(db, target=None):
+    # Applies pending migrations up to `target` (all by default)
+    applied = []
+    for version, name, fn in pending(db):
+        if target is not None and version > target:
+            break
+        print(f"Applying {version}: {name}")
+        fn(db)
+        db.session.execute(text(
+            "INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+        ), {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+        db.session.commit()
+        applied.append(version)
+    if applied and db.engine.dialect.name == 'sqlite':
+        # Refresh planner statistics for the new indexes
+        db.session.execute(text("PRAGMA optimize"))
+    return applied
+
+
+# ---------------- HELPERS ----------------
+
+def add_column(db, table, column, ddl):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column in columns:
+        return False
+    db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+    db.session.commit()
+    return True
+
+
+def create_index(db, name, table, columns):
+    # On Postgres the index is built CONCURRENTLY so writes continue. SQLite
+    # has no equivalent: the build holds the write lock, but readers keep
+    # going under WAL and writers wait on busy_timeout instead of failing.
+    column_list = ', '.join(columns)
+    if db.engine.dialect.name == 'postgresql':
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}" ({column_list})'))
+        return
+    db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({column_list})'))
+    db.session.commit()
+
+
+def backfilled_activity(count):
+    # last_activity for `count` backfilled conversations, newest message
+    # first. Messages only carry a display time, so there is no real one:
+    # the idle clock starts now, and retention waits a full period before
+    # archiving them. One microsecond apart keeps the chat list in order.
+    now = datetime.utcnow()
+    return [now - timedelta(microseconds=rank) for rank in range(count)]
+
+
+# ---------------- MIGRATIONS ----------------
+
+@migration(1, 'create tables')
+def create_tables(db):
+    # Tables that do not exist yet come straight from the models
+    db.create_all()
+
+
+@migration(2, 'profile image, image metadata and read watermark columns')
+def add_columns(db):
+    add_column(db, 'user', 'profile_image', 'TEXT')
+    add_column(db, 'user', 'profile_image_meta', 'TEXT')
+    add_column(db, 'item', 'image_meta', 'TEXT')
+    add_column(db, 'conversation', 'buyer_read_id', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(db, 'conversation', 'seller_read_id', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@migration(3, 'chat message indexes')
+def message_indexes(db):
+    create_index(db, 'ix_message_room_status_sender', 'message', ('room', 'status', 'sender_id'))
+    create_index(db, 'ix_message_room_id', 'message', ('room', 'id'))
+
+
+@migration(4, 'backfill conversations')
+def backfill_conversations(db):
+    # Build one Conversation row per existing chat room so /api/chats
+    # no longer has to scan the message table.
+    from chat import parse_room
+    from models import Conversation, Message, Item
+
+    created = []
+    rooms = db.session.query(Message.room, db.func.max(Message.id)).group_by(Message.room).all()
+    for room, last_message_id in rooms:
+        if Conversation.query.filter_by(room=room).first():
+            continue
+        parsed = parse_room(room)
+        if not parsed:
+            continue
+        item_id, buyer_id = parsed
+        item = db.session.query(Item.user_id).filter(Item.id == item_id).first()
+        if not item:
+            continue
+
+        unread = dict(db.session.query(Message.sender_id, db.func.count(Message.id)).filter(
+            Message.room == room,
+            Message.status != 'read'
+        ).group_by(Message.sender_id).all())
+
+        conversation = Conversation(
+            room=room,
+            item_id=item_id,
+            buyer_id=buyer_id,
+            seller_id=item.user_id,
+            last_message_id=last_message_id,
+            # Unread messages for one side are the ones the other side sent
+            buyer_unread=unread.get(item.user_id, 0) if item.user_id != buyer_id else 0,
+            seller_unread=unread.get(buyer_id, 0) if item.user_id != buyer_id else 0
+        )
+        db.session.add(conversation)
+        created.append(conversation)
+    created.sort(key=lambda c: c.last_message_id, reverse=True)
+    for conversation, last_activity in zip(created, backfilled_activity(len(created))):
+        conversation.last_activity = last_activity
+    db.session.commit()
+    print(f"Backfilled {len(created)} conversations.")
+
+
+@migration(5, 'register existing uploads')
+def backfill_stored_files(db):
+    # Register uploads saved before content-addressed storage, with one
+    # reference per row using them, so deletes and GC treat them the same way
+    from models import Item, User, StoredFile
+
+    folder = current_app.config["UPLOAD_FOLDER"]
+    references = Counter(name for (name,) in db.session.query(Item.image) if name)
+    references.update(name for (name,) in db.session.query(User.profile_image) if name)
+    registered = 0
+    for name, count in references.items():
+        path = os.path.join(folder, name)
+        if db.session.get(StoredFile, name) or not os.path.exists(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        db.session.add(StoredFile(path=name, hash=digest.hexdigest(), size=os.path.getsize(path), refcount=count))
+        registered += 1
+    db.session.commit()
+    print(f"Registered {registered} existing uploads.")
+
+
+@migration(6, 'backfill thumbnails')
+def backfill_thumbnails(db):
+    # Generate WebP variants for images uploaded before the image pipeline
+    from models import Item, User
+    from uploads import process_image
+
+    processed = 0
+    folder = current_app.config["UPLOAD_FOLDER"]
+    pending_rows = [(Item, 'image_meta', row) for row in db.session.query(Item.id, Item.image).filter(
+        Item.image != '', Item.image_meta.is_(None))]
+    pending_rows += [(User, 'profile_image_meta', row) for row in db.session.query(User.id, User.profile_image).filter(
+        User.profile_image_meta.is_(None))]
+    for model, meta_column, (row_id, filename) in pending_rows:
+        if not filename or not os.path.exists(os.path.join(folder, filename)):
+            continue
+        try:
+            meta = process_image(folder, filename)
+        except Exception as e:
+            print(f"Could not process {filename}: {e}")
+            continue
+        if meta:
+            db.session.execute(update(model).where(model.id == row_id).values({meta_column: json.dumps(meta)}))
+            processed += 1
+    db.session.commit()
+    print(f"Generated thumbnails for {processed} images.")
+
+
+@migration(7, 'item indexes')
+def item_indexes(db):
+    # Dashboard (user_id), type filter and date-based retention. SQLite
+    # secondary indexes end with the rowid, so ix_item_type and
+    # ix_item_user_id also serve the newest-first ORDER BY id listings.
+    create_index(db, 'ix_item_user_id', 'item', ('user_id',))
+    create_index(db, 'ix_item_created_at', 'item', ('created_at',))
+    create_index(db, 'ix_item_type', 'item', ('type',))
+
+
+@migration(8, 'id sequence table')
+def id_sequence_table(db):
+    # Message ids reserved ahead of write-behind inserts
+    from models import IdSequence
+
+    IdSequence.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(9, 'perceptual image hashes')
+def image_hashes(db):
+    # Hash photos stored before the pipeline computed perceptual hashes
+    from models import Item
+    from perceptual import dhash, phash
+    from uploads import Image, ImageOps
+
+    add_column(db, 'item', 'image_phash', 'VARCHAR(16)')
+    add_column(db, 'item', 'image_dhash', 'VARCHAR(16)')
+    if Image is None:
+        print("Pillow is not installed; skipping image hashes.")
+        return
+
+    hashed = 0
+    folder = current_app.config["UPLOAD_FOLDER"]
+    rows = db.session.query(Item.id, Item.image).filter(Item.image != '', Item.image_phash.is_(None)).all()
+    for item_id, filename in rows:
+        path = os.path.join(folder, filename or '')
+        if not filename or not os.path.exists(path):
+            continue
+        try:
+            with Image.open(path) as original:
+                image = ImageOps.exif_transpose(original)
+                values = {'image_phash': phash(image), 'image_dhash': dhash(image)}
+        except Exception as e:
+            print(f"Could not hash {filename}: {e}")
+            continue
+        db.session.execute(update(Item).where(Item.id == item_id).values(**values))
+        hashed += 1
+    db.session.commit()
+    print(f"Hashed {hashed} item images.")
+
+
+@migration(10, 'item coordinates')
+def item_coordinates(db):
+    # Place existing items whose location names a gazetteer entry
+    from models import Item
+    from geo import Gazetteer, geohash_encode
+
+    add_column(db, 'item', 'latitude', 'REAL')
+    add_column(db, 'item', 'longitude', 'REAL')
+    add_column(db, 'item', 'geohash', 'VARCHAR(12)')
+    create_index(db, 'ix_item_geohash', 'item', ('geohash',))
+
+    gazetteer = Gazetteer(current_app.config["GAZETTEER_PATH"])
+    placed = 0
+    rows = db.session.query(Item.id, Item.location).filter(Item.latitude.is_(None)).all()
+    for item_id, location in rows:
+        coordinates = gazetteer.lookup(location or '')
+        if coordinates is None:
+            continue
+        db.session.execute(update(Item).where(Item.id == item_id).values(
+            latitude=coordinates[0], longitude=coordinates[1], geohash=geohash_encode(*coordinates)
+        ))
+        placed += 1
+    db.session.commit()
+    print(f"Placed {placed} items from the gazetteer.")
+
+
+@migration(11, 'item status and archive table')
+def item_status(db):
+    from models import ArchivedRecord
+
+    add_column(db, 'item', 'status', "VARCHAR(20) NOT NULL DEFAULT 'open'")
+    add_column(db, 'item', 'closed_at', 'DATETIME')
+    create_index(db, 'ix_item_status_closed_at', 'item', ('status', 'closed_at'))
+    create_index(db, 'ix_conversation_last_activity', 'conversation', ('last_activity',))
+    ArchivedRecord.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(12, 'incremental vacuum')
+def incremental_vacuum(db):
+    # auto_vacuum only changes with a full VACUUM, which rewrites the file
+    # and holds the write lock for the duration: run this one off-peak on a
+    # large database. Afterwards retention.py frees pages incrementally.
+    if db.engine.dialect.name != 'sqlite':
+        return
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+@migration(13, 'item updated_at')
+def item_updated_at(db):
+    # Existing rows count as last changed when they were created
+    add_column(db, 'item', 'updated_at', 'TIMESTAMP')
+    db.session.execute(text("UPDATE item SET updated_at = created_at WHERE updated_at IS NULL"))
+    db.session.commit()
+    create_index(db, 'ix_item_updated_at', 'item', ('updated_at',))
+
+
+
+@migration(14, 'drop read-receipt index')
+def drop_read_receipt_index(db):
+    # Read state is the conversation's watermarks now; no query filters
+    # messages by status any more
+    db.session.execute(text("DROP INDEX IF EXISTS ix_message_room_status_sender"))
+    db.session.commit()
+
+
+
+@migration(15, 'restart backfilled conversation clocks')
+def restart_backfilled_activity(db):
+    # Migration 4 used to stamp conversations with their item's creation
+    # date, so the first retention pass archived live chats about old items.
+    # Those still carrying it get a fresh clock (see backfilled_activity);
+    # anything with a message since then has a real last_activity already.
+    from models import Conversation, Item
+
+    rows = db.session.query(Conversation.id).join(Item, Item.id == Conversation.item_id).filter(
+        Conversation.last_activity == Item.created_at
+    ).order_by(Conversation.last_message_id.desc()).all()
+    if rows:
+        db.session.execute(update(Conversation), [
+            {'id': conversation_id, 'last_activity': last_activity}
+            for (conversation_id,), last_activity in zip(rows, backfilled_activity(len(rows)))
+        ])
+    db.session.commit()
+    print(f"Restarted the idle clock of {len(rows)} backfilled conversations.")
+
+
+def main(argv):
+    from app import create_app
+    from extensions import db
+
+    with create_app().app_context():
+        if argv[:1] == ['--status']:
+            done = applied_versions(db)
+            for version, name, _ in MIGRATIONS:
+                print(f"{'x' if version in done else ' '} {version}: {name}")
+            return
+        target = int(argv[0]) if argv else None
+        applied = upgrade(db, target)
+        print(f"Schema at version {current_version(db)} ({len(applied)} applied).")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,200 @@
+import json
+from datetime import datetime
+
+from caching import LRUCache
+from extensions import db
+
+# Database models, plus the JSON form of items shared by every endpoint
+# that lists them
+
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(150), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+    profile_image = db.Column(db.String(200), default=None)
+    profile_image_meta = db.Column(db.Text) # JSON from the image pipeline
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Item(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    location = db.Column(db.String(150), nullable=False)
+    contact = db.Column(db.String(150), nullable=False)
+    image = db.Column(db.String(200))
+    image_meta = db.Column(db.Text) # JSON from the image pipeline: dimensions and thumbnail variants
+    image_phash = db.Column(db.String(16)) # perceptual hashes (hex), see perceptual.py
+    image_dhash = db.Column(db.String(16))
+    # Optional position (WGS84 degrees), given by the client or looked up in
+    # the gazetteer from `location`; geohash serves proximity queries where
+    # SQLite's R*Tree is not available (see geo.py)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    type = db.Column(db.String(50), nullable=False, default='lost') # 'lost' or 'found'
+    # 'open' until the owner marks it resolved or claimed (closed_at); closed
+    # items are archived after CLOSED_ITEM_RETENTION_DAYS (see retention.py)
+    status = db.Column(db.String(20), nullable=False, default='open')
+    closed_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User', backref=db.backref('items', lazy=True))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last change to status or photo hashes, so in-memory indexes can
+    # reload only what changed; writers set it (see services.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Dashboard listing, type filter and date-based queries (see migrations.py)
+        db.Index('ix_item_user_id', 'user_id'),
+        db.Index('ix_item_created_at', 'created_at'),
+        db.Index('ix_item_type', 'type'),
+        db.Index('ix_item_geohash', 'geohash'),
+        db.Index('ix_item_status_closed_at', 'status', 'closed_at'),
+        db.Index('ix_item_updated_at', 'updated_at'),
+    )
+    
+    # Helper to serialize object
+    def to_dict(self):
+        return cached_item_dict(
+            self,
+            self.user.username if self.user else None,
+            self.user.created_at if self.user else None
+        )
+
+ITEM_STATUSES = ('open', 'resolved', 'claimed')
+
+def image_meta_fields(meta_json):
+    # (width, height, {size: url}) for a stored image_meta value
+    meta = json.loads(meta_json) if meta_json else {}
+    thumbnails = {size: f'static/uploads/{name}' for size, name in meta.get('variants', {}).items()}
+    return meta.get('width'), meta.get('height'), thumbnails
+
+def item_dict(item, user_name, user_created_at):
+    # Shared by Item.to_dict and the row-tuple fast path; `item` is anything
+    # exposing the Item column attributes (model instance or query row).
+    width, height, thumbnails = image_meta_fields(item.image_meta)
+    return {
+        'id': item.id,
+        'title': item.title,
+        'description': item.description,
+        'location': item.location,
+        'contact': item.contact,
+        'type': item.type,
+        'status': item.status or 'open',
+        'image': f'static/uploads/{item.image}' if item.image else None,
+        'image_width': width,
+        'image_height': height,
+        'image_hash': item.image_phash,
+        'latitude': item.latitude,
+        'longitude': item.longitude,
+        'thumbnails': thumbnails,
+        'user_id': item.user_id,
+        'user_name': user_name if user_name is not None else "Unknown",
+        'user_joined': user_created_at.strftime('%Y') if user_created_at else "2024",
+        'date': item.created_at.isoformat() if item.created_at else datetime.utcnow().isoformat()
+    }
+
+# Serialized items, keyed on every value that can change for an existing row
+# (image metadata arrives later, items get closed, owners rename) plus
+# created_at, which tells a reused id apart. Callers must copy before modifying.
+item_dict_cache = LRUCache(maxsize=20000)
+
+def cached_item_dict(item, user_name, user_created_at):
+    key = (item.id, item.created_at, item.status, item.image_meta, item.image_phash, user_name)
+    data = item_dict_cache.get(key)
+    if data is None:
+        data = item_dict(item, user_name, user_created_at)
+        item_dict_cache.set(key, data)
+    return data
+
+def item_rows():
+    # Plain row tuples with the owner joined in: one SELECT for any number of
+    # items and no ORM identity-map overhead.
+    return db.session.query(
+        Item.id, Item.title, Item.description, Item.location, Item.contact, Item.type,
+        Item.status, Item.image, Item.image_meta, Item.image_phash, Item.latitude, Item.longitude,
+        Item.user_id, Item.created_at,
+        User.username.label('user_name'), User.created_at.label('user_created_at')
+    ).outerjoin(User, User.id == Item.user_id)
+
+def item_row_to_dict(row):
+    return cached_item_dict(row, row.user_name, row.user_created_at)
+
+class Message(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    room = db.Column(db.String(50), nullable=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    user = db.Column(db.String(100), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='sent') # sent, delivered, read
+
+    __table_args__ = (
+        # Serves paged history (latest N, scroll-back, resume)
+        db.Index('ix_message_room_id', 'room', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "sender_id": self.sender_id,
+            "user": self.user,
+            "text": self.text,
+            "timestamp": self.timestamp,
+            "status": self.status
+        }
+
+class Conversation(db.Model):
+    # One row per chat room, maintained on every message write so the chat list
+    # never has to scan the message table.
+    id = db.Column(db.Integer, primary_key=True)
+    room = db.Column(db.String(50), unique=True, nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), nullable=False, index=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow)
+    buyer_unread = db.Column(db.Integer, nullable=False, default=0)
+    seller_unread = db.Column(db.Integer, nullable=False, default=0)
+    # Read watermarks: id of the newest message each participant has seen
+    buyer_read_id = db.Column(db.Integer, nullable=False, default=0)
+    seller_read_id = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_conversation_buyer_activity', 'buyer_id', 'last_activity'),
+        db.Index('ix_conversation_seller_activity', 'seller_id', 'last_activity'),
+        # Idle conversations for retention
+        db.Index('ix_conversation_last_activity', 'last_activity'),
+    )
+
+class IdSequence(db.Model):
+    # Next unreserved id per table, for ids handed out before the row is written
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+class StoredFile(db.Model):
+    # One content-addressed upload (see uploads.py) and how many rows use it
+    path = db.Column(db.String(200), primary_key=True)
+    hash = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stored_file_refcount_updated', 'refcount', 'updated_at'),
+    )
+
+class ArchivedRecord(db.Model):
+    # Rows moved out of the hot tables by retention.py, as zlib-compressed
+    # JSON: one item, one conversation, or a chunk of a room's messages
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False) # 'item', 'conversation' or 'messages'
+    key = db.Column(db.String(50), nullable=False) # item id or room
+    row_count = db.Column(db.Integer, nullable=False, default=1)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_archived_record_kind_key', 'kind', 'key'),
+    )
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, maximum)
+
+
+def encode_cursor(data):
+    # Opaque to clients: urlsafe base64 of a small JSON object
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise PaginationError("Invalid cursor")
+    if not isinstance(data, dict):
+        raise PaginationError("Invalid cursor")
+    return data
+
+
+def cursor_int(cursor, key):
+    # Read an integer position out of a decoded cursor
+    if not cursor or key not in cursor:
+        return None
+    value = cursor[key]
+    if not isinstance(value, int) or value < 0:
+        raise PaginationError("Invalid cursor")
+    return value
+
+
+def parse_fields(value, allowed):
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def project(record, fields):
+    if fields is None:
+        return record
+    return {f: record[f] for f in fields}
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Password hashing off the request's event loop. scrypt/pbkdf2 take tens to
+# hundreds of milliseconds of CPU; under eventlet or gevent one call on the
+# hub would stall every open socket, so the KDF runs on a small pool of
+# native threads (hashlib releases the GIL while it works) and only the
+# calling green thread waits. The pool size bounds how many cores a login
+# burst can occupy.
+
+
+def native_runner(async_mode, max_workers, name='password-hash'):
+    # Returns run(fn, *args), which executes fn on a native thread and blocks
+    # only the caller: the green thread under eventlet/gevent, the request
+    # thread otherwise
+    if async_mode == 'eventlet':
+        from eventlet import tpool
+        from eventlet.semaphore import Semaphore
+        slots = Semaphore(max_workers)
+
+        def run(fn, *args):
+            with slots:
+                return tpool.execute(fn, *args)
+        return run
+
+    if async_mode == 'gevent':
+        from gevent.threadpool import ThreadPool
+        pool = ThreadPool(max_workers)
+        return lambda fn, *args: pool.apply(fn, args)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+    return lambda fn, *args: executor.submit(fn, *args).result()
+
+
+def hash_prefix(method):
+    # What werkzeug writes before the salt for `method`, with its defaults
+    # filled in ("scrypt" -> "scrypt:32768:8:1"), without running the KDF
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        if not args:
+            args = ['32768', '8', '1']
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments.")
+        return 'scrypt:' + ':'.join(str(int(arg)) for arg in args)
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments.")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f"Invalid hash method '{method}'.")
+
+
+class PasswordHasher:
+    # `method` is any werkzeug method string ("scrypt", "scrypt:65536:8:1",
+    # "pbkdf2:sha256:600000", ...). Hashes made with other parameters still
+    # verify; needs_rehash() tells the caller to store a fresh one.
+
+    def __init__(self, method='scrypt', max_workers=2, async_mode='threading'):
+        self.method = method
+        self.max_workers = max_workers
+        self.async_mode = async_mode
+        self._run = None
+        self._lock = threading.Lock()
+        # Canonical prefix (method and parameters) of hashes made now
+        self.prefix = hash_prefix(method)
+
+    def hash(self, password):
+        return self._runner()(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        return self._runner()(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.prefix
+
+    def _runner(self):
+        # Created on first use, after the server has picked its async mode
+        if self._run is None:
+            with self._lock:
+                if self._run is None:
+                    self._run = native_runner(self.async_mode, self.max_workers)
+        return self._run
@@ -0,0 +1,207 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+# Perceptual hashes: 64-bit fingerprints that stay close (in Hamming
+# distance) when a photo is resized, re-encoded or slightly edited, so two
+# pictures of the same object can be found without comparing pixels.
+# Hashes are stored as 16-character hex strings.
+
+HASH_SIZE = 8
+PHASH_SAMPLE = 32
+
+
+def _dct_matrix(n):
+    # Orthonormal DCT-II basis, so a 2-D DCT is two matrix products
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    basis = np.cos(math.pi * (2 * i + 1) * k / (2 * n)) * math.sqrt(2.0 / n)
+    basis[0] /= math.sqrt(2.0)
+    return basis
+
+_DCT = _dct_matrix(PHASH_SAMPLE)
+
+
+def _to_hex(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+
+def _grayscale(image, size):
+    # Only reached from the image pipeline, which already requires Pillow
+    from PIL import Image
+    return np.asarray(image.convert('L').resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def phash(image):
+    # DCT of a 32x32 grayscale copy; each of the 8x8 lowest frequencies
+    # (structure, not detail) becomes one bit: above or below their median
+    pixels = _grayscale(image, (PHASH_SAMPLE, PHASH_SAMPLE))
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _to_hex(low > np.median(low.ravel()[1:]))
+
+
+def dhash(image):
+    # Whether brightness rises or falls between horizontal neighbours
+    pixels = _grayscale(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _to_hex(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hamming(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits, radius):
+    # Every `bits`-wide mask with at most `radius` bits set
+    masks = []
+    for count in range(radius + 1):
+        for positions in combinations(range(bits), count):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+class MultiIndexHash:
+    # Multi-index hashing over 64-bit hashes: each hash is split into
+    # PARTS substrings with one lookup table per substring. If two hashes
+    # are within distance d, one of their substrings is within d // PARTS
+    # (pigeonhole), so a search only probes the buckets near each substring
+    # of the query instead of comparing against every stored hash.
+
+    PARTS = 4
+    PART_BITS = 64 // PARTS
+
+    def __init__(self):
+        self.tables = [defaultdict(set) for _ in range(self.PARTS)]
+        self.values = {}  # item_id -> hash as int
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, item_id, value):
+        value = int(value, 16)
+        self.values[item_id] = value
+        for table, key in zip(self.tables, self._parts(value)):
+            table[key].add(item_id)
+
+    def remove(self, item_id):
+        value = self.values.pop(item_id, None)
+        if value is None:
+            return
+        for table, key in zip(self.tables, self._parts(value)):
+            bucket = table[key]
+            bucket.discard(item_id)
+            if not bucket:
+                del table[key]
+
+    def search(self, value, max_distance):
+        # [(distance, item_id)] within max_distance, nearest first
+        value = int(value, 16)
+        masks = _flip_masks(self.PART_BITS, max_distance // self.PARTS)
+        if len(masks) * self.PARTS >= len(self.values):
+            # Probing would cost more than comparing everything
+            candidates = self.values
+        else:
+            candidates = set()
+            for table, key in zip(self.tables, self._parts(value)):
+                for mask in masks:
+                    bucket = table.get(key ^ mask)
+                    if bucket:
+                        candidates.update(bucket)
+        found = []
+        for item_id in candidates:
+            distance = (self.values[item_id] ^ value).bit_count()
+            if distance <= max_distance:
+                found.append((distance, item_id))
+        found.sort()
+        return found
+
+    def _parts(self, value):
+        mask = (1 << self.PART_BITS) - 1
+        return [(value >> (i * self.PART_BITS)) & mask for i in range(self.PARTS)]
+
+
+class ImageHashIndex:
+    # One multi-index table of pHashes per item type, plus each item's
+    # dHash to break ties. `loader(since)` returns (id, type, phash, dhash,
+    # changed_at) rows: every hashed item for since=None, else those changed
+    # at or after `since`, with phash None for items to drop. Every
+    # `refresh_interval` seconds it is re-run from `overlap` seconds before
+    # the newest change seen, to pick up hashes stored and items closed by
+    # other workers (whose pipelines finish at unpredictable times) without
+    # missing rows committed a little after their timestamp.
+
+    def __init__(self, loader, refresh_interval=60, overlap=60):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.entries = {}  # item_id -> (type, phash, dhash)
+        self.loaded_at = None
+        self.changed_since = None
+
+    def add(self, item_id, kind, phash_value, dhash_value):
+        with self.lock:
+            self._add(item_id, kind, phash_value, dhash_value)
+
+    def remove(self, item_id):
+        with self.lock:
+            self._remove(item_id)
+
+    def similar(self, phash_value, dhash_value, kind, max_distance=10, limit=20):
+        # [(item_id, phash distance, dhash distance)] of `kind` items, closest first
+        self._refresh()
+        with self.lock:
+            table = self.tables.get(kind)
+            if table is None:
+                return []
+            results = [
+                (item_id, distance, hamming(dhash_value, self.entries[item_id][2]))
+                for distance, item_id in table.search(phash_value, max_distance)
+            ]
+        # pHash decides; dHash only orders equally close ones
+        results.sort(key=lambda r: (r[1], r[2], r[0]))
+        return results[:limit]
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.refresh_interval:
+            return
+        rows = self.loader(self.changed_since)
+        with self.lock:
+            latest = None
+            for item_id, kind, phash_value, dhash_value, changed_at in rows:
+                if phash_value is None:
+                    self._remove(item_id)
+                else:
+                    self._add(item_id, kind, phash_value, dhash_value)
+                if changed_at is not None and (latest is None or changed_at > latest):
+                    latest = changed_at
+            if latest is not None:
+                since = latest - self.overlap
+                if self.changed_since is None or since > self.changed_since:
+                    self.changed_since = since
+            self.loaded_at = now
+
+    def _remove(self, item_id):
+        entry = self.entries.pop(item_id, None)
+        if entry is not None:
+            self.tables[entry[0]].remove(item_id)
+
+    def _add(self, item_id, kind, phash_value, dhash_value):
+        if item_id in self.entries:
+            if self.entries[item_id] == (kind, phash_value, dhash_value):
+                return
+            # A reused id or a new photo: replace the old entry
+            self.tables[self.entries[item_id][0]].remove(item_id)
+        self.entries[item_id] = (kind, phash_value, dhash_value)
+        self.tables.setdefault(kind, MultiIndexHash()).add(item_id, phash_value)
@@ -0,0 +1,132 @@
+import threading
+from collections import Counter
+
+
+class InProcessPresence:
+    # Connection refcounts per user, for a single worker process.
+    # A user with two tabs open stays online until both disconnect.
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def connect(self, user_id):
+        with self.lock:
+            self.counts[user_id] += 1
+            return self.counts[user_id]
+
+    def disconnect(self, user_id):
+        with self.lock:
+            if self.counts[user_id] <= 1:
+                del self.counts[user_id]
+                return 0
+            self.counts[user_id] -= 1
+            return self.counts[user_id]
+
+    def is_online(self, user_id):
+        with self.lock:
+            return self.counts.get(user_id, 0) > 0
+
+    def online_count(self):
+        with self.lock:
+            return len(self.counts)
+
+    def release_all(self):
+        with self.lock:
+            self.counts.clear()
+
+
+class SharedStorePresence:
+    # Refcounts kept in a shared key-value store so every worker sees the same
+    # presence, whichever worker each of a user's connections landed on.
+    # `store` needs the redis-py subset incr/decr/get/delete/keys.
+
+    PREFIX = 'presence:user:'
+
+    def __init__(self, store):
+        self.store = store
+        # Connections held by this worker, handed back on shutdown so a
+        # recycled worker doesn't leave its users online forever
+        self.local_counts = Counter()
+        self.lock = threading.Lock()
+
+    def connect(self, user_id):
+        with self.lock:
+            self.local_counts[user_id] += 1
+        return int(self.store.incr(self._key(user_id)))
+
+    def disconnect(self, user_id):
+        with self.lock:
+            if self.local_counts[user_id] <= 1:
+                self.local_counts.pop(user_id, None)
+            else:
+                self.local_counts[user_id] -= 1
+        return self._release(user_id, 1)
+
+    def release_all(self):
+        with self.lock:
+            held = dict(self.local_counts)
+            self.local_counts.clear()
+        for user_id, count in held.items():
+            self._release(user_id, count)
+
+    def _release(self, user_id, amount):
+        count = int(self.store.decr(self._key(user_id), amount))
+        if count <= 0:
+            self.store.delete(self._key(user_id))
+            return 0
+        return count
+
+    def is_online(self, user_id):
+        value = self.store.get(self._key(user_id))
+        return value is not None and int(value) > 0
+
+    def online_count(self):
+        return len(self.store.keys(self.PREFIX + '*'))
+
+    def _key(self, user_id):
+        return f'{self.PREFIX}{user_id}'
+
+
+class LocalSharedStore:
+    # In-memory stand-in for the shared store (tests, single-host setups)
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            self.data[key] = int(self.data.get(key, 0)) + amount
+            return self.data[key]
+
+    def decr(self, key, amount=1):
+        return self.incr(key, -amount)
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def delete(self, key):
+        with self.lock:
+            return 1 if self.data.pop(key, None) is not None else 0
+
+    def keys(self, pattern='*'):
+        prefix = pattern.rstrip('*')
+        with self.lock:
+            return [k for k in self.data if k.startswith(prefix)]
+
+
+# Shared by every app created in this process when PRESENCE_URL is "local"
+local_store = LocalSharedStore()
+
+
+def create_presence(url=None):
+    # None / "memory": per-process counts; "local": shared-store code path
+    # on the in-process stand-in; "redis://...": shared across workers.
+    if not url or url == 'memory':
+        return InProcessPresence()
+    if url == 'local':
+        return SharedStorePresence(local_store)
+    import redis
+    return SharedStorePresence(redis.Redis.from_url(url))
@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import DB_QUERY_SECONDS, statement_kind
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Per request / socket event, since both run inside an app context
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    DB_QUERY_SECONDS.observe(elapsed, statement_kind(statement))
+    if has_app_context():
+        g.query_time = g.get('query_time', 0.0) + elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_failed_query(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def query_count():
+    return g.get('query_count', 0) if has_app_context() else 0
+
+
+def query_time():
+    # Seconds spent in SQL so far in this request / socket event
+    return g.get('query_time', 0.0) if has_app_context() else 0.0
+
+
+@contextmanager
+def uncounted():
+    # One-off work inside a request (an index set up on first use) whose
+    # queries should not count against the view's budget
+    count = query_count()
+    try:
+        yield
+    finally:
+        if has_app_context():
+            g.query_count = count
+
+
+def query_budget(limit):
+    # Flags views that issue more SQL statements than expected (e.g. an N+1
+    # sneaking back in). Logs a warning, or raises when QUERY_BUDGET_STRICT
+    # is set so tests fail loudly. `limit` is an int or a {method: int} dict.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start = query_count()
+            result = view(*args, **kwargs)
+            used = query_count() - start
+            budget = limit.get(request.method) if isinstance(limit, dict) else limit
+            if budget is not None and used > budget:
+                message = f"{request.method} {request.endpoint} ran {used} queries (budget {budget})"
+                if current_app.config.get('QUERY_BUDGET_STRICT'):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return result
+        return wrapper
+    return decorator
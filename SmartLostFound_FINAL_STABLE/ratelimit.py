@@ -0,0 +1,64 @@
+import math
+import threading
+import time
+
+from caching import LRUCache
+
+
+class TokenBucket:
+    # `rate` tokens per second refill up to `burst`; each action takes one.
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        # 0 if allowed, else seconds until a token is available
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        # Return the token of an action that should not count
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    # One token bucket per key (client address, account, ...). Buckets live
+    # in an LRU map so a flood of distinct keys cannot grow memory without
+    # bound; an evicted key simply starts again with a full bucket.
+    # Per process: with several workers each enforces its own limit.
+
+    def __init__(self, rate, burst, maxsize=10000):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        # Seconds to wait (rounded up) if `key` is over its limit, else 0
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self.buckets.set(key, bucket)
+            wait = bucket.take()
+        return math.ceil(wait) if wait else 0
+
+    def give_back(self, key):
+        # Undo one hit of `key`, e.g. for an attempt that succeeded
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.give_back()
+
+    def forget(self, key):
+        # Drop the bucket, e.g. when a connection closes
+        with self.lock:
+            self.buckets.pop(key)
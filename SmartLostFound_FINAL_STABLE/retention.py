@@ -0,0 +1,178 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, delete
+
+from chat import flush_messages
+from events import publish_item_event
+from extensions import db, socketio
+from models import Item, Message, Conversation, ArchivedRecord
+from services import remove_item
+
+# Retention: keeps the hot tables small by moving cold rows into
+# archived_record as compressed JSON.
+#   - Items marked resolved/claimed more than CLOSED_ITEM_RETENTION_DAYS ago
+#     go, together with their conversations.
+#   - Conversations idle for CONVERSATION_RETENTION_DAYS go with all their
+#     messages. A conversation is archived whole so history and the chat
+#     list never show half of one.
+# Work is done in transactions of at most RETENTION_BATCH rows, yielding to
+# the event loop between them, so live requests only ever wait for one small
+# write. On SQLite the pages freed are then returned to the OS a few at a
+# time with incremental vacuum (enabled by migration 12).
+
+COMPRESSION_LEVEL = 6
+
+
+def pack(rows):
+    data = json.dumps([dict(row) for row in rows], default=str, separators=(',', ':'))
+    return zlib.compress(data.encode(), COMPRESSION_LEVEL)
+
+
+def unpack(payload):
+    # The archived rows, as a list of dicts (datetimes as strings)
+    return json.loads(zlib.decompress(payload))
+
+
+def archive_rows(kind, key, rows):
+    db.session.add(ArchivedRecord(kind=kind, key=str(key), row_count=len(rows), payload=pack(rows)))
+
+
+def archive_room(room, batch_size):
+    # Moves a conversation's messages out oldest first, then the conversation
+    # with its last message in one final transaction, so an interrupted run
+    # leaves the conversation in place to be picked up again. Returns the
+    # number of messages moved.
+    conversation = db.session.execute(
+        select(Conversation.__table__).where(Conversation.room == room)
+    ).mappings().first()
+    keep_id = conversation['last_message_id'] if conversation else None
+    moved = 0
+    while True:
+        query = select(Message.__table__).where(Message.room == room)
+        if keep_id is not None:
+            query = query.where(Message.id != keep_id)
+        rows = db.session.execute(query.order_by(Message.id).limit(batch_size)).mappings().all()
+        if not rows:
+            break
+        archive_rows('messages', room, rows)
+        db.session.execute(delete(Message).where(Message.id.in_([row['id'] for row in rows])))
+        db.session.commit()
+        moved += len(rows)
+        socketio.sleep(0)
+
+    if conversation:
+        last = db.session.execute(
+            select(Message.__table__).where(Message.id == keep_id)
+        ).mappings().all() if keep_id is not None else []
+        if last:
+            archive_rows('messages', room, last)
+        archive_rows('conversation', room, [conversation])
+        # The conversation refers to its last message, so it goes first
+        db.session.execute(delete(Conversation).where(Conversation.room == room))
+        if last:
+            db.session.execute(delete(Message).where(Message.id == keep_id))
+        moved += len(last)
+    db.session.commit()
+    return moved
+
+
+def archive_closed_items(cutoff, batch_size):
+    # (items, messages) archived among those closed before `cutoff`
+    item_ids = db.session.execute(
+        select(Item.id).where(Item.status != 'open', Item.closed_at < cutoff)
+        .order_by(Item.closed_at).limit(batch_size)
+    ).scalars().all()
+    items = messages = 0
+    for item_id in item_ids:
+        item = db.session.get(Item, item_id)
+        if item is None or item.status == 'open':
+            # Deleted or reopened meanwhile
+            continue
+        rooms = db.session.execute(
+            select(Conversation.room).where(Conversation.item_id == item_id)
+        ).scalars().all()
+        for room in rooms:
+            messages += archive_room(room, batch_size)
+
+        archive_rows('item', item_id, [
+            db.session.execute(select(Item.__table__).where(Item.id == item_id)).mappings().one()
+        ])
+        feed = (item.type, item.location, item.user_id)
+        remove_item(item)
+        publish_item_event('item_deleted', {"id": item_id}, *feed)
+        items += 1
+        socketio.sleep(0)
+    return items, messages
+
+
+def archive_idle_conversations(cutoff, batch_size):
+    # (conversations, messages) archived among those idle since before `cutoff`
+    rooms = db.session.execute(
+        select(Conversation.room).where(Conversation.last_activity < cutoff)
+        .order_by(Conversation.last_activity).limit(batch_size)
+    ).scalars().all()
+    messages = 0
+    for room in rooms:
+        messages += archive_room(room, batch_size)
+    return len(rooms), messages
+
+
+def incremental_vacuum(max_pages):
+    # Returns up to `max_pages` free pages to the OS; SQLite only, and only
+    # once auto_vacuum is INCREMENTAL. Returns the number of pages freed.
+    if db.engine.dialect.name != 'sqlite' or max_pages <= 0:
+        return 0
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return 0
+        before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if not before:
+            return 0
+        conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        return before - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+
+def apply_retention(now=None):
+    # One pass of every policy; returns counts for logging
+    config = current_app.config
+    now = now or datetime.utcnow()
+    batch_size = config['RETENTION_BATCH']
+    # Buffered messages land before their rooms are looked at
+    flush_messages()
+    result = {'items': 0, 'conversations': 0, 'messages': 0, 'pages_freed': 0}
+    if config['CLOSED_ITEM_RETENTION_DAYS'] > 0:
+        cutoff = now - timedelta(days=config['CLOSED_ITEM_RETENTION_DAYS'])
+        items, messages = archive_closed_items(cutoff, batch_size)
+        result['items'] += items
+        result['messages'] += messages
+    if config['CONVERSATION_RETENTION_DAYS'] > 0:
+        cutoff = now - timedelta(days=config['CONVERSATION_RETENTION_DAYS'])
+        conversations, messages = archive_idle_conversations(cutoff, batch_size)
+        result['conversations'] += conversations
+        result['messages'] += messages
+    result['pages_freed'] = incremental_vacuum(config['VACUUM_PAGES'])
+    return result
+
+
+def retention_loop(app, socketio):
+    # Background task: socketio.start_background_task(retention_loop, app, socketio)
+    while True:
+        socketio.sleep(app.config['RETENTION_INTERVAL'])
+        with app.app_context():
+            try:
+                result = apply_retention()
+                if any(result.values()):
+                    app.logger.info("Retention: %s", result)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Retention pass failed")
+
+
+def archived_messages(room):
+    # Every archived message of `room`, oldest first (support and exports)
+    records = ArchivedRecord.query.filter_by(kind='messages', key=room).order_by(ArchivedRecord.id).all()
+    messages = [row for record in records for row in unpack(record.payload)]
+    return sorted(messages, key=lambda row: row['id'])
@@ -0,0 +1,481 @@
+from flask import Blueprint, current_app, request, jsonify, session
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased, joinedload
+
+from chat import flush_messages
+from events import publish_item_event
+from extensions import db, service
+from filestore import add_upload_reference, release_upload
+from geo import valid_coordinates, geohash_encode
+from httpcache import cached_view
+from metrics import registry
+from models import (User, Item, Message, Conversation, ITEM_STATUSES, image_meta_fields, item_rows,
+                    item_row_to_dict)
+from pagination import (PaginationError, parse_limit, encode_cursor, decode_cursor,
+                        cursor_int, parse_fields, project)
+from querycount import query_budget
+from services import (search_index, geo_index, gazetteer, match_index, image_hash_index, item_response_cache, item_matches,
+                      set_item_status, remove_item, store_item_image_meta, store_profile_image_meta,
+                      MATCH_LIMIT, SIMILAR_MAX_DISTANCE)
+from uploads import stage_upload, place_upload
+
+# HTTP API. Registered on the app by create_app.
+api = Blueprint('api', __name__)
+
+password_hasher = service('password_hasher')
+auth_limiter = service('auth_limiter')
+image_pipeline = service('image_pipeline')
+
+@api.route('/')
+def hello():
+    return "Hello from Flask!"
+
+@api.route('/metrics', methods=["GET"])
+def metrics():
+    return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# ---------------- AUTH ----------------
+
+def auth_rate_limited(*keys):
+    # 429 response if any key (client address, account) is over its limit.
+    # The address is the client's as seen through PROXY_FIX_X_FOR proxies.
+    wait = max(auth_limiter.hit(key) for key in keys)
+    if not wait:
+        return None
+    return jsonify({"error": "Too many attempts, try again later"}), 429, {"Retry-After": str(wait)}
+
+@api.route('/api/register', methods=["POST"])
+def register():
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    limited = auth_rate_limited(f"ip:{request.remote_addr}")
+    if limited:
+        return limited
+        
+    if User.query.filter_by(email=data["email"]).first():
+        return jsonify({"error": "Email already registered"}), 409
+
+    hashed_pw = password_hasher.hash(data["password"])
+
+    user = User(
+        username=data.get("username") or data.get("name"),
+        email=data["email"],
+        password=hashed_pw
+    )
+    db.session.add(user)
+    db.session.commit()
+    
+    return jsonify({"message": "Registration successful", "user": {"email": user.email, "username": user.username}}), 201
+
+@api.route('/api/login', methods=["POST"])
+def login():
+    data = request.json
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+        
+    rate_keys = (f"ip:{request.remote_addr}", f"account:{str(data['email']).lower()}")
+    limited = auth_rate_limited(*rate_keys)
+    if limited:
+        return limited
+        
+    user = User.query.filter_by(email=data["email"]).first()
+    if user and password_hasher.verify(user.password, data["password"]):
+        # Only failed attempts count: users behind one NAT can keep logging in
+        for key in rate_keys:
+            auth_limiter.give_back(key)
+        if password_hasher.needs_rehash(user.password):
+            # Stored with an older method or cost: replace it now that we have the password
+            user.password = password_hasher.hash(data["password"])
+            db.session.commit()
+        session["user_id"] = user.id
+        session["username"] = user.username
+        # Return user info for frontend context
+        return jsonify({
+            "message": "Login successful",
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+            }
+        }), 200
+    else:
+        return jsonify({"error": "Invalid email or password"}), 401
+
+@api.route('/api/logout', methods=["POST"])
+def logout():
+    session.clear()
+    return jsonify({"message": "Logged out successfully"}), 200
+
+def user_dict(user):
+    _, _, thumbnails = image_meta_fields(user.profile_image_meta)
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "profile_image": f'static/uploads/{user.profile_image}' if user.profile_image else None,
+        "profile_thumbnail": thumbnails.get('320')
+    }
+
+@api.route('/api/user/me', methods=["GET"])
+def get_current_user():
+    if "user_id" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    user = User.query.get(session["user_id"])
+    if not user:
+        session.clear()
+        return jsonify({"error": "User not found"}), 404
+        
+    return jsonify({
+        "user": user_dict(user)
+    })
+
+@api.route('/api/user/profile', methods=["POST"])
+def update_profile():
+    if "user_id" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    user = User.query.get(session["user_id"])
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+        
+    # Update text fields
+    if "username" in request.form:
+        user.username = request.form["username"]
+        # Item responses embed the owner's name
+        item_response_cache.clear()
+        
+    # Handle Image Upload
+    file = request.files.get("profile_image")
+    staged = None
+    if file and file.filename != "":
+        staged = stage_upload(file, current_app.config["UPLOAD_FOLDER"])
+        if staged[1] != user.profile_image:
+            release_upload(user.profile_image)
+            user.profile_image = add_upload_reference(staged)
+            user.profile_image_meta = None
+        
+    db.session.commit()
+
+    if staged:
+        place_upload(staged[0], current_app.config["UPLOAD_FOLDER"], staged[1])
+        if not user.profile_image_meta:
+            image_pipeline.submit(user.profile_image, store_profile_image_meta, key=user.id)
+    
+    return jsonify({
+        "message": "Profile updated successfully",
+        "user": user_dict(user)
+    })
+
+@api.route('/api/user/items', methods=["GET"])
+@query_budget(1)
+def get_user_items():
+    # Dashboard items
+    if "user_id" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    return list_items(item_rows().filter(Item.user_id == session["user_id"]))
+
+ITEM_FIELDS = ('id', 'title', 'description', 'location', 'contact', 'type', 'status', 'image',
+               'image_width', 'image_height', 'image_hash', 'latitude', 'longitude', 'thumbnails',
+               'user_id', 'user_name', 'user_joined', 'date', 'distance_km')
+
+NEAR_DEFAULT_RADIUS_KM = 1.0
+
+def parse_coordinates(lat, lon):
+    # (lat, lon) floats from request values, None if either is missing
+    if lat in (None, '') or lon in (None, ''):
+        return None
+    try:
+        coordinates = (float(lat), float(lon))
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must be numbers")
+    if not valid_coordinates(*coordinates):
+        raise ValueError("latitude must be within [-90, 90] and longitude within [-180, 180]")
+    return coordinates
+
+def parse_near(value, radius):
+    # ?near=<lat>,<lon> or ?near=<known place>, and ?radius=<km>
+    point = None
+    parts = value.split(",")
+    if len(parts) == 2:
+        try:
+            point = parse_coordinates(*parts)
+        except ValueError:
+            pass
+    if point is None:
+        point = gazetteer.lookup(value)
+        if point is None:
+            raise ValueError("near must be 'lat,lon' or a known place")
+    if radius in (None, ''):
+        return point[0], point[1], NEAR_DEFAULT_RADIUS_KM
+    try:
+        radius_km = float(radius)
+    except ValueError:
+        raise ValueError("radius must be a number of kilometres")
+    maximum = current_app.config["NEAR_MAX_RADIUS_KM"]
+    if not 0 < radius_km <= maximum:
+        raise ValueError(f"radius must be greater than 0 and at most {maximum:g} km")
+    return point[0], point[1], radius_km
+
+def list_items(base_query, search=None, near=None):
+    # Shared by the item listing endpoints: keyset pagination on id (newest first),
+    # type/location filters in SQL and optional field projection.
+    # Search and proximity results are ranked, so their cursor is an offset
+    # into the ranking instead.
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        cursor = decode_cursor(request.args.get("cursor"))
+        fields = parse_fields(request.args.get("fields"), ITEM_FIELDS)
+        offset = cursor_int(cursor, "offset") or 0
+        before_id = cursor_int(cursor, "id")
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    if near:
+        if search:
+            return jsonify({"error": "q and near cannot be combined"}), 400
+        try:
+            near = parse_near(near, request.args.get("radius"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    elif fields and "distance_km" in fields:
+        return jsonify({"error": "distance_km is only available with near"}), 400
+
+    item_type = request.args.get("type")
+    if item_type == "all":
+        item_type = None
+    location = request.args.get("location")
+
+    next_cursor = None
+    distances = {}
+    if near:
+        # Nearest first, from the spatial index; the location text filter
+        # does not apply since the point already says where
+        ranked = geo_index.near(*near, type=item_type)[offset:offset + limit + 1]
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            next_cursor = encode_cursor({"offset": offset + limit})
+        distances = {item_id: round(distance, 3) for distance, item_id in ranked}
+        found = {row.id: row for row in item_rows().filter(Item.id.in_(distances)).all()} if ranked else {}
+        items = [found[i] for _, i in ranked if i in found]
+    elif search:
+        ids = search_index.search(search, limit=limit + 1, offset=offset, type=item_type, location=location)
+        if len(ids) > limit:
+            ids = ids[:limit]
+            next_cursor = encode_cursor({"offset": offset + limit})
+        found = {row.id: row for row in item_rows().filter(Item.id.in_(ids)).all()} if ids else {}
+        items = [found[i] for i in ids if i in found]
+    else:
+        query = base_query
+        if item_type:
+            query = query.filter(Item.type == item_type)
+        if location:
+            query = query.filter(Item.location.ilike(f"%{location}%"))
+        if before_id is not None:
+            query = query.filter(Item.id < before_id)
+        items = query.order_by(Item.id.desc()).limit(limit + 1).all()
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor({"id": items[-1].id})
+
+    if distances:
+        rendered = [dict(item_row_to_dict(row), distance_km=distances[row.id]) for row in items]
+    else:
+        rendered = [item_row_to_dict(row) for row in items]
+    return jsonify({
+        "items": [project(item, fields) for item in rendered],
+        "next_cursor": next_cursor
+    })
+
+@api.route('/api/items', methods=["GET", "POST"])
+@cached_view(item_response_cache)
+@query_budget({"GET": 2, "POST": 10})
+def handle_items():
+    if request.method == "GET":
+        # Search (ranked), nearest to a point or list all, one page at a time
+        return list_items(item_rows(), search=request.args.get("q"), near=request.args.get("near"))
+
+    if request.method == "POST":
+        if "user_id" not in session:
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        # Position: explicit coordinates, else the gazetteer entry for the location
+        try:
+            coordinates = parse_coordinates(request.form.get("latitude"), request.form.get("longitude"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if coordinates is None:
+            coordinates = gazetteer.lookup(request.form["location"])
+
+        filename = ""
+        file = request.files.get("image")
+        staged = None
+
+        if file and file.filename != "":
+            # Identical images share one stored file
+            staged = stage_upload(file, current_app.config["UPLOAD_FOLDER"])
+            filename = add_upload_reference(staged)
+
+        item = Item(
+            title=request.form["title"],
+            description=request.form["description"],
+            location=request.form["location"],
+            contact=request.form["contact"],
+            type=request.form.get("type", "lost"),
+            image=filename,
+            user_id=session["user_id"]
+        )
+        if coordinates:
+            item.latitude, item.longitude = coordinates
+            item.geohash = geohash_encode(*coordinates)
+        db.session.add(item)
+        db.session.flush()
+        search_index.add(item)
+        geo_index.add(item)
+        db.session.commit()
+        item_response_cache.clear()
+        match_index.add(item)
+
+        if staged:
+            place_upload(staged[0], current_app.config["UPLOAD_FOLDER"], filename)
+            # Thumbnails show up in to_dict once the pipeline has stored them
+            image_pipeline.submit(filename, store_item_image_meta, key=item.id)
+        
+        item_data = item.to_dict()
+        publish_item_event('item_created', {"item": item_data}, item.type, item.location, item.user_id)
+
+        # Suggest likely counterparts right away
+        return jsonify({
+            "message": "Item posted successfully",
+            "item": item_data,
+            "matches": item_matches(item)
+        }), 201
+
+# Endpoint to get single item details
+@api.route('/api/items/<int:id>', methods=["GET", "DELETE"])
+@cached_view(item_response_cache)
+@query_budget({"GET": 1, "DELETE": 7})
+def handle_item_detail(id):
+    item = Item.query.options(joinedload(Item.user)).filter_by(id=id).first_or_404()
+
+    if request.method == "GET":
+        return jsonify({"item": item.to_dict()})
+
+    if request.method == "DELETE":
+        if "user_id" not in session:
+            return jsonify({"error": "Not authenticated"}), 401
+        
+        # Verify ownership
+        if item.user_id != session["user_id"]:
+            return jsonify({"error": "Unauthorized"}), 403
+
+        feed = (item.type, item.location, item.user_id)
+        remove_item(item)
+        publish_item_event('item_deleted', {"id": id}, *feed)
+        return jsonify({"message": "Item deleted successfully"}), 200
+
+@api.route('/api/items/<int:id>/status', methods=["POST"])
+@query_budget(3)
+def update_item_status(id):
+    # Owner marks the item resolved or claimed ({"status": ...}), or reopens it
+    if "user_id" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    status = (request.get_json(silent=True) or {}).get("status")
+    if status not in ITEM_STATUSES:
+        return jsonify({"error": f"status must be one of: {', '.join(ITEM_STATUSES)}"}), 400
+    item = Item.query.options(joinedload(Item.user)).filter_by(id=id).first_or_404()
+    if item.user_id != session["user_id"]:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if item.status != status:
+        set_item_status(item, status)
+    item_data = item.to_dict()
+    publish_item_event('item_updated', {"item": item_data}, item.type, item.location, item.user_id)
+    return jsonify({"item": item_data})
+
+
+
+@api.route('/api/items/<int:id>/matches', methods=["GET"])
+@query_budget(3)
+def get_item_matches(id):
+    # Found items that may be this lost item, or the other way round
+    item = db.session.query(
+        Item.id, Item.title, Item.description, Item.location, Item.type, Item.created_at
+    ).filter(Item.id == id).first_or_404()
+    try:
+        limit = parse_limit(request.args.get("limit"), default=MATCH_LIMIT, maximum=50)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"item_id": id, "matches": item_matches(item, limit=limit)})
+
+@api.route('/api/items/<int:id>/similar', methods=["GET"])
+@query_budget(3)
+def get_similar_items(id):
+    # Items whose photo looks like this item's, from the opposite type by
+    # default (?type=lost|found|<same> to override)
+    item = db.session.query(
+        Item.id, Item.type, Item.image_phash, Item.image_dhash
+    ).filter(Item.id == id).first_or_404()
+    if not item.image_phash:
+        # No photo, or the pipeline has not hashed it yet
+        return jsonify({"item_id": id, "items": []})
+    try:
+        limit = parse_limit(request.args.get("limit"), default=MATCH_LIMIT, maximum=50)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    max_distance = request.args.get("max_distance", SIMILAR_MAX_DISTANCE, type=int)
+    if max_distance is None or not 0 <= max_distance <= 32:
+        return jsonify({"error": "max_distance must be an integer from 0 to 32"}), 400
+    from matching import OPPOSITE
+    kind = request.args.get("type") or OPPOSITE.get(item.type, item.type)
+
+    ranked = [r for r in image_hash_index.similar(item.image_phash, item.image_dhash, kind,
+                                                   max_distance=max_distance, limit=limit + 1)
+              if r[0] != id][:limit]
+    found = {row.id: row for row in item_rows().filter(
+        Item.id.in_([r[0] for r in ranked]), Item.status == 'open'
+    ).all()} if ranked else {}
+    return jsonify({"item_id": id, "items": [
+        dict(item_row_to_dict(found[item_id]), distance=distance, dhash_distance=dhash_distance)
+        for item_id, distance, dhash_distance in ranked if item_id in found
+    ]})
+
+@api.route('/api/chats', methods=["GET"])
+@query_budget(1)
+def get_user_chats():
+    if "user_id" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    current_user_id = session["user_id"]
+    flush_messages()
+    
+    # Single indexed query over the caller's own conversations
+    buyer = aliased(User)
+    seller = aliased(User)
+    rows = db.session.query(
+        Conversation, Item.title, buyer.username, seller.username, Message.text, Message.timestamp
+    ).join(Item, Item.id == Conversation.item_id) \
+     .outerjoin(buyer, buyer.id == Conversation.buyer_id) \
+     .outerjoin(seller, seller.id == Conversation.seller_id) \
+     .outerjoin(Message, Message.id == Conversation.last_message_id) \
+     .filter(or_(Conversation.buyer_id == current_user_id, Conversation.seller_id == current_user_id)) \
+     .order_by(Conversation.last_activity.desc()) \
+     .all()
+    
+    chats = []
+    for conversation, item_title, buyer_name, seller_name, last_text, last_timestamp in rows:
+        is_buyer = (current_user_id == conversation.buyer_id)
+        # I am buyer -> chatting with seller, otherwise with the buyer
+        other_user_name = seller_name if is_buyer else buyer_name
+        chats.append({
+            "room": conversation.room,
+            "item_title": item_title,
+            "item_id": conversation.item_id,
+            "other_user": other_user_name or "Unknown",
+            "last_message": last_text or "",
+            "timestamp": last_timestamp or "",
+            "unread": conversation.buyer_unread if is_buyer else conversation.seller_unread
+        })
+    
+    return jsonify({"chats": chats})
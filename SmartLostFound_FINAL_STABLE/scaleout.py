@@ -0,0 +1,64 @@
+import json
+import queue
+import threading
+
+import socketio
+
+
+class LocalBroker:
+    # In-process pub/sub stand-in for Redis/Kombu: every subscriber gets its
+    # own queue and receives every message published on its channel.
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.append((channel, subscriber))
+        return subscriber
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscribers = [q for c, q in self.subscribers if c == channel]
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+
+# Shared by every Socket.IO server created in this process
+default_broker = LocalBroker()
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    # Socket.IO client manager over LocalBroker, so several servers in one
+    # process fan out emits and room operations exactly as separate workers
+    # would over a real message queue.
+
+    name = 'local'
+
+    def __init__(self, channel='flask-socketio', write_only=False, logger=None, broker=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker or default_broker
+        self.subscription = None if write_only else self.broker.subscribe(channel)
+
+    def _publish(self, data):
+        # Serialized like the real backends, so nothing is shared by reference
+        self.broker.publish(self.channel, json.dumps(data))
+
+    def _listen(self):
+        while True:
+            yield self.subscription.get()
+
+
+def socketio_options(url):
+    # Extra SocketIO() arguments for SOCKETIO_MESSAGE_QUEUE:
+    #   unset          -> single process, in-memory rooms
+    #   local://<chan> -> LocalPubSubManager (tests / multiple servers in one process)
+    #   redis://, amqp://, kafka://, zmq+... -> Flask-SocketIO's own queue managers
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        channel = url[len('local://'):] or 'flask-socketio'
+        return {'client_manager': LocalPubSubManager(channel=channel)}
+    return {'message_queue': url}
@@ -0,0 +1,251 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from querycount import uncounted
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Relative importance of each indexed column when ranking (BM25 column weights)
+FIELD_WEIGHTS = {
+    'title': 10.0,
+    'description': 2.0,
+    'location': 4.0,
+    'type': 1.0,
+}
+FIELDS = list(FIELD_WEIGHTS)
+
+
+def tokenize(value):
+    return TOKEN_RE.findall((value or '').lower())
+
+
+class Fts5Backend:
+    # SQLite FTS5 index using the item table as external content.
+
+    def __init__(self, db):
+        self.db = db
+
+    def setup(self):
+        self.db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5("
+            "title, description, location, type, "
+            "content='item', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        indexed = self.db.session.execute(text("SELECT count(*) FROM item_fts_docsize")).scalar()
+        items = self.db.session.execute(text("SELECT count(*) FROM item")).scalar()
+        if indexed != items:
+            self.db.session.execute(text("INSERT INTO item_fts(item_fts) VALUES('rebuild')"))
+        self.db.session.commit()
+
+    def add(self, item):
+        self.db.session.execute(text(
+            "INSERT INTO item_fts(rowid, title, description, location, type) "
+            "VALUES (:id, :title, :description, :location, :type)"
+        ), self._values(item))
+
+    def remove(self, item):
+        # External content tables need the old values to remove the tokens
+        self.db.session.execute(text(
+            "INSERT INTO item_fts(item_fts, rowid, title, description, location, type) "
+            "VALUES ('delete', :id, :title, :description, :location, :type)"
+        ), self._values(item))
+
+    def search(self, query, limit=None, offset=0, type=None, location=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Every term must match; each is a prefix query so "wal" finds "wallet"
+        params = {
+            'match': ' '.join(f'"{token}"*' for token in tokens),
+            'limit': -1 if limit is None else limit,
+            'offset': offset,
+        }
+        filters = ''
+        if type:
+            filters += " AND item.type = :type"
+            params['type'] = type
+        if location:
+            filters += " AND lower(item.location) LIKE :location"
+            params['location'] = f"%{location.lower()}%"
+        weights = ', '.join(str(FIELD_WEIGHTS[f]) for f in FIELDS)
+        rows = self.db.session.execute(text(
+            f"SELECT item_fts.rowid FROM item_fts JOIN item ON item.id = item_fts.rowid "
+            f"WHERE item_fts MATCH :match{filters} "
+            f"ORDER BY bm25(item_fts, {weights}), item_fts.rowid DESC LIMIT :limit OFFSET :offset"
+        ), params)
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _values(item):
+        return {
+            'id': item.id,
+            'title': item.title,
+            'description': item.description,
+            'location': item.location,
+            'type': item.type,
+        }
+
+
+class InvertedIndexBackend:
+    # In-process BM25 index for databases without FTS5. Built lazily from
+    # the item table and kept in sync by add/remove.
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)   # token -> {item_id: weighted term frequency}
+        self.doc_lengths = {}               # item_id -> weighted document length
+        self.docs = {}                      # item_id -> set of tokens, for removal
+        self.attributes = {}                # item_id -> (type, lowercased location), for filters
+        self.vocabulary = []                # sorted tokens, for prefix expansion
+
+    def setup(self):
+        with self.lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.docs.clear()
+            self.attributes.clear()
+            self.vocabulary = []
+            for item in self.loader():
+                self._index(item)
+
+    def add(self, item):
+        with self.lock:
+            self._unindex(item.id)
+            self._index(item)
+
+    def remove(self, item):
+        with self.lock:
+            self._unindex(item.id)
+
+    def search(self, query, limit=None, offset=0, type=None, location=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        location = location.lower() if location else None
+
+        with self.lock:
+            total_docs = len(self.doc_lengths)
+            if not total_docs:
+                return []
+            avg_length = sum(self.doc_lengths.values()) / total_docs
+
+            scores = None
+            for token in tokens:
+                term_scores = defaultdict(float)
+                for term in self._expand(token):
+                    postings = self.postings[term]
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for item_id, tf in postings.items():
+                        norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[item_id] / avg_length)
+                        term_scores[item_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Every term must match, like the FTS5 backend
+                    scores = {i: s + term_scores[i] for i, s in scores.items() if i in term_scores}
+                if not scores:
+                    return []
+
+            if type or location:
+                scores = {i: s for i, s in scores.items() if self._matches(i, type, location)}
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], -i))
+        end = None if limit is None else offset + limit
+        return ranked[offset:end]
+
+    def _matches(self, item_id, type, location):
+        item_type, item_location = self.attributes[item_id]
+        if type and item_type != type:
+            return False
+        return not location or location in item_location
+
+    def _expand(self, prefix):
+        terms = []
+        position = bisect.bisect_left(self.vocabulary, prefix)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(prefix):
+            terms.append(self.vocabulary[position])
+            position += 1
+        return terms
+
+    def _index(self, item):
+        length = 0.0
+        tokens = set()
+        for field in FIELDS:
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(getattr(item, field)):
+                if token not in self.postings:
+                    bisect.insort(self.vocabulary, token)
+                self.postings[token][item.id] = self.postings[token].get(item.id, 0.0) + weight
+                length += weight
+                tokens.add(token)
+        self.doc_lengths[item.id] = length
+        self.docs[item.id] = tokens
+        self.attributes[item.id] = (item.type, (item.location or '').lower())
+
+    def _unindex(self, item_id):
+        for token in self.docs.pop(item_id, ()):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(item_id, None)
+            if not postings:
+                del self.postings[token]
+                self.vocabulary.pop(bisect.bisect_left(self.vocabulary, token))
+        self.doc_lengths.pop(item_id, None)
+        self.attributes.pop(item_id, None)
+
+
+class ItemSearch:
+    # Picks FTS5 on SQLite and the in-process index elsewhere. The backend
+    # is chosen on first use because the engine needs an app context.
+
+    def __init__(self, db, loader):
+        self.db = db
+        self.loader = loader
+        self.backend = None
+        self.lock = threading.Lock()
+
+    def _get_backend(self):
+        if self.backend is None:
+            with self.lock:
+                if self.backend is None:
+                    with uncounted():
+                        backend = self._create_backend()
+                        backend.setup()
+                    self.backend = backend
+        return self.backend
+
+    def warm(self):
+        # Choose and set up the backend now instead of in the first request
+        self._get_backend()
+
+    def _create_backend(self):
+        if self.db.engine.dialect.name == 'sqlite' and fts5_available(self.db):
+            return Fts5Backend(self.db)
+        return InvertedIndexBackend(self.loader)
+
+    def add(self, item):
+        self._get_backend().add(item)
+
+    def remove(self, item):
+        self._get_backend().remove(item)
+
+    def search(self, query, limit=None, offset=0, type=None, location=None):
+        return self._get_backend().search(query, limit=limit, offset=offset, type=type, location=location)
+
+
+def fts5_available(db):
+    try:
+        options = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+    except Exception:
+        return False
+    return 'ENABLE_FTS5' in options
@@ -0,0 +1,66 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+# JSON encoding for HTTP responses and Socket.IO packets. With orjson
+# installed, encoding runs in native code straight to bytes. The output
+# decodes to what the standard provider produces: keys stay sorted, and
+# types orjson leaves alone, such as datetimes, go through Flask's own
+# default. Non-ASCII text is sent as UTF-8 rather than \u escapes.
+
+
+def _orjson_options(sort_keys, indent=False):
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if sort_keys:
+        options |= orjson.OPT_SORT_KEYS
+    if indent:
+        options |= orjson.OPT_INDENT_2
+    return options
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # app.json = FastJSONProvider(app); behaves like DefaultJSONProvider
+    # when orjson is missing
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def dumps_bytes(self, obj):
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return orjson.dumps(obj, default=self.default, option=_orjson_options(self.sort_keys, indent))
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+class SocketJSON:
+    # The json module interface python-socketio calls (SocketIO(json=...));
+    # packets are compact, unsorted and must be str
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if orjson is None:
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=DefaultJSONProvider.default,
+                            option=_orjson_options(sort_keys=False)).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        if orjson is None:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
@@ -0,0 +1,228 @@
+import atexit
+import json
+import threading
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import update, select, delete, case
+
+from backpressure import RoomOutbox, Coalescer, merge_read_receipts
+from caching import LRUCache
+from chat import (reserve_message_ids, write_message_batch, permanent_write_error, room_participants_cache,
+                  flush_messages)
+from extensions import db, service
+from filestore import release_upload
+from geo import GeoIndex, Gazetteer
+from models import Item, User, Conversation, Message, item_rows, item_row_to_dict
+from passwords import PasswordHasher
+from presence import create_presence
+from ratelimit import RateLimiter
+from search import ItemSearch
+from uploads import ImagePipeline
+from writebehind import IdBlockAllocator, WriteBehindBuffer
+
+
+class Services:
+    # Everything one app keeps in memory between requests: caches, indexes,
+    # worker pools and connections. create_app stores it as
+    # app.extensions['lostfound']; modules reach it through
+    # extensions.service() proxies. The match and image-hash indexes (and
+    # numpy with them) are only loaded when first used.
+
+    def __init__(self, app, socketio):
+        config = app.config
+        # Full-text search over items (FTS5 on SQLite, in-process index elsewhere)
+        self.search_index = ItemSearch(db, lambda: Item.query.all())
+        # Proximity queries (R*Tree on SQLite, geohash ranges elsewhere)
+        self.geo_index = GeoIndex(db)
+        self.gazetteer = Gazetteer(config['GAZETTEER_PATH'])
+        # Rendered GET responses for /api/items and /api/items/<id>, keyed by full path
+        self.item_response_cache = LRUCache(maxsize=512, ttl=config['ITEM_CACHE_TTL'])
+        self.room_participants_cache = LRUCache(maxsize=10000)
+        # Thumbnails, dimensions and metadata stripping happen off-request
+        self.image_pipeline = ImagePipeline(config['UPLOAD_FOLDER'], context=app.app_context,
+                                            async_mode=socketio.async_mode,
+                                            spawn=socketio.start_background_task)
+        # Online users as per-user connection refcounts (see presence.py)
+        self.presence = create_presence(config['PRESENCE_URL'])
+        atexit.register(self.presence.release_all)
+        # KDF calls run on a few native threads so they never block the event loop
+        self.password_hasher = PasswordHasher(
+            config['PASSWORD_HASH_METHOD'],
+            max_workers=config['PASSWORD_HASH_WORKERS'],
+            async_mode=socketio.async_mode
+        )
+        self.auth_limiter = RateLimiter(config['AUTH_RATE_PER_MINUTE'] / 60.0, config['AUTH_RATE_BURST'])
+        # Socket.IO flow control: per-connection limits (None when off), paced
+        # room broadcasts and coalesced read receipts (see backpressure.py)
+        self.message_limiter = optional_limiter(config['SOCKET_MESSAGE_RATE'], config['SOCKET_MESSAGE_BURST'])
+        self.event_limiter = optional_limiter(config['SOCKET_EVENT_RATE'], config['SOCKET_EVENT_BURST'])
+        self.room_outbox = RoomOutbox(
+            lambda event, payload, room: socketio.emit(event, payload, to=room),
+            socketio.start_background_task, socketio.sleep,
+            rate=config['ROOM_EMIT_RATE'], burst=config['ROOM_EMIT_BURST'], maxlen=config['ROOM_QUEUE_SIZE'],
+            merge={'messages_read': merge_read_receipts}
+        )
+        self.read_coalescer = Coalescer(socketio.start_background_task, socketio.sleep,
+                                        config['MARK_READ_WINDOW'], 'mark_read', context=app.app_context)
+
+        # Held from numbering a message until it is buffered, so a flush never
+        # writes a message without every earlier-numbered one
+        self.message_order_lock = threading.Lock()
+        self.message_ids = None
+        self.message_writer = None
+        if config['MESSAGE_WRITE_BEHIND']:
+            self.message_ids = IdBlockAllocator(partial(reserve_message_ids, app))
+            self.message_writer = WriteBehindBuffer(
+                partial(write_message_batch, app),
+                interval=config['MESSAGE_FLUSH_INTERVAL'],
+                max_batch=config['MESSAGE_FLUSH_BATCH'],
+                permanent=permanent_write_error
+            )
+            # Buffered messages are written before the process exits
+            atexit.register(self.message_writer.close)
+
+        self._lock = threading.Lock()
+        self._match_index = None
+        self._image_hash_index = None
+
+    def warm(self):
+        # Set up the search and geo indexes (FTS5/R*Tree tables, rebuilt if
+        # stale) so the first item request does not pay for it. Needs an app
+        # context and a migrated schema.
+        self.search_index.warm()
+        self.geo_index.warm()
+
+    @property
+    def match_index(self):
+        # Lost/found candidate pairs, scored in memory (see matching.py)
+        if self._match_index is None:
+            with self._lock:
+                if self._match_index is None:
+                    from matching import MatchIndex
+                    self._match_index = MatchIndex(load_match_items)
+        return self._match_index
+
+    @property
+    def image_hash_index(self):
+        # Visual matching: multi-index hash tables over the pHash of every item photo
+        if self._image_hash_index is None:
+            with self._lock:
+                if self._image_hash_index is None:
+                    from perceptual import ImageHashIndex
+                    self._image_hash_index = ImageHashIndex(load_image_hashes)
+        return self._image_hash_index
+
+
+def optional_limiter(rate, burst):
+    return RateLimiter(rate, burst) if rate > 0 else None
+
+
+search_index = service('search_index')
+geo_index = service('geo_index')
+gazetteer = service('gazetteer')
+match_index = service('match_index')
+image_hash_index = service('image_hash_index')
+item_response_cache = service('item_response_cache')
+
+
+# Only open items are offered as matches or look-alikes
+def load_match_items(after_id):
+    return db.session.query(
+        Item.id, Item.title, Item.description, Item.location, Item.type, Item.created_at
+    ).filter(Item.id > after_id, Item.status == 'open').order_by(Item.id).all()
+
+
+def load_image_hashes(since=None):
+    # Every open hashed item, or those written at or after `since`; a closed
+    # one comes back without hashes so the index drops it
+    is_open = Item.status == 'open'
+    query = db.session.query(
+        Item.id, Item.type, case((is_open, Item.image_phash)), case((is_open, Item.image_dhash)), Item.updated_at
+    ).filter(Item.image_phash.isnot(None))
+    if since is None:
+        return query.filter(is_open).all()
+    return query.filter(Item.updated_at >= since).all()
+
+
+# Largest pHash distance (of 64 bits) still treated as the same object
+SIMILAR_MAX_DISTANCE = 12
+MATCH_LIMIT = 10
+
+
+def item_matches(item, limit=MATCH_LIMIT):
+    # Best opposite-type items for `item`, serialized with their scores.
+    # Rows deleted or closed by another worker drop out when hydrating.
+    ranked = match_index.matches(item, limit=limit)
+    if not ranked:
+        return []
+    found = {row.id: row for row in item_rows().filter(
+        Item.id.in_([i for i, _, _ in ranked]), Item.status == 'open'
+    ).all()}
+    return [
+        dict(item_row_to_dict(found[item_id]), score=score, scores=scores)
+        for item_id, score, scores in ranked if item_id in found
+    ]
+
+
+def set_item_status(item, status):
+    # Closing takes the item out of matching; reopening puts it back
+    item.status = status
+    item.updated_at = datetime.utcnow()
+    item.closed_at = None if status == 'open' else item.updated_at
+    db.session.commit()
+    item_response_cache.clear()
+    if status == 'open':
+        match_index.add(item)
+        if item.image_phash:
+            image_hash_index.add(item.id, item.type, item.image_phash, item.image_dhash)
+    else:
+        match_index.remove(item.id)
+        image_hash_index.remove(item.id)
+
+
+def remove_item(item):
+    # Deletes the item with its chats and drops it from every index and
+    # cache. The file may be shared with other items; the garbage collector
+    # removes it once nothing references it.
+    item_id = item.id
+    # Buffered messages first, so none is written for the item afterwards
+    flush_messages()
+    release_upload(item.image)
+    search_index.remove(item)
+    geo_index.remove(item)
+    # Conversations refer to their last message, so they go first; rooms
+    # are named item-{item_id}-{buyer_id}
+    db.session.execute(delete(Conversation).where(Conversation.item_id == item_id))
+    db.session.execute(delete(Message).where(Message.room.like(f"item-{item_id}-%")))
+    db.session.delete(item)
+    db.session.commit()
+    item_response_cache.clear()
+    match_index.remove(item_id)
+    image_hash_index.remove(item_id)
+    # SQLite may hand this id to the next item; forget cached room owners
+    room_participants_cache.clear()
+
+
+# Image pipeline callbacks, run in an app context. Both only apply if the
+# row still points at the processed file.
+def store_item_image_meta(item_id, meta):
+    updated = db.session.execute(update(Item).where(
+        Item.id == item_id, Item.image == meta['source']
+    ).values(image_meta=json.dumps(meta), image_phash=meta['phash'], image_dhash=meta['dhash'],
+             updated_at=datetime.utcnow())).rowcount
+    db.session.commit()
+    if updated:
+        # Closed items keep their hashes for a reopen (set_item_status) but
+        # stay out of matching until then
+        kind, status = db.session.execute(select(Item.type, Item.status).where(Item.id == item_id)).one()
+        if status == 'open':
+            image_hash_index.add(item_id, kind, meta['phash'], meta['dhash'])
+    item_response_cache.clear()
+
+
+def store_profile_image_meta(user_id, meta):
+    db.session.execute(update(User).where(
+        User.id == user_id, User.profile_image == meta['source']
+    ).values(profile_image_meta=json.dumps(meta)))
+    db.session.commit()
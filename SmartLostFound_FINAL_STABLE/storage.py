@@ -0,0 +1,103 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer, busy_timeout makes a writer wait for the lock instead of
+# failing with "database is locked", and synchronous=NORMAL is durable across
+# application crashes in WAL mode (only an OS crash can lose the last commits).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,             # ms
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,   # bytes of the file read through mmap
+    'cache_size': -20000,             # negative means KiB, so ~20MB per connection
+    'temp_store': 'MEMORY',
+}
+
+# Pool defaults for server databases and file-backed SQLite. Under eventlet
+# every greenthread that touches the database holds a connection, so the
+# pool is sized well above SQLAlchemy's default of 5 and checkouts time out
+# quickly rather than piling up behind a slow query.
+POOL_SIZE = 10
+MAX_OVERFLOW = 20
+POOL_TIMEOUT = 10
+POOL_RECYCLE = 1800
+
+
+def database_uri(url, sqlite_path):
+    # DATABASE_URL when set, else the bundled SQLite file. Hosted Postgres
+    # often hands out postgres://, which SQLAlchemy no longer accepts.
+    if not url:
+        return 'sqlite:///' + sqlite_path
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def is_memory_sqlite(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def engine_options(uri, pool_size=None, max_overflow=None):
+    # SQLALCHEMY_ENGINE_OPTIONS for `uri`
+    pool_size = POOL_SIZE if pool_size is None else pool_size
+    max_overflow = MAX_OVERFLOW if max_overflow is None else max_overflow
+    if is_memory_sqlite(uri):
+        # One shared connection; pool options do not apply
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': POOL_TIMEOUT,
+    }
+    if is_sqlite(uri):
+        # Connections move between threads (socket handlers, the image
+        # pipeline, the GC loop); the pool hands each to one user at a time
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = POOL_RECYCLE
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas=None):
+    # Registers a connect hook on `engine`; a no-op for other databases
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def configure_storage(app):
+    # Fills in the database URI and engine options from DATABASE_URL,
+    # DB_POOL_SIZE and DB_MAX_OVERFLOW (see config.py); call before db.init_app
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    uri = database_uri(app.config.get('DATABASE_URL'), os.path.join(basedir, 'database.db'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+        uri,
+        pool_size=app.config.get('DB_POOL_SIZE', POOL_SIZE),
+        max_overflow=app.config.get('DB_MAX_OVERFLOW', MAX_OVERFLOW),
+    ))
+
+
+def init_storage(app, db):
+    # Call right after db.init_app(app), before anything connects
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+# The app modules are top-level scripts next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+# Each test gets its own database and upload folder; the cheap KDF keeps
+# registration fast
+TEST_CONFIG = {
+    'SECRET_KEY': 'test',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'LOG_SAMPLE_RATE': 0,
+    'AUTO_MIGRATE': True,
+    'BACKGROUND_TASKS': False,
+}
+
+
+@pytest.fixture
+def make_app(tmp_path, capsys):
+    def make(**overrides):
+        config = dict(TEST_CONFIG,
+                      DATABASE_URL='sqlite:///' + str(tmp_path / 'test.db'),
+                      UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+        config.update(overrides)
+        app = create_app(config)
+        capsys.readouterr()  # migration progress
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(app):
+    # login(email) -> (test client with a session, user id); registers on first use
+    def login(email, username=None):
+        client = app.test_client()
+        client.post('/api/register', json={"email": email, "password": "password123",
+                                           "username": username or email.split('@')[0]})
+        response = client.post('/api/login', json={"email": email, "password": "password123"})
+        assert response.status_code == 200, response.get_json()
+        return client, client.get('/api/user/me').get_json()["user"]["id"]
+    return login
+
+
+@pytest.fixture
+def post_item(app):
+    # post_item(client, **form) -> the created item's JSON
+    def post_item(client, **form):
+        data = {"title": "Black umbrella", "description": "Folding", "location": "Gym",
+                "contact": "555", "type": "lost"}
+        data.update(form)
+        response = client.post('/api/items', data=data)
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()["item"]
+    return post_item
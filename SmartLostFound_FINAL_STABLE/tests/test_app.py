@@ -0,0 +1,19 @@
+from flask_socketio import SocketIO
+
+from filestore import upload_gc_loop
+from retention import retention_loop
+
+
+def started_tasks(make_app, monkeypatch, **overrides):
+    tasks = []
+    monkeypatch.setattr(SocketIO, 'start_background_task', lambda self, fn, *args: tasks.append(fn))
+    make_app(**overrides)
+    return tasks
+
+
+def test_create_app_starts_background_tasks(make_app, monkeypatch):
+    assert started_tasks(make_app, monkeypatch, BACKGROUND_TASKS=True) == [upload_gc_loop, retention_loop]
+
+
+def test_background_tasks_can_be_turned_off(make_app, monkeypatch):
+    assert started_tasks(make_app, monkeypatch) == []
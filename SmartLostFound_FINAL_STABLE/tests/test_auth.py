@@ -0,0 +1,62 @@
+import pytest
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(AUTH_RATE_PER_MINUTE=0.001, AUTH_RATE_BURST=3)
+
+
+def register(client, email, address='10.0.0.1', **headers):
+    return client.post('/api/register', json={"email": email, "password": "password123", "username": "u"},
+                       environ_base={'REMOTE_ADDR': address}, headers=headers)
+
+
+def attempt(client, email, password, address='10.0.0.1', **headers):
+    return client.post('/api/login', json={"email": email, "password": password},
+                       environ_base={'REMOTE_ADDR': address}, headers=headers)
+
+
+def test_failed_logins_are_limited_per_account(app, client):
+    register(client, 'a@example.com')
+    codes = [attempt(client, 'a@example.com', 'wrong', address=f'10.0.1.{n}').status_code for n in range(4)]
+    assert codes == [401, 401, 401, 429]
+    response = attempt(client, 'a@example.com', 'password123', address='10.0.2.1')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_failed_logins_are_limited_per_address(app, client):
+    codes = [attempt(client, f'{n}@example.com', 'wrong').status_code for n in range(4)]
+    assert codes == [401, 401, 401, 429]
+    assert attempt(client, 'x@example.com', 'wrong', address='10.0.0.2').status_code == 401
+
+
+def test_successful_logins_are_not_charged(app, client):
+    register(client, 'a@example.com', address='10.9.9.9')
+    for _ in range(10):
+        assert attempt(client, 'a@example.com', 'password123').status_code == 200
+    assert attempt(client, 'b@example.com', 'wrong').status_code == 401
+
+
+def test_registration_is_limited_per_address(app, client):
+    codes = [register(client, f'{n}@example.com').status_code for n in range(4)]
+    assert codes == [201, 201, 201, 429]
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(app, client):
+    # Every attempt comes from the same peer, whatever it claims
+    codes = [attempt(client, f'{n}@example.com', 'wrong', **{'X-Forwarded-For': f'1.2.3.{n}'}).status_code
+             for n in range(4)]
+    assert codes[-1] == 429
+
+
+def test_client_address_comes_from_trusted_proxy(make_app):
+    client = make_app(AUTH_RATE_PER_MINUTE=0.001, AUTH_RATE_BURST=3, PROXY_FIX_X_FOR=1).test_client()
+    proxy = '10.0.0.1'
+    for n in range(3):
+        attempt(client, f'{n}@example.com', 'wrong', address=proxy, **{'X-Forwarded-For': '1.2.3.4'})
+    assert attempt(client, 'x@example.com', 'wrong', address=proxy,
+                   **{'X-Forwarded-For': '1.2.3.4'}).status_code == 429
+    # Another client behind the same proxy has its own allowance
+    assert attempt(client, 'y@example.com', 'wrong', address=proxy,
+                   **{'X-Forwarded-For': '5.6.7.8'}).status_code == 401
@@ -0,0 +1,169 @@
+import pytest
+
+import ratelimit
+from backpressure import RoomOutbox, Coalescer, merge_read_receipts
+
+
+class Clock:
+    # Stands in for time.monotonic and the server's sleep; background tasks
+    # are collected and run by the test
+    def __init__(self):
+        self.now = 1000.0
+        self.tasks = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def spawn(self, fn, *args):
+        self.tasks.append((fn, args))
+
+    def run_tasks(self):
+        while self.tasks:
+            fn, args = self.tasks.pop(0)
+            fn(*args)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def outbox(clock, sent, **options):
+    options = dict(dict(rate=1, burst=2, maxlen=3, merge={'messages_read': merge_read_receipts}), **options)
+    return RoomOutbox(lambda event, payload, room: sent.append((event, payload)),
+                      clock.spawn, clock.sleep, **options)
+
+
+def test_within_rate_events_go_out_at_once(clock):
+    sent = []
+    box = outbox(clock, sent)
+    box.send('message', 1, 'r')
+    box.send('message', 2, 'r')
+    assert sent == [('message', 1), ('message', 2)]
+    assert clock.tasks == []
+
+
+def test_over_rate_events_queue_in_order(clock):
+    sent = []
+    box = outbox(clock, sent)
+    for n in range(5):
+        box.send('message', n, 'r')
+    assert sent == [('message', 0), ('message', 1)]
+    assert box.queued() == 3
+    clock.run_tasks()
+    assert sent == [('message', n) for n in range(5)]
+    assert box.queued() == 0 and box.queues == {}
+
+
+def test_read_receipts_merge_while_queued(clock):
+    sent = []
+    box = outbox(clock, sent, burst=1)
+    box.send('message', 0, 'r')
+    box.send('messages_read', {'room': 'r', 'user_id': 7, 'read_up_to': 1}, 'r')
+    box.send('messages_read', {'room': 'r', 'user_id': 7, 'read_up_to': 3}, 'r')
+    assert box.queued() == 1
+    clock.run_tasks()
+    assert sent[-1] == ('messages_read', {'room': 'r', 'user_id': 7, 'read_up_to': 3})
+
+
+def test_read_receipts_from_different_readers_stay_apart(clock):
+    sent = []
+    box = outbox(clock, sent, burst=1)
+    box.send('message', 0, 'r')
+    box.send('messages_read', {'room': 'r', 'user_id': 7, 'read_up_to': 1}, 'r')
+    box.send('messages_read', {'room': 'r', 'user_id': 8, 'read_up_to': 2}, 'r')
+    assert box.queued() == 2
+    clock.run_tasks()
+    assert [payload['user_id'] for event, payload in sent if event == 'messages_read'] == [7, 8]
+
+
+def test_overflow_drops_the_tail_then_resyncs(clock):
+    sent = []
+    box = outbox(clock, sent)
+    for n in range(8):
+        box.send('message', n, 'r')
+    # 0-1 sent, 2-4 queued, 5-7 dropped
+    clock.run_tasks()
+    events = [payload for event, payload in sent if event == 'message']
+    assert events == [0, 1, 2, 3, 4]
+    assert sent[-1] == ('resync', {'room': 'r', 'dropped': 3})
+
+
+def test_nothing_is_delivered_after_a_gap_before_the_resync(clock):
+    sent = []
+    box = outbox(clock, sent)
+    for n in range(6):
+        box.send('message', n, 'r')
+    # Room is full and has dropped 5; space frees up but 6 must not
+    # overtake the gap
+    box.queues['r'].popleft()
+    box.send('message', 6, 'r')
+    clock.run_tasks()
+    delivered = [payload for event, payload in sent if event == 'message']
+    assert delivered == sorted(delivered)
+    assert 6 not in delivered
+    assert sent[-1] == ('resync', {'room': 'r', 'dropped': 2})
+
+    # Afterwards the room is back to normal
+    clock.now += 10
+    box.send('message', 7, 'r')
+    assert sent[-1] == ('message', 7)
+
+
+def test_rate_zero_never_queues(clock):
+    sent = []
+    box = outbox(clock, sent, rate=0)
+    for n in range(50):
+        box.send('message', n, 'r')
+    assert len(sent) == 50 and clock.tasks == []
+
+
+def test_coalescer_runs_first_and_last_call(clock):
+    calls = []
+    coalescer = Coalescer(clock.spawn, clock.sleep, 0.5, 'test')
+    assert coalescer.submit('k', calls.append, 1) is True
+    for n in range(2, 6):
+        assert coalescer.submit('k', calls.append, n) is False
+    assert calls == [1]
+    clock.run_tasks()
+    assert calls == [1, 5]
+    # The window is closed again
+    assert coalescer.submit('k', calls.append, 6) is True
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(SOCKET_MESSAGE_RATE=0.01, SOCKET_MESSAGE_BURST=3, ROOM_EMIT_RATE=0)
+
+
+def test_socket_messages_are_rate_limited_per_connection(app, login, post_item):
+    seller_http, seller_id = login('seller@example.com')
+    buyer_http, buyer_id = login('buyer@example.com')
+    item = post_item(seller_http)
+    room = f"item-{item['id']}-{buyer_id}"
+    sockets = app.extensions['socketio']
+    seller = sockets.test_client(app, flask_test_client=seller_http)
+    buyer = sockets.test_client(app, flask_test_client=buyer_http)
+    for socket in (seller, buyer):
+        socket.emit('join', {"room": room})
+        socket.get_received()
+
+    for n in range(5):
+        buyer.emit('message', {"room": room, "user": "buyer", "sender_id": buyer_id,
+                               "text": f"m{n}", "timestamp": "1"})
+    received = [e['name'] for e in buyer.get_received()]
+    assert received.count('message') == 3
+    assert received.count('rate_limited') == 2
+    assert [e['name'] for e in seller.get_received()].count('message') == 3
+
+    # The seller's connection has its own allowance
+    seller.emit('message', {"room": room, "user": "seller", "sender_id": seller_id,
+                            "text": "hi", "timestamp": "1"})
+    assert [e['name'] for e in seller.get_received()] == ['message']
+    seller.disconnect()
+    buyer.disconnect()
@@ -0,0 +1,83 @@
+from sqlalchemy import event
+
+from extensions import db
+from models import Conversation, Message
+
+
+def chat(app, login, post_item):
+    seller_http, seller_id = login('seller@example.com')
+    buyer_http, buyer_id = login('buyer@example.com')
+    item = post_item(seller_http)
+    room = f"item-{item['id']}-{buyer_id}"
+    sockets = app.extensions['socketio']
+    seller = sockets.test_client(app, flask_test_client=seller_http)
+    buyer = sockets.test_client(app, flask_test_client=buyer_http)
+    return room, (seller, seller_id), (buyer, buyer_id)
+
+
+def say(socket, room, sender_id, text):
+    socket.emit('message', {"room": room, "user": "u", "sender_id": sender_id, "text": text,
+                            "timestamp": "1"})
+
+
+def history(socket, room):
+    socket.emit('join', {"room": room})
+    return [e['args'][0] for e in socket.get_received() if e['name'] == 'history'][-1]['messages']
+
+
+def test_joining_marks_read_without_touching_messages(app, login, post_item):
+    room, (seller, seller_id), (buyer, buyer_id) = chat(app, login, post_item)
+    buyer.emit('join', {"room": room})
+    for n in range(3):
+        say(buyer, room, buyer_id, f"m{n}")
+    buyer.get_received()
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            seller.emit('join', {"room": room})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        last_id = db.session.query(db.func.max(Message.id)).scalar()
+        conversation = Conversation.query.filter_by(room=room).one()
+        assert (conversation.seller_read_id, conversation.seller_unread) == (last_id, 0)
+        assert [m.status for m in Message.query.filter_by(room=room)] == ['delivered'] * 3
+
+    assert not [s for s in statements if s.lstrip().upper().startswith('UPDATE MESSAGE')]
+    receipts = [e['args'][0] for e in buyer.get_received() if e['name'] == 'messages_read']
+    assert receipts == [{'room': room, 'user_id': seller_id, 'read_up_to': last_id}]
+    seller.disconnect()
+    buyer.disconnect()
+
+
+def test_history_status_follows_the_recipients_watermark(app, login, post_item):
+    room, (seller, seller_id), (buyer, buyer_id) = chat(app, login, post_item)
+    buyer.emit('join', {"room": room})
+    say(buyer, room, buyer_id, "is this mine?")
+    assert [m['status'] for m in history(buyer, room)] == ['delivered']
+
+    # Both are connected, so messages are 'delivered'. The seller reads the
+    # question; their own reply stays unread until the buyer looks
+    history(seller, room)
+    say(seller, room, seller_id, "maybe")
+    assert [m['status'] for m in history(seller, room)] == ['read', 'delivered']
+    assert [m['status'] for m in history(buyer, room)] == ['read', 'read']
+    seller.disconnect()
+    buyer.disconnect()
+
+
+def test_nothing_unread_sends_no_receipt(app, login, post_item):
+    room, (seller, _), (buyer, buyer_id) = chat(app, login, post_item)
+    buyer.emit('join', {"room": room})
+    say(buyer, room, buyer_id, "hello")
+    history(seller, room)
+    buyer.get_received()
+    history(seller, room)
+    assert 'messages_read' not in [e['name'] for e in buyer.get_received()]
+    seller.disconnect()
+    buyer.disconnect()
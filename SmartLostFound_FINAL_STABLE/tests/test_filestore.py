@@ -0,0 +1,90 @@
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+from sqlalchemy import update
+
+from extensions import db
+from filestore import collect_upload_garbage
+from models import StoredFile
+from uploads import stored_paths
+
+
+def photo(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def shared(app, login, post_item):
+    # Two items uploaded with the same bytes, and the one stored file they share
+    owner, _ = login('owner@example.com')
+    items = [post_item(owner, image=(photo((0, 0, 200)), name)) for name in ('a.jpg', 'b.jpg')]
+    # Thumbnails are written off the request; let them land before looking
+    app.extensions['lostfound'].image_pipeline.shutdown()
+    path = items[0]['image'].split('static/uploads/', 1)[1]
+    return owner, items, path
+
+
+def stored(app, path):
+    # (refcount or None without a row, whether the file and its variants are on disk)
+    folder = app.config['UPLOAD_FOLDER']
+    row = db.session.get(StoredFile, path)
+    on_disk = [os.path.exists(os.path.join(folder, name)) for name in stored_paths(path)]
+    assert len(set(on_disk)) == 1, on_disk
+    return (row.refcount if row else None), on_disk[0]
+
+
+def idle(path, seconds):
+    # Backdates the last reference change, as if `seconds` had passed
+    db.session.execute(update(StoredFile).where(StoredFile.path == path).values(
+        updated_at=datetime.utcnow() - timedelta(seconds=seconds)))
+    db.session.commit()
+
+
+def test_identical_uploads_share_one_file(app, shared):
+    _, items, path = shared
+    assert items[1]['image'] == items[0]['image']
+    with app.app_context():
+        assert StoredFile.query.count() == 1
+        assert stored(app, path) == (2, True)
+    files = [name for _, _, names in os.walk(app.config['UPLOAD_FOLDER']) for name in names]
+    assert sorted(files) == sorted(os.path.basename(name) for name in stored_paths(path))
+
+
+def test_deleting_every_item_releases_the_file(app, shared):
+    owner, items, path = shared
+    for item in items:
+        assert owner.delete(f"/api/items/{item['id']}").status_code == 200
+    with app.app_context():
+        # Unreferenced, but kept until the collector gets to it
+        assert stored(app, path) == (0, True)
+
+
+def test_gc_waits_for_the_grace_period(app, shared):
+    owner, items, path = shared
+    for item in items:
+        owner.delete(f"/api/items/{item['id']}")
+    grace = app.config['UPLOAD_GC_GRACE']
+    with app.app_context():
+        idle(path, grace - 60)
+        assert collect_upload_garbage() == 0
+        assert stored(app, path) == (0, True)
+
+        idle(path, grace + 60)
+        assert collect_upload_garbage() == 1
+        assert stored(app, path) == (None, False)
+
+
+def test_deleting_one_item_keeps_the_shared_file(app, shared):
+    owner, items, path = shared
+    assert owner.delete(f"/api/items/{items[0]['id']}").status_code == 200
+    with app.app_context():
+        idle(path, app.config['UPLOAD_GC_GRACE'] + 60)
+        assert collect_upload_garbage() == 0
+        assert stored(app, path) == (1, True)
+    assert owner.get(f"/api/items/{items[1]['id']}").get_json()['item']['image'] == items[0]['image']
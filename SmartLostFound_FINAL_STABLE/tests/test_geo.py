@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+from extensions import db
+from config import BASEDIR
+from geo import Gazetteer, GeoIndex, GeohashBackend, RtreeBackend, geohash_encode, haversine_km
+
+LIBRARY = (12.97160, 77.59460)
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    gazetteer = tmp_path / 'gazetteer.csv'
+    gazetteer.write_text(
+        "name,latitude,longitude,aliases\n"
+        "Library,12.97160,77.59460,Central Library\n"
+        "Sports Field,12.97385,77.59645,Football Field\n"
+    )
+    return make_app(GAZETTEER_PATH=str(gazetteer))
+
+
+@pytest.fixture
+def located(app, login, post_item):
+    client, _ = login('geo@example.com')
+    items = {
+        'library': post_item(client, title="Wallet", location="near the Library entrance"),
+        'field': post_item(client, title="Ball", location="Sports Field", type="found"),
+        'exact': post_item(client, title="Keys", location="bench", latitude="12.9717", longitude="77.5947"),
+        'nowhere': post_item(client, title="Pen", location="somewhere else"),
+    }
+    return client, items
+
+
+def near(client, query):
+    response = client.get('/api/items?' + query)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_items_are_placed_from_coordinates_or_gazetteer(located):
+    _, items = located
+    assert (items['library']['latitude'], items['library']['longitude']) == LIBRARY
+    assert items['exact']['latitude'] == 12.9717
+    assert items['nowhere']['latitude'] is None
+
+
+def test_near_returns_items_within_radius_nearest_first(located):
+    client, items = located
+    page = near(client, 'near=12.9716,77.5946&radius=0.1')
+    assert [i['id'] for i in page['items']] == [items['library']['id'], items['exact']['id']]
+    distances = [i['distance_km'] for i in page['items']]
+    assert distances == sorted(distances) and distances[-1] <= 0.1
+
+    wider = near(client, 'near=Library&radius=1')
+    assert items['field']['id'] in [i['id'] for i in wider['items']]
+    assert items['nowhere']['id'] not in [i['id'] for i in wider['items']]
+
+
+def test_near_filters_by_type_and_pages(located):
+    client, items = located
+    assert [i['id'] for i in near(client, 'near=Library&radius=2&type=found')['items']] == [items['field']['id']]
+
+    first = near(client, 'near=Library&radius=2&limit=2')
+    second = near(client, 'near=Library&radius=2&limit=2&cursor=' + first['next_cursor'])
+    ids = [i['id'] for i in first['items'] + second['items']]
+    assert len(ids) == len(set(ids)) == 3
+    assert second['next_cursor'] is None
+
+
+@pytest.mark.parametrize('query', [
+    'near=Nowhere', 'near=1,2&radius=-1', 'near=1,2&radius=500', 'near=1,2&radius=abc', 'near=1,2&q=wallet',
+])
+def test_invalid_near_queries(located, query):
+    client, _ = located
+    assert client.get('/api/items?' + query).status_code == 400
+
+
+def test_distance_field_needs_near(located):
+    client, _ = located
+    assert near(client, 'near=Library&fields=id,distance_km')['items'][0].keys() == {'id', 'distance_km'}
+    assert client.get('/api/items?fields=id,distance_km').status_code == 400
+    assert client.get('/api/user/items?fields=distance_km').status_code == 400
+
+
+def test_deleted_items_leave_the_index(located):
+    client, items = located
+    assert client.delete(f"/api/items/{items['exact']['id']}").status_code == 200
+    assert [i['id'] for i in near(client, 'near=12.9716,77.5946&radius=0.1')['items']] == [items['library']['id']]
+
+
+def test_geohash_backend_matches_rtree(app, located):
+    with app.app_context():
+        index = app.extensions['lostfound'].geo_index
+        index.near(*LIBRARY, 1)
+        assert isinstance(index.backend, RtreeBackend)
+        fallback = GeoIndex(db)
+        fallback.backend = GeohashBackend(db)
+        for radius in (0.05, 0.5, 5):
+            assert fallback.near(*LIBRARY, radius) == index.near(*LIBRARY, radius)
+
+
+def test_geohash_and_distance():
+    assert geohash_encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert haversine_km(*LIBRARY, *LIBRARY) == 0
+    assert 0.3 < haversine_km(*LIBRARY, 12.97385, 77.59645) < 0.35
+
+
+@pytest.mark.parametrize('location, place', [
+    ("Library", "Library"),
+    ("lib", "Library"),
+    ("near the Central Library", "Library"),
+    ("Ground floor of Lab 3", "Lab 3"),
+    ("Cafe table by the Bus Stop", "Bus Stop"),
+    ("Playground", "Sports Field"),
+    ("left at the campus bus stop shelter", "Bus Stop"),
+    ("lib books", None),
+    ("ground floor", None),
+])
+def test_gazetteer_lookup(location, place):
+    gazetteer = Gazetteer(os.path.join(BASEDIR, 'gazetteer.csv'))
+    expected = gazetteer.lookup(place) if place else None
+    assert gazetteer.lookup(location) == expected
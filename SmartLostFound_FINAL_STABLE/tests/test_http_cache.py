@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def listed(client, login, post_item):
+    owner, _ = login('owner@example.com')
+    return owner, [post_item(owner, title=f"Item {n}") for n in range(3)]
+
+
+def test_item_list_etag_and_304(listed, post_item):
+    owner, items = listed
+    response = owner.get('/api/items?limit=2')
+    etag = response.headers['ETag']
+    again = owner.get('/api/items?limit=2', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.get_data() == b''
+    # Another query string is another resource
+    assert owner.get('/api/items?limit=3', headers={'If-None-Match': etag}).status_code == 200
+
+    post_item(owner, title="Changes the list")
+    changed = owner.get('/api/items?limit=2', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_item_detail_etag_follows_status(listed):
+    owner, items = listed
+    path = f"/api/items/{items[0]['id']}"
+    etag = owner.get(path).headers['ETag']
+    assert owner.get(path, headers={'If-None-Match': etag}).status_code == 304
+    owner.post(path + '/status', json={"status": "claimed"})
+    response = owner.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json()['item']['status'] == 'claimed'
+    assert owner.get('/api/items/999999').status_code == 404
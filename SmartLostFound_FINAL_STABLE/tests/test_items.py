@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import text
+
+from extensions import db
+from models import Conversation, Message
+
+
+def chat(app, http, room, sender_id, *texts):
+    socket = app.extensions['socketio'].test_client(app, flask_test_client=http)
+    socket.emit('join', {"room": room})
+    for body in texts:
+        socket.emit('message', {"room": room, "user": "u", "sender_id": sender_id, "text": body, "timestamp": "1"})
+    socket.disconnect()
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_deleting_an_item_removes_its_chats(make_app, write_behind):
+    app = make_app(MESSAGE_WRITE_BEHIND=write_behind, MESSAGE_FLUSH_INTERVAL=60, SOCKET_MESSAGE_RATE=0)
+    seller = app.test_client()
+    seller.post('/api/register', json={"email": "s@example.com", "password": "password123", "username": "s"})
+    seller.post('/api/login', json={"email": "s@example.com", "password": "password123"})
+    buyer = app.test_client()
+    buyer.post('/api/register', json={"email": "b@example.com", "password": "password123", "username": "b"})
+    buyer.post('/api/login', json={"email": "b@example.com", "password": "password123"})
+    buyer_id = buyer.get('/api/user/me').get_json()["user"]["id"]
+    form = {"title": "Hat", "description": "d", "location": "Gym", "contact": "1"}
+    item_id = seller.post('/api/items', data=form).get_json()["item"]["id"]
+    other_id = seller.post('/api/items', data=form).get_json()["item"]["id"]
+    room, other_room = f"item-{item_id}-{buyer_id}", f"item-{other_id}-{buyer_id}"
+    chat(app, buyer, room, buyer_id, "is it mine?", "blue one")
+    chat(app, buyer, other_room, buyer_id, "and this?")
+
+    assert seller.delete(f"/api/items/{item_id}").status_code == 200
+    with app.app_context():
+        assert Conversation.query.filter_by(item_id=item_id).count() == 0
+        assert Message.query.filter_by(room=room).count() == 0
+        # What Postgres would refuse to commit
+        assert db.session.execute(text("PRAGMA foreign_key_check")).all() == []
+        assert [m.text for m in Message.query.filter_by(room=other_room)] == ["and this?"]
+    assert [c["room"] for c in buyer.get('/api/chats').get_json()["chats"]] == [other_room]
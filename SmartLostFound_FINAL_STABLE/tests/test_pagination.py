@@ -0,0 +1,58 @@
+import pytest
+
+
+@pytest.fixture
+def listed(client, login, post_item):
+    owner, _ = login('owner@example.com')
+    items = [post_item(owner, title=f"Item {n}", type="found" if n % 2 else "lost") for n in range(5)]
+    return owner, items
+
+
+def pages(client, query):
+    # Every page of /api/items?query, following next_cursor
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/items?' + query + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200, response.get_json()
+        page = response.get_json()
+        seen.append(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return seen
+
+
+def test_cursor_pages_newest_first(listed):
+    owner, items = listed
+    result = pages(owner, 'limit=2')
+    assert [len(page) for page in result] == [2, 2, 1]
+    assert [i['id'] for page in result for i in page] == [i['id'] for i in reversed(items)]
+
+
+def test_cursor_survives_new_items(listed, post_item):
+    owner, items = listed
+    first = owner.get('/api/items?limit=2').get_json()
+    post_item(owner, title="Newer")
+    second = owner.get('/api/items?limit=2&cursor=' + first['next_cursor']).get_json()
+    assert [i['id'] for i in second['items']] == [items[2]['id'], items[1]['id']]
+
+
+def test_filters_and_search_pages(listed):
+    owner, items = listed
+    found = [i['id'] for page in pages(owner, 'type=found&limit=1') for i in page]
+    assert found == [items[3]['id'], items[1]['id']]
+    searched = [i['id'] for page in pages(owner, 'q=item&limit=2') for i in page]
+    assert sorted(searched) == sorted(i['id'] for i in items)
+
+
+def test_fields_projects_each_item(listed):
+    owner, items = listed
+    page = owner.get('/api/items?limit=2&fields=id,title').get_json()
+    assert page['items'] == [{'id': items[4]['id'], 'title': 'Item 4'}, {'id': items[3]['id'], 'title': 'Item 3'}]
+    mine = owner.get('/api/user/items?fields=id').get_json()
+    assert [i['id'] for i in mine['items']] == [i['id'] for i in reversed(items)]
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=abc', 'cursor=%%%', 'cursor=WzFd', 'fields=id,password'])
+def test_invalid_pagination(listed, query):
+    owner, _ = listed
+    assert owner.get('/api/items?' + query).status_code == 400
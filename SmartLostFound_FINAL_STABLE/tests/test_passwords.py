@@ -0,0 +1,24 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordHasher, hash_prefix
+
+
+@pytest.mark.parametrize('method', [
+    'scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000',
+])
+def test_prefix_matches_werkzeug(method):
+    assert hash_prefix(method) == generate_password_hash('x', method).split('$', 1)[0]
+
+
+@pytest.mark.parametrize('method', ['md5', 'scrypt:1:2', 'pbkdf2:a:b:c', 'pbkdf2:sha256:many'])
+def test_invalid_methods_fail_at_startup(method):
+    with pytest.raises(ValueError):
+        PasswordHasher(method)
+
+
+def test_needs_rehash_after_method_change():
+    old = PasswordHasher('pbkdf2:sha256:1000')
+    stored = old.hash('secret')
+    assert old.verify(stored, 'secret') and not old.needs_rehash(stored)
+    assert PasswordHasher('pbkdf2:sha256:2000').needs_rehash(stored)
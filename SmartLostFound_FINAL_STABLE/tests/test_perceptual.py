@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import Item
+from perceptual import ImageHashIndex
+from services import load_image_hashes, set_item_status, store_item_image_meta
+
+T0 = datetime(2026, 1, 1)
+
+
+class Loader:
+    # Rows (id, type, phash, dhash, changed_at) as a database would return them
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __call__(self, since):
+        self.calls.append(since)
+        if since is None:
+            return [row for row in self.rows if row[2] is not None]
+        return [row for row in self.rows if row[4] >= since]
+
+
+def test_similar_ranks_by_phash_then_dhash():
+    query = '0000000000000000'
+    loader = Loader([
+        # phash distance 2, dhash distance 0: sum 2
+        (1, 'found', '0000000000000003', '0000000000000000', T0),
+        # phash distance 1, dhash distance 5: closer photo despite the sum
+        (2, 'found', '0000000000000001', '000000000000001f', T0),
+        (3, 'found', '0000000000000001', '0000000000000001', T0),
+        (4, 'lost', '0000000000000000', '0000000000000000', T0),
+    ])
+    index = ImageHashIndex(loader)
+    assert index.similar(query, query, 'found') == [(3, 1, 1), (2, 1, 5), (1, 2, 0)]
+
+
+def test_refresh_loads_only_what_changed():
+    loader = Loader([(1, 'found', '00000000000000ff', '0000000000000000', T0)])
+    index = ImageHashIndex(loader, refresh_interval=0, overlap=60)
+    assert [r[0] for r in index.similar('00000000000000ff', '0' * 16, 'found')] == [1]
+    assert loader.calls == [None]
+
+    # Hashed and closed elsewhere since the first load
+    later = T0 + timedelta(minutes=5)
+    loader.rows = [(1, 'found', None, None, later), (2, 'found', '00000000000000fe', '0000000000000000', later)]
+    assert [r[0] for r in index.similar('00000000000000ff', '0' * 16, 'found')] == [2]
+    assert loader.calls[1] == T0 - timedelta(seconds=60)
+    assert loader.calls[2:] == []
+    index.similar('00000000000000ff', '0' * 16, 'found')
+    assert loader.calls[-1] == later - timedelta(seconds=60)
+
+
+def test_loader_returns_changed_rows(app, login, post_item):
+    client, _ = login('photos@example.com')
+    first, second = post_item(client), post_item(client)
+    with app.app_context():
+        for item in (first, second):
+            db.session.execute(db.update(Item).where(Item.id == item['id']).values(image='x.jpg'))
+            store_item_image_meta(item['id'], {'source': 'x.jpg', 'phash': '00000000000000ff', 'dhash': '0' * 16})
+        assert sorted(row[0] for row in load_image_hashes()) == [first['id'], second['id']]
+
+        since = db.session.get(Item, second['id']).updated_at + timedelta(microseconds=1)
+        assert load_image_hashes(since) == []
+        set_item_status(db.session.get(Item, first['id']), 'resolved')
+        (row,) = load_image_hashes(since)
+        assert row[0] == first['id'] and row[2] is None
+        assert [row[0] for row in load_image_hashes()] == [second['id']]
+
+
+def test_hashes_of_closed_items_wait_for_a_reopen(app, login, post_item):
+    client, _ = login('photos@example.com')
+    item = post_item(client)
+    index = app.extensions['lostfound'].image_hash_index
+    with app.app_context():
+        set_item_status(db.session.get(Item, item['id']), 'claimed')
+        # The pipeline finishes after the item was closed
+        db.session.execute(db.update(Item).where(Item.id == item['id']).values(image='x.jpg'))
+        store_item_image_meta(item['id'], {'source': 'x.jpg', 'phash': '00000000000000ff', 'dhash': '0' * 16})
+        assert item['id'] not in index.entries
+        assert db.session.get(Item, item['id']).image_phash == '00000000000000ff'
+
+        set_item_status(db.session.get(Item, item['id']), 'open')
+        assert index.entries[item['id']][1] == '00000000000000ff'
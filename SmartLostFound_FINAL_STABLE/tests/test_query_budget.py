@@ -0,0 +1,68 @@
+import io
+
+import pytest
+from flask import Blueprint
+from PIL import Image
+from sqlalchemy import text
+
+from extensions import db
+from models import StoredFile
+from querycount import QueryBudgetExceeded, query_budget
+
+
+@pytest.fixture(params=[True, False], ids=['warmed', 'lazy'])
+def app(make_app, request):
+    # Strict: a view over its query_budget raises instead of logging. Lazy
+    # apps set the indexes up inside the first request, which must not count.
+    return make_app(QUERY_BUDGET_STRICT=True, WARM_INDEXES=request.param)
+
+
+def test_strict_mode_raises(app, client):
+    extra = Blueprint('extra', __name__)
+
+    @extra.route('/two-queries')
+    @query_budget(1)
+    def two_queries():
+        db.session.execute(text("SELECT 1"))
+        db.session.execute(text("SELECT 2"))
+        return "ok"
+
+    app.register_blueprint(extra)
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/two-queries')
+
+
+def test_item_views_stay_within_budget(app, login, post_item):
+    owner, _ = login('owner@example.com')
+    other, _ = login('other@example.com')
+    # The first post sets the search and geo indexes up if create_app did not
+    lost = post_item(owner, title="Blue wallet", location="Library")
+    found = post_item(other, title="Wallet found", type="found", location="Library")
+    post_item(owner, title="Keys", latitude="12.9716", longitude="77.5946")
+
+    for path in ('/api/items', '/api/items?limit=1', '/api/items?q=wallet', '/api/items?type=found',
+                 '/api/items?near=12.9716,77.5946&radius=5', '/api/items?fields=id,title',
+                 f"/api/items/{lost['id']}", f"/api/items/{lost['id']}/matches",
+                 f"/api/items/{found['id']}/similar", '/api/user/items', '/api/chats'):
+        assert owner.get(path).status_code == 200, path
+
+    assert owner.post(f"/api/items/{lost['id']}/status", json={"status": "resolved"}).status_code == 200
+    assert owner.delete(f"/api/items/{lost['id']}").status_code == 200
+
+
+def photo(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_posts_with_images_stay_within_budget(app, login, post_item):
+    owner, _ = login('owner@example.com')
+    # A new file, then the same bytes again (one stored file, two references)
+    first = post_item(owner, location="Library", image=(photo((200, 0, 0)), 'a.jpg'))
+    second = post_item(owner, location="Library", image=(photo((200, 0, 0)), 'b.jpg'))
+    assert first['image'] == second['image']
+    with app.app_context():
+        assert db.session.get(StoredFile, first['image'].split('static/uploads/', 1)[1]).refcount == 2
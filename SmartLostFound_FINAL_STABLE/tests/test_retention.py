@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from extensions import db
+from migrations import backfill_conversations, restart_backfilled_activity
+from models import ArchivedRecord, Conversation, Item, Message
+from retention import apply_retention, archived_messages, unpack
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(SOCKET_MESSAGE_RATE=0, ROOM_EMIT_RATE=0, RETENTION_BATCH=2,
+                    CLOSED_ITEM_RETENTION_DAYS=30, CONVERSATION_RETENTION_DAYS=365)
+
+
+@pytest.fixture
+def chats(app, login, post_item):
+    # Two items, each with a three-message conversation
+    seller, _ = login('seller@example.com')
+    buyer, buyer_id = login('buyer@example.com')
+    rooms = {}
+    for name in ('closed', 'open'):
+        item = post_item(seller, title=name)
+        room = f"item-{item['id']}-{buyer_id}"
+        socket = app.extensions['socketio'].test_client(app, flask_test_client=buyer)
+        socket.emit('join', {"room": room})
+        for n in range(3):
+            socket.emit('message', {"room": room, "user": "buyer", "sender_id": buyer_id,
+                                    "text": f"{name} {n}", "timestamp": "1"})
+        socket.disconnect()
+        rooms[name] = (item['id'], room)
+    return seller, rooms
+
+
+def age(model, days, **where):
+    # Backdates rows as if `days` had passed
+    column = {'Item': 'closed_at', 'Conversation': 'last_activity'}[model.__name__]
+    db.session.execute(update(model).filter_by(**where).values({column: datetime.utcnow() - timedelta(days=days)}))
+    db.session.commit()
+
+
+def test_recently_closed_and_open_items_stay(app, chats):
+    seller, rooms = chats
+    seller.post(f"/api/items/{rooms['closed'][0]}/status", json={"status": "resolved"})
+    with app.app_context():
+        assert apply_retention() == {'items': 0, 'conversations': 0, 'messages': 0, 'pages_freed': 0}
+        assert Item.query.count() == 2 and Message.query.count() == 6
+
+
+def test_closed_items_are_archived_with_their_chats(app, chats):
+    seller, rooms = chats
+    item_id, room = rooms['closed']
+    seller.post(f"/api/items/{item_id}/status", json={"status": "resolved"})
+    with app.app_context():
+        age(Item, 31, id=item_id)
+        result = apply_retention()
+        assert (result['items'], result['messages']) == (1, 3)
+
+        assert db.session.get(Item, item_id) is None
+        assert Conversation.query.filter_by(room=room).count() == 0
+        assert Message.query.filter_by(room=room).count() == 0
+        assert Message.query.filter_by(room=rooms['open'][1]).count() == 3
+        assert [m['text'] for m in archived_messages(room)] == ["closed 0", "closed 1", "closed 2"]
+        (item,) = unpack(ArchivedRecord.query.filter_by(kind='item', key=str(item_id)).one().payload)
+        assert item['title'] == 'closed' and item['status'] == 'resolved'
+    assert seller.get(f"/api/items/{item_id}").status_code == 404
+
+
+def test_reopened_items_are_kept(app, chats):
+    seller, rooms = chats
+    item_id = rooms['closed'][0]
+    seller.post(f"/api/items/{item_id}/status", json={"status": "claimed"})
+    with app.app_context():
+        age(Item, 31, id=item_id)
+    seller.post(f"/api/items/{item_id}/status", json={"status": "open"})
+    with app.app_context():
+        assert apply_retention()['items'] == 0
+
+
+def test_idle_conversations_are_archived_whole(app, chats):
+    seller, rooms = chats
+    item_id, room = rooms['open']
+    with app.app_context():
+        age(Conversation, 400, room=room)
+        result = apply_retention()
+        assert (result['conversations'], result['messages']) == (1, 3)
+        assert Conversation.query.filter_by(room=room).count() == 0
+        assert Message.query.filter_by(room=room).count() == 0
+        # Batches of RETENTION_BATCH messages, the last one with the conversation
+        assert [r.row_count for r in ArchivedRecord.query.filter_by(key=room).order_by(ArchivedRecord.id)] == [2, 1, 1]
+        assert len(archived_messages(room)) == 3
+        assert db.session.get(Item, item_id) is not None
+    assert room not in [c['room'] for c in seller.get('/api/chats').get_json()['chats']]
+
+
+def test_backfilled_conversations_are_not_archived_for_the_items_age(app, chats):
+    seller, rooms = chats
+    with app.app_context():
+        old = datetime.utcnow() - timedelta(days=400)
+        db.session.execute(update(Item).values(created_at=old))
+        # As migration 4 used to leave them: stamped with the item's date
+        db.session.execute(update(Conversation).values(last_activity=old))
+        db.session.commit()
+        restart_backfilled_activity(db)
+        assert apply_retention()['conversations'] == 0
+
+        # And as it leaves them now, built from the messages alone
+        db.session.execute(db.delete(Conversation))
+        db.session.commit()
+        backfill_conversations(db)
+        assert apply_retention()['conversations'] == 0
+    # Most recent message first, as before the backfill
+    assert [c['room'] for c in seller.get('/api/chats').get_json()['chats']] == [rooms['open'][1], rooms['closed'][1]]
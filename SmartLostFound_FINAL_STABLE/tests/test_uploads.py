@@ -0,0 +1,57 @@
+import os
+
+from PIL import Image
+
+from uploads import ORIENTATION, THUMBNAIL_SIZES, process_image
+
+GPS_INFO = 0x8825
+MAKE = 0x010f
+
+
+def camera_photo(folder, name, fmt='JPEG', orientation=6):
+    # 40x30 as stored, 30x40 once the camera orientation is applied
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[MAKE] = 'Camera'
+    exif[GPS_INFO] = {1: 'N', 2: (12.0, 58.0, 17.0)}
+    path = os.path.join(folder, name)
+    Image.new('RGB', (40, 30), 'red').save(path, fmt, exif=exif.tobytes())
+    return path
+
+
+def test_stored_original_loses_its_metadata(tmp_path):
+    path = camera_photo(tmp_path, 'photo.jpg')
+    meta = process_image(str(tmp_path), 'photo.jpg')
+    assert (meta['width'], meta['height']) == (30, 40)
+    with Image.open(path) as stored:
+        assert stored.format == 'JPEG'
+        assert dict(stored.getexif()) == {}
+        # The orientation was applied to the pixels before its tag went
+        assert stored.size == (30, 40)
+    for size in THUMBNAIL_SIZES:
+        with Image.open(tmp_path / meta['variants'][str(size)]) as variant:
+            assert dict(variant.getexif()) == {}
+
+
+def test_upright_original_keeps_its_pixels(tmp_path):
+    for fmt, name in (('JPEG', 'upright.jpg'), ('PNG', 'upright.png'), ('WEBP', 'upright.webp')):
+        path = camera_photo(tmp_path, name, fmt, orientation=1)
+        with Image.open(path) as before:
+            pixels = before.tobytes()
+        process_image(str(tmp_path), name)
+        with Image.open(path) as stored:
+            assert (stored.format, stored.size) == (fmt, (40, 30))
+            assert dict(stored.getexif()) == {}
+            if fmt == 'PNG':
+                assert stored.tobytes() == pixels
+
+
+def test_clean_original_is_not_rewritten(tmp_path):
+    path = camera_photo(tmp_path, 'photo.jpg')
+    process_image(str(tmp_path), 'photo.jpg')
+    with open(path, 'rb') as f:
+        stripped = f.read()
+    # An identical upload processed again (uploads are content-addressed)
+    process_image(str(tmp_path), 'photo.jpg')
+    with open(path, 'rb') as f:
+        assert f.read() == stripped
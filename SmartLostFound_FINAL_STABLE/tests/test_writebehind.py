@@ -0,0 +1,106 @@
+import pytest
+
+from chat import flush_messages
+from models import Message
+from writebehind import WriteBehindBuffer
+
+
+class Store:
+    # write_batch stand-in: rejects entries < 0 for good, fails whole
+    # batches while `down` is set
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def write(self, entries):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if any(entry < 0 for entry in entries):
+            raise ValueError("bad entry")
+        self.rows.extend(entries)
+
+
+def buffer(store):
+    return WriteBehindBuffer(store.write, interval=60, permanent=lambda exc: isinstance(exc, ValueError))
+
+
+def test_flush_writes_in_order():
+    store = Store()
+    writer = buffer(store)
+    for n in range(5):
+        writer.add(n)
+    writer.flush()
+    assert store.rows == [0, 1, 2, 3, 4]
+    writer.close()
+
+
+def test_bad_entry_is_dead_lettered_and_the_rest_written(caplog):
+    store = Store()
+    writer = buffer(store)
+    for entry in (1, -1, 2):
+        writer.add(entry)
+    writer.flush()
+    assert store.rows == [1, 2]
+    assert writer.dead_letters == 1
+    assert writer.pending == []
+    assert any(r.name == 'writebehind.dead_letter' for r in caplog.records)
+    writer.add(3)
+    writer.flush()
+    assert store.rows == [1, 2, 3]
+    writer.close()
+
+
+def test_transient_failure_keeps_the_batch():
+    store = Store()
+    writer = buffer(store)
+    writer.add(1)
+    writer.add(2)
+    store.down = True
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert writer.pending == [1, 2]
+    store.down = False
+    writer.flush()
+    assert store.rows == [1, 2]
+    assert writer.dead_letters == 0
+    writer.close()
+
+
+@pytest.fixture
+def chat(make_app):
+    app = make_app(MESSAGE_WRITE_BEHIND=True, MESSAGE_FLUSH_INTERVAL=60, SOCKET_MESSAGE_RATE=0)
+    http = app.test_client()
+    http.post('/api/register', json={"email": "s@x.com", "password": "password123", "username": "S"})
+    http.post('/api/login', json={"email": "s@x.com", "password": "password123"})
+    seller_id = http.get('/api/user/me').get_json()["user"]["id"]
+    item_id = http.post('/api/items', data={"title": "Hat", "description": "d", "location": "Gym",
+                                             "contact": "1"}).get_json()["item"]["id"]
+    socket = app.extensions['socketio'].test_client(app, flask_test_client=http)
+    room = f"item-{item_id}-{seller_id + 100}"
+    socket.emit('join', {"room": room})
+    socket.get_received()
+    yield app, http, socket, room, seller_id
+    socket.disconnect()
+
+
+def test_invalid_message_is_rejected_before_broadcast(chat):
+    app, http, socket, room, sender_id = chat
+    socket.emit('message', {"room": room, "user": "S", "sender_id": sender_id, "timestamp": "1"})
+    received = socket.get_received()
+    assert [e['name'] for e in received] == ['message_error']
+    assert app.extensions['lostfound'].message_writer.pending == []
+
+
+def test_bad_buffered_row_does_not_block_later_messages(chat):
+    app, http, socket, room, sender_id = chat
+    services = app.extensions['lostfound']
+    # A row the database refuses, as an unvalidated client could once queue
+    services.message_writer.add(({'id': services.message_ids.next(), 'room': room, 'sender_id': sender_id,
+                                  'user': 'S', 'text': None, 'timestamp': '1', 'status': 'sent'}, None, None))
+    socket.emit('message', {"room": room, "user": "S", "sender_id": sender_id, "text": "hello",
+                            "timestamp": "1"})
+    assert http.get('/api/chats').status_code == 200
+    with app.app_context():
+        flush_messages()
+        assert [m.text for m in Message.query.filter_by(room=room)] == ["hello"]
+    assert services.message_writer.dead_letters == 1
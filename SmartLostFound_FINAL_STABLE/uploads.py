@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from werkzeug.utils import secure_filename
+
+from passwords import native_runner
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge, in pixels, of each WebP variant generated for an upload
+THUMBNAIL_SIZES = (320, 800)
+WEBP_QUALITY = 80
+CHUNK_SIZE = 64 * 1024
+
+
+TEMP_PREFIX = '.upload-'
+TRASH_SUFFIX = '.trash'
+
+
+# Uploads are stored by content: <folder>/ab/cd/<sha256><ext>. Identical
+# uploads share one file; the database keeps a reference count per path.
+# Writing is split in two so the reference can be committed before the
+# file appears: stage_upload (temp file + hash), then place_upload.
+
+def stage_upload(file, folder):
+    # Stream the upload to a temp file in chunks while hashing it.
+    # Returns (temp_path, relative content path, sha256 hex digest, size).
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=TEMP_PREFIX)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard_staged(temp_path)
+        raise
+    hexdigest = digest.hexdigest()
+    return temp_path, content_path(hexdigest, file.filename), hexdigest, size
+
+
+def content_path(digest, original_filename):
+    ext = os.path.splitext(secure_filename(original_filename or ''))[1].lower()[:10]
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def place_upload(temp_path, folder, path):
+    # Move a staged upload into place; identical content already there wins
+    dest = os.path.join(folder, path)
+    if os.path.exists(dest):
+        discard_staged(temp_path)
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(temp_path, dest)
+    return True
+
+
+def discard_staged(temp_path):
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+def stored_paths(path):
+    # The original plus every generated variant of one stored upload
+    return [path] + [variant_name(path, size) for size in THUMBNAIL_SIZES]
+
+
+def trash_files(folder, path):
+    # First step of deleting an upload: rename it (and its variants) out of
+    # the way. Returns what was moved so it can be restored or purged.
+    moved = []
+    for name in stored_paths(path):
+        source = os.path.join(folder, name)
+        if os.path.exists(source):
+            os.replace(source, source + TRASH_SUFFIX)
+            moved.append(source)
+    return moved
+
+
+def restore_files(moved):
+    # A new reference arrived meanwhile. If an upload already put the file
+    # back, the trashed copy (same content) is simply dropped.
+    for source in moved:
+        if os.path.exists(source):
+            os.remove(source + TRASH_SUFFIX)
+        else:
+            os.replace(source + TRASH_SUFFIX, source)
+
+
+def purge_files(moved):
+    for source in moved:
+        os.remove(source + TRASH_SUFFIX)
+
+
+def remove_stale_temp_files(folder, max_age):
+    # Staged uploads whose request died before place_upload
+    cutoff = time.time() - max_age
+    removed = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.startswith(TEMP_PREFIX):
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+    return removed
+
+
+def variant_name(filename, size):
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}_{size}.webp"
+
+
+ORIENTATION = 0x0112
+
+
+def strip_metadata(path, original, image):
+    # Rewrites the stored original without its EXIF/XMP (GPS position,
+    # camera serial, ...). `image` is `original` with the camera orientation
+    # applied, which the file then no longer needs. Files without metadata,
+    # such as ones already rewritten, are left alone, so a lossy format is
+    # re-encoded at most once. Returns whether the file was rewritten.
+    info = original.info
+    if not (original.getexif() or 'xmp' in info or 'XML:com.adobe.xmp' in info):
+        return False
+    options = {'exif': b'', 'icc_profile': info.get('icc_profile')}
+    if getattr(original, 'is_animated', False):
+        # Every frame, as uploaded; orientation only applies to stills
+        source, options['save_all'] = original, True
+    elif original.getexif().get(ORIENTATION, 1) == 1:
+        source = original
+    else:
+        source = image
+    if original.format == 'JPEG':
+        # 'keep' reuses the upload's quantization tables, so no visible loss
+        options['quality'] = 'keep' if source is original else 95
+    elif original.format == 'WEBP':
+        options['quality'] = 95
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            source.save(out, original.format, **options)
+    except BaseException:
+        discard_staged(temp_path)
+        raise
+    os.replace(temp_path, path)
+    return True
+
+
+def process_image(folder, filename):
+    # Strips metadata from one stored upload and generates its WebP
+    # variants, which are re-encoded from pixel data only. Returns
+    # {'source', 'width', 'height', 'variants': {size: filename}, 'phash',
+    # 'dhash'} or None.
+    if Image is None:
+        return None
+    path = os.path.join(folder, filename)
+    with Image.open(path) as original:
+        # Apply the camera orientation before the EXIF that carries it is dropped
+        image = ImageOps.exif_transpose(original)
+        strip_metadata(path, original, image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        width, height = image.size
+        variants = {}
+        for size in THUMBNAIL_SIZES:
+            name = variant_name(filename, size)
+            # Content-addressed: identical uploads already have their variants
+            dest = os.path.join(folder, name)
+            if not os.path.exists(dest):
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=TEMP_PREFIX)
+                with os.fdopen(fd, 'wb') as out:
+                    variant.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+                os.replace(temp_path, dest)
+            variants[str(size)] = name
+        # Perceptual hashes for visual matching (see perceptual.py)
+        from perceptual import dhash, phash  # numpy, only needed once an image arrives
+        hashes = {'phash': phash(image), 'dhash': dhash(image)}
+    return dict({'source': filename, 'width': width, 'height': height, 'variants': variants}, **hashes)
+
+
+class ImagePipeline:
+    # Runs process_image off the request on a few native threads, then hands
+    # the result to `on_done(key, meta)` (e.g. to store it on the row),
+    # inside `context()` if given (e.g. app.app_context). Under eventlet or
+    # gevent a thread pool would be green and Pillow would stall the hub,
+    # so a background task from `spawn` waits on native threads instead
+    # (see passwords.native_runner).
+
+    def __init__(self, folder, max_workers=2, context=None, async_mode='threading', spawn=None):
+        self.folder = folder
+        self.context = context or nullcontext
+        self.max_workers = max_workers
+        self.async_mode = async_mode
+        self.spawn = spawn
+        self.executor = None
+        self._run_native = None
+        self._lock = threading.Lock()
+        if async_mode not in ('eventlet', 'gevent'):
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pipeline')
+
+    def submit(self, filename, on_done, key=None):
+        if self.executor is not None:
+            return self.executor.submit(self._run, filename, on_done, key)
+        return self.spawn(self._run, filename, on_done, key)
+
+    def _process(self, filename):
+        if self.executor is not None:
+            # Already on a pool thread
+            return process_image(self.folder, filename)
+        # Created on first use, after the server has monkey-patched
+        if self._run_native is None:
+            with self._lock:
+                if self._run_native is None:
+                    self._run_native = native_runner(self.async_mode, self.max_workers, 'image-pipeline')
+        return self._run_native(process_image, self.folder, filename)
+
+    def _run(self, filename, on_done, key):
+        try:
+            meta = self._process(filename)
+        except Exception:
+            logger.exception("Image processing failed for %s", filename)
+            return None
+        if meta is not None:
+            with self.context():
+                on_done(key, meta)
+        return meta
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
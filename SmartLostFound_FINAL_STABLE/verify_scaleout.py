@@ -0,0 +1,133 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+from werkzeug.serving import make_server
+
+# Two app workers in one process (two create_app() apps), each behind its
+# own HTTP server, sharing one database, the in-process message broker
+# (SOCKETIO_MESSAGE_QUEUE=local://) and the in-process presence store
+# (PRESENCE_URL=local). Real Socket.IO clients connect to different workers
+# and check that chat messages and read receipts are delivered across them.
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from app import create_app  # noqa: E402
+
+PORTS = {'worker_a': 5101, 'worker_b': 5102}
+TIMEOUT = 5
+
+
+def log(msg):
+    print(f"[TEST] {msg}")
+
+
+def start_server(worker, app):
+    server = make_server('127.0.0.1', PORTS[worker], app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ChatClient:
+    # Socket.IO client that records every event it receives
+
+    def __init__(self, port, http):
+        self.events = []
+        self.sio = socketio.Client()
+        self.sio.on('*', lambda event, data=None: self.events.append((event, data)))
+        cookies = '; '.join(f'{k}={v}' for k, v in http.cookies.items())
+        self.sio.connect(f'http://127.0.0.1:{port}', headers={'Cookie': cookies}, transports=['websocket'])
+
+    def emit(self, event, data):
+        self.sio.emit(event, data)
+
+    def wait_for(self, event):
+        deadline = time.time() + TIMEOUT
+        while time.time() < deadline:
+            for name, data in self.events:
+                if name == event:
+                    self.events.remove((name, data))
+                    return data
+            time.sleep(0.05)
+        raise AssertionError(f"'{event}' was not delivered across workers")
+
+
+def login(worker, email, username):
+    base = f'http://127.0.0.1:{PORTS[worker]}/api'
+    http = requests.Session()
+    http.post(f'{base}/register', json={"email": email, "password": "password123", "username": username})
+    res = http.post(f'{base}/login', json={"email": email, "password": "password123"})
+    if res.status_code != 200:
+        raise AssertionError(f"Login failed on {worker}: {res.status_code} {res.text}")
+    return http, res.json()["user"]["id"]
+
+
+def test_flow():
+    workdir = tempfile.mkdtemp(prefix='scaleout-')
+    os.chdir(workdir)
+    config = {
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'scaleout.db'),
+        'SOCKETIO_MESSAGE_QUEUE': 'local://',
+        'PRESENCE_URL': 'local',
+    }
+
+    log("Starting two workers...")
+    apps = {
+        'worker_a': create_app(dict(config, AUTO_MIGRATE=True)),
+        'worker_b': create_app(config),
+    }
+    servers = [start_server(worker, app) for worker, app in apps.items()]
+
+    seller_http, seller_id = login('worker_a', "seller@example.com", "Seller")
+    buyer_http, buyer_id = login('worker_b', "buyer@example.com", "Buyer")
+
+    res = seller_http.post(f'http://127.0.0.1:{PORTS["worker_a"]}/api/items', data={
+        "title": "Blue backpack",
+        "description": "Left in the library",
+        "location": "Library",
+        "contact": "123456"
+    })
+    item_id = res.json()["item"]["id"]
+    room = f"item-{item_id}-{buyer_id}"
+
+    seller = ChatClient(PORTS['worker_a'], seller_http)
+    buyer = ChatClient(PORTS['worker_b'], buyer_http)
+    seller.emit('join', {"room": room, "username": "Seller"})
+    buyer.emit('join', {"room": room, "username": "Buyer"})
+    seller.wait_for('history')
+    buyer.wait_for('history')
+
+    try:
+        log("Buyer on worker B sends a message...")
+        buyer.emit('message', {"room": room, "user": "Buyer", "sender_id": buyer_id,
+                               "text": "Is this mine?", "timestamp": "10:00"})
+        message = seller.wait_for('message')
+        if message["text"] != "Is this mine?":
+            raise AssertionError(f"Unexpected message: {message}")
+        if message["status"] != "delivered":
+            raise AssertionError(f"Seller is online on worker A, status was {message['status']}")
+        log("Seller on worker A received it as 'delivered'.")
+
+        log("Seller on worker A marks it read...")
+        seller.emit('mark_read', {"room": room})
+        receipt = buyer.wait_for('messages_read')
+        if receipt["read_up_to"] < message["id"]:
+            raise AssertionError(f"Unexpected receipt: {receipt}")
+        log("Buyer on worker B received the read receipt.")
+    finally:
+        seller.sio.disconnect()
+        buyer.sio.disconnect()
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        test_flow()
+        print("\nALL TESTS PASSED")
+    except Exception as e:
+        print(f"\nTEST FAILED: {e}")
+        sys.exit(1)
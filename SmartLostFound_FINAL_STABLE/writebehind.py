@@ -0,0 +1,123 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+# Entries that could not be written, one record each, for inspection or replay
+dead_letter_logger = logging.getLogger(__name__ + '.dead_letter')
+
+
+class IdBlockAllocator:
+    # Hands out ids from blocks reserved in the database, so a row can be
+    # numbered (and broadcast) before it is written. `reserve(count)` must
+    # atomically claim `count` ids and return the first one.
+
+    def __init__(self, reserve, block_size=1000):
+        self.reserve = reserve
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.end = 0
+
+    def next(self):
+        with self.lock:
+            if self.next_id >= self.end:
+                self.next_id = self.reserve(self.block_size)
+                self.end = self.next_id + self.block_size
+            value = self.next_id
+            self.next_id += 1
+            return value
+
+
+class WriteBehindBuffer:
+    # Collects entries and hands them to `write_batch(entries)` in groups:
+    # every `interval` seconds, or as soon as `max_batch` are waiting. One
+    # background thread does the writing; flush() writes everything queued
+    # so far from the calling thread, e.g. before a read that must see it.
+    # A batch that fails with an error `permanent(exc)` accepts (a bad row)
+    # is written again entry by entry, and entries that still fail go to the
+    # dead-letter log instead of blocking everything queued behind them. Any
+    # other failure (database unavailable) puts the batch back to be
+    # retried. close() writes what is left, so only a hard kill loses the
+    # last `interval` worth of entries.
+
+    RETRY_DELAY = 1.0
+
+    def __init__(self, write_batch, interval=0.01, max_batch=500, permanent=lambda exc: False):
+        self.write_batch = write_batch
+        self.interval = interval
+        self.max_batch = max_batch
+        self.permanent = permanent
+        self.dead_letters = 0
+        self.pending = []
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        # Held while a batch is being written, so flush() also waits for
+        # entries the background thread has already taken
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def add(self, entry):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("write-behind buffer is closed")
+            self.pending.append(entry)
+            if len(self.pending) in (1, self.max_batch):
+                self.ready.notify()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if batch:
+                self._write(batch)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.ready.notify()
+        self.thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.ready.wait()
+                # Let the group fill for one interval unless it already has
+                if not self.closed and len(self.pending) < self.max_batch:
+                    self.ready.wait(self.interval)
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Logged by _write and queued again; back off before retrying
+                with self.lock:
+                    if not self.closed:
+                        self.ready.wait(self.RETRY_DELAY)
+
+    def _write(self, batch):
+        try:
+            self.write_batch(batch)
+            return
+        except Exception as exc:
+            if not self.permanent(exc):
+                self._requeue(batch, "Write-behind batch of %d failed; will retry", len(batch))
+                raise
+            logger.warning("Write-behind batch of %d rejected (%s); writing entries one by one", len(batch), exc)
+        for n, entry in enumerate(batch):
+            try:
+                self.write_batch([entry])
+            except Exception as exc:
+                if not self.permanent(exc):
+                    self._requeue(batch[n:], "Write-behind entry failed; will retry %d entries", len(batch) - n)
+                    raise
+                self.dead_letters += 1
+                dead_letter_logger.error("Dropped write-behind entry %r: %s", entry, exc)
+
+    def _requeue(self, entries, message, *args):
+        logger.exception(message, *args)
+        with self.lock:
+            self.pending[:0] = entries
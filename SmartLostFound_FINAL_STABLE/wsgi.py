@@ -0,0 +1,10 @@
+from app import create_app
+
+# Server entry point, e.g.
+#   gunicorn -k eventlet -w 1 wsgi:app
+# Each worker process builds its own app on import. Run `flask --app app migrate`
+# before starting workers; they do not migrate the schema themselves. Each one
+# runs the upload GC and retention loops unless BACKGROUND_TASKS=0 (config.py).
+
+app = create_app()
+socketio = app.extensions['socketio']
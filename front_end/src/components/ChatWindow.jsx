@@ -3,40 +3,69 @@ import { io } from 'socket.io-client';
 import { useAuth } from '../context/AuthContext';
 import { X, Send, MessageCircle, Check, CheckCheck } from 'lucide-react';
 import { API_BASE_URL } from '../services/api';
-
-
-
-const getSocketUrl = () => {
-    const hostname = window.location.hostname;
-    return `http://${hostname}:5000`;
-};
-
-const SOCKET_URL = getSocketUrl();
+import { SOCKET_URL } from '../services/socket';
 
 const ChatWindow = ({ roomId, itemName, onClose }) => {
     const { user } = useAuth();
     const [messages, setMessages] = useState([]);
+    const [hasMore, setHasMore] = useState(false);
     const [newMessage, setNewMessage] = useState('');
     const socketRef = useRef(null);
     const messagesEndRef = useRef(null);
+    const lastIdRef = useRef(null);
 
     useEffect(() => {
+        lastIdRef.current = null;
 
         socketRef.current = io(SOCKET_URL, {
             withCredentials: true,
         });
 
-        socketRef.current.emit('join', {
-            username: user.username,
-            room: roomId
+        // (Re)join on every connect; after a reconnect only ask for what we missed
+        socketRef.current.on('connect', () => {
+            socketRef.current.emit('join', {
+                username: user.username,
+                room: roomId,
+                since_id: lastIdRef.current
+            });
         });
 
         socketRef.current.on('history', (history) => {
-            setMessages(history);
+            const { messages: page } = history;
+            if (page.length > 0) {
+                const newest = page[page.length - 1].id;
+                lastIdRef.current = history.reset ? newest : Math.max(lastIdRef.current ?? 0, newest);
+            }
+            if (history.reset) {
+                setMessages(page);
+                setHasMore(history.has_more);
+            } else {
+                // A message broadcast while we were rejoining may be in the page too
+                setMessages((prev) => {
+                    const seen = new Set(prev.map((m) => m.id));
+                    return [...prev, ...page.filter((m) => !seen.has(m.id))];
+                });
+            }
+        });
+
+        socketRef.current.on('history_page', (history) => {
+            setMessages((prev) => [...history.messages, ...prev]);
+            setHasMore(history.has_more);
         });
 
         socketRef.current.on('message', (message) => {
-            setMessages((prev) => [...prev, message]);
+            lastIdRef.current = Math.max(lastIdRef.current ?? 0, message.id);
+            setMessages((prev) => (prev.some((m) => m.id === message.id) ? prev : [...prev, message]));
+        });
+
+        // The server dropped this room's latest broadcasts under load; fetch
+        // everything after the last message we did get
+        socketRef.current.on('resync', () => {
+            socketRef.current.emit('join', {
+                username: user.username,
+                room: roomId,
+                since_id: lastIdRef.current
+            });
         });
         return () => {
             if (socketRef.current) {
@@ -45,9 +74,20 @@ const ChatWindow = ({ roomId, itemName, onClose }) => {
         };
     }, [roomId, user]);
 
+    const lastMessageId = messages.length > 0 ? messages[messages.length - 1].id : null;
+
+    // Only follow the bottom when new messages arrive, not when older ones are prepended
     useEffect(() => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-    }, [messages]);
+    }, [lastMessageId]);
+
+    const loadEarlier = () => {
+        if (messages.length === 0) return;
+        socketRef.current.emit('history_before', {
+            room: roomId,
+            before_id: messages[0].id
+        });
+    };
 
     const handleSendMessage = (e) => {
         e.preventDefault();
@@ -89,11 +129,21 @@ const ChatWindow = ({ roomId, itemName, onClose }) => {
                     </div>
                 ) : (
                     <div className="space-y-3">
-                        {messages.map((msg, index) => {
+                        {hasMore && (
+                            <div className="text-center">
+                                <button
+                                    onClick={loadEarlier}
+                                    className="text-xs text-brand hover:underline"
+                                >
+                                    Load earlier messages
+                                </button>
+                            </div>
+                        )}
+                        {messages.map((msg) => {
                             const isMe = msg.sender_id === user.id;
                             return (
                                 <div
-                                    key={index}
+                                    key={msg.id}
                                     className={`flex flex-col ${isMe ? 'items-end' : 'items-start'}`}
                                 >
                                     <div
@@ -47,7 +47,7 @@ const Navbar = () => {
                                        <Link to="/profile" className="text-gray-600 hover:text-brand transition-colors flex items-center gap-2">
                                     {user.profile_image ? (
                                         <img
-                                            src={`${API_BASE_URL.replace('/api', '')}/${user.profile_image}`}
+                                            src={`${API_BASE_URL.replace('/api', '')}/${user.profile_thumbnail || user.profile_image}`}
                                             alt="Profile"
                                             className="w-8 h-8 rounded-full object-cover border border-gray-200"
                                         />
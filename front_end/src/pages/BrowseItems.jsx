@@ -1,33 +1,89 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import Navbar from '../components/Navbar';
 import { Link } from 'react-router-dom';
 import { Search, Filter, MapPin, Calendar, Camera, AlertCircle } from 'lucide-react';
 import { itemService, API_BASE_URL } from '../services/api';
+import { subscribeToItems } from '../services/socket';
+
+const PAGE_SIZE = 24;
+const SEARCH_DEBOUNCE_MS = 300;
 
 const BrowseItems = () => {
     const [items, setItems] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
     const [filter, setFilter] = useState('all');
     const [searchTerm, setSearchTerm] = useState('');
     const [error, setError] = useState(null);
+    const [reloadKey, setReloadKey] = useState(0);
+    const searchingRef = useRef(false);
+    searchingRef.current = searchTerm.trim() !== '';
+
+    // Filtering and search happen on the server, one page at a time
+    const buildParams = (cursor) => {
+        const params = { limit: PAGE_SIZE };
+        if (filter !== 'all') params.type = filter;
+        if (searchTerm.trim()) params.q = searchTerm.trim();
+        if (cursor) params.cursor = cursor;
+        return params;
+    };
 
     useEffect(() => {
+        let cancelled = false;
         const fetchItems = async () => {
             try {
                 setLoading(true);
-                const response = await itemService.getAllItems();
+                const response = await itemService.getAllItems(buildParams());
+                if (cancelled) return;
                 setItems(response.data);
+                setNextCursor(response.nextCursor);
                 setError(null);
             } catch (err) {
+                if (cancelled) return;
                 console.error("Error fetching items:", err);
                 setError("Failed to load items. Please try again later.");
             } finally {
-                setLoading(false);
+                if (!cancelled) setLoading(false);
             }
         };
 
-        fetchItems();
-    }, []);
+        // Debounce typing so each keystroke doesn't hit the API
+        const timer = setTimeout(fetchItems, searchTerm ? SEARCH_DEBOUNCE_MS : 0);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [filter, searchTerm, reloadKey]);
+
+    // Live feed: new reports appear at the top and deleted ones disappear,
+    // without refetching the list. Ranked search results only lose deletions.
+    useEffect(() => {
+        return subscribeToItems(filter !== 'all' ? { type: filter } : {}, {
+            onCreated: (item) => {
+                if (searchingRef.current || (filter !== 'all' && item.type !== filter)) return;
+                setItems((prev) => (prev.some((i) => i.id === item.id) ? prev : [item, ...prev]));
+            },
+            onDeleted: (id) => setItems((prev) => prev.filter((i) => i.id !== id)),
+            // Deltas may have been missed while disconnected
+            onResync: () => setReloadKey((key) => key + 1),
+        });
+    }, [filter]);
+
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        try {
+            setLoadingMore(true);
+            const response = await itemService.getAllItems(buildParams(nextCursor));
+            setItems((prev) => [...prev, ...response.data]);
+            setNextCursor(response.nextCursor);
+        } catch (err) {
+            console.error("Error fetching items:", err);
+            setError("Failed to load more items. Please try again later.");
+        } finally {
+            setLoadingMore(false);
+        }
+    };
 
     const getImageUrl = (imagePath) => {
         if (!imagePath) return null;
@@ -37,13 +93,6 @@ const BrowseItems = () => {
         return `${baseUrl}/${imagePath}`;
     };
 
-    const filteredItems = items.filter(item => {
-        const matchesFilter = filter === 'all' || item.type === filter;
-        const matchesSearch = item.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            item.location.toLowerCase().includes(searchTerm.toLowerCase());
-        return matchesFilter && matchesSearch;
-    });
-
     return (
         <div className="min-h-screen bg-gray-50">
             <Navbar />
@@ -111,12 +160,12 @@ const BrowseItems = () => {
                     </div>
                 ) : (
                     <div className="grid gap-6 grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4">
-                        {filteredItems.map((item) => (
+                        {items.map((item) => (
                             <Link key={item.id} to={`/items/${item.id}`} className="group">
                                 <div className="bg-white rounded-lg shadow-sm overflow-hidden hover:shadow-md transition-shadow duration-300 h-full flex flex-col">
                                     <div className="h-48 w-full bg-gray-200 relative overflow-hidden">
                                         {item.image ? (
-                                            <img src={getImageUrl(item.image)} alt={item.title} className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300" />
+                                            <img src={getImageUrl(item.thumbnails?.['320'] || item.image)} alt={item.title} loading="lazy" className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300" />
                                         ) : (
                                             <div className="w-full h-full flex items-center justify-center bg-gray-100">
                                                 <Camera className="h-12 w-12 text-gray-300" />
@@ -145,6 +194,18 @@ const BrowseItems = () => {
                         ))}
                     </div>
                 )}
+
+                {!loading && nextCursor && (
+                    <div className="flex justify-center mt-8">
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="px-6 py-2 text-sm font-medium rounded-md bg-white shadow text-gray-900 hover:bg-gray-100 disabled:opacity-50 transition-colors"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
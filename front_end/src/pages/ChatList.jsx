@@ -78,9 +78,15 @@ const ChatList = () => {
                                                     </div>
                                                 </div>
                                                 <div className="flex flex-row sm:flex-col justify-between sm:items-end w-full sm:w-auto mt-2 sm:mt-0 pl-14 sm:pl-0">
-                                                    <p className="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-green-100 text-green-800">
-                                                        Active
-                                                    </p>
+                                                    {chat.unread > 0 ? (
+                                                        <p className="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-brand text-brand-foreground">
+                                                            {chat.unread} new
+                                                        </p>
+                                                    ) : (
+                                                        <p className="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-green-100 text-green-800">
+                                                            Active
+                                                        </p>
+                                                    )}
                                                     {chat.timestamp && (
                                                         <div className="flex items-center text-xs text-gray-500 sm:mt-2">
                                                             <Clock className="flex-shrink-0 mr-1.5 h-3 w-3 text-gray-400" />
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import Navbar from '../components/Navbar';
 import { useAuth } from '../context/AuthContext';
 import { itemService } from '../services/api';
+import { subscribeToItems } from '../services/socket';
 import { Link } from 'react-router-dom';
 import { PlusCircle, Clock, CheckCircle, AlertCircle, Trash2 } from 'lucide-react';
 
@@ -10,6 +11,7 @@ const Dashboard = () => {
     const [items, setItems] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
 
     useEffect(() => {
         const fetchItems = async () => {
@@ -17,6 +19,7 @@ const Dashboard = () => {
 
                 const response = await itemService.getUserItems();
                 setItems(response.data);
+                setNextCursor(response.nextCursor);
             } catch (err) {
                 console.error("Failed to fetch items", err);
                 setError("Could not connect to the server. Please check your connection.");
@@ -28,12 +31,31 @@ const Dashboard = () => {
         fetchItems();
     }, [user]);
 
+    // Reports posted or deleted from another tab or device show up live
+    useEffect(() => {
+        return subscribeToItems({ mine: true }, {
+            onCreated: (item) => setItems((prev) => (prev.some((i) => i.id === item.id) ? prev : [item, ...prev])),
+            onDeleted: (id) => setItems((prev) => prev.filter((i) => i.id !== id)),
+        });
+    }, [user]);
+
+    const loadMore = async () => {
+        try {
+            const response = await itemService.getUserItems({ cursor: nextCursor });
+            setItems((prev) => [...prev, ...response.data]);
+            setNextCursor(response.nextCursor);
+        } catch (err) {
+            console.error("Failed to fetch items", err);
+            setError("Could not connect to the server. Please check your connection.");
+        }
+    };
+
     const handleDelete = async (id) => {
         if (window.confirm("Are you sure you want to delete this report? This action cannot be undone.")) {
             try {
                 await itemService.deleteItem(id);
                 // Remove item from state
-                setItems(items.filter(item => item.id !== id));
+                setItems((prev) => prev.filter(item => item.id !== id));
             } catch (err) {
                 console.error("Failed to delete item", err);
                 alert("Failed to delete item. Please try again.");
@@ -134,6 +156,13 @@ const Dashboard = () => {
                                     </Link>
                                 </li>
                             ))}
+                            {nextCursor && (
+                                <li className="px-4 py-3 text-center">
+                                    <button onClick={loadMore} className="text-sm font-medium text-brand hover:text-brand-hover">
+                                        Load more
+                                    </button>
+                                </li>
+                            )}
                         </ul>
                     ) : (
                         <div className="p-8 text-center text-gray-500">
@@ -68,7 +68,7 @@ const ItemDetails = () => {
                 <div className="bg-white shadow overflow-hidden sm:rounded-lg">
                     <div className="relative h-64 sm:h-80 w-full bg-gray-200">
                         {item.image ? (
-                            <img src={getImageUrl(item.image)} alt={item.title} className="w-full h-full object-cover" />
+                            <img src={getImageUrl(item.thumbnails?.['800'] || item.image)} alt={item.title} className="w-full h-full object-cover" />
                         ) : (
                             <div className="w-full h-full flex items-center justify-center">
                                 <Camera className="h-16 w-16 text-gray-300" />
@@ -73,17 +73,17 @@ export const itemService = {
         try {
             const response = await api.get('/items', { params });
 
-            return { data: response.data.items };
+            return { data: response.data.items, nextCursor: response.data.next_cursor };
         } catch (error) {
             console.error("API Error:", error);
             throw error;
         }
     },
 
-    getUserItems: async () => {
+    getUserItems: async (params) => {
         try {
-            const response = await api.get('/user/items');
-            return { data: response.data.items };
+            const response = await api.get('/user/items', { params });
+            return { data: response.data.items, nextCursor: response.data.next_cursor };
         } catch (error) {
             console.error("API Error:", error);
             throw error;
@@ -0,0 +1,56 @@
+import { io } from 'socket.io-client';
+
+// Same host as the API, without the /api prefix
+const getSocketUrl = () => {
+    const hostname = window.location.hostname;
+    return `http://${hostname}:5000`;
+};
+
+export const SOCKET_URL = getSocketUrl();
+
+// One shared connection for the live item feed
+let feedSocket = null;
+
+const getFeedSocket = () => {
+    if (!feedSocket) {
+        feedSocket = io(SOCKET_URL, { withCredentials: true });
+    }
+    return feedSocket;
+};
+
+// Subscribe to item_created / item_deleted deltas.
+// filters: { type, location } or { mine: true } for the current user's items.
+// onResync is called after a reconnect, when deltas may have been missed.
+// Returns a function that unsubscribes.
+export const subscribeToItems = (filters, { onCreated, onDeleted, onResync }) => {
+    const socket = getFeedSocket();
+    let channel = null;
+    let active = true;
+    let connectedBefore = false;
+
+    const subscribe = () => {
+        // The server acknowledges with the channel it joined
+        socket.emit('subscribe_items', filters, (ack) => {
+            if (!ack) return;
+            channel = ack.channel;
+            if (!active) socket.emit('unsubscribe_items', { channel });
+        });
+        if (connectedBefore && onResync) onResync();
+        connectedBefore = true;
+    };
+    const handleCreated = (data) => onCreated && onCreated(data.item);
+    const handleDeleted = (data) => onDeleted && onDeleted(data.id);
+
+    socket.on('connect', subscribe);
+    socket.on('item_created', handleCreated);
+    socket.on('item_deleted', handleDeleted);
+    if (socket.connected) subscribe();
+
+    return () => {
+        active = false;
+        socket.off('connect', subscribe);
+        socket.off('item_created', handleCreated);
+        socket.off('item_deleted', handleDeleted);
+        if (channel) socket.emit('unsubscribe_items', { channel });
+    };
+};